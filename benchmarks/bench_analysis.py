@@ -0,0 +1,26 @@
+"""
+Benchmarks of the analysis of the architectures.
+"""
+import numpy as np
+
+from hydroroot import analysis
+
+from .common import SEGMENT_LENGTHS, SIZES, TIMEOUT, architecture, primary_length
+
+
+class Intercept(object):
+    params = [SIZES, SEGMENT_LENGTHS]
+    param_names = ['size', 'segment_length']
+    timeout = TIMEOUT
+    number = 1
+
+    def setup(self, size, segment_length):
+        self.g = architecture(size, segment_length, conductances=False)
+        # one distance every tenth of the primary root length
+        self.dists = np.linspace(0., primary_length(size, segment_length), 11)[1:].tolist()
+
+    def time_intercept(self, size, segment_length):
+        analysis.intercept(self.g, self.dists)
+
+    def peakmem_intercept(self, size, segment_length):
+        analysis.intercept(self.g, self.dists)
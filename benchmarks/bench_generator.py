@@ -0,0 +1,48 @@
+"""
+Benchmarks of the generation of the architectures and of their geometry.
+"""
+from hydroroot import radius
+from hydroroot.generator.markov import markov_arrays, markov_binary_tree
+
+from .common import SEGMENT_LENGTHS, SIZES, TIMEOUT, architecture, architecture_arrays, markov_parameters
+
+
+class MarkovBinaryTree(object):
+    params = [SIZES]
+    param_names = ['size']
+    timeout = TIMEOUT
+    number = 1
+
+    def time_markov_binary_tree(self, size):
+        markov_binary_tree(**markov_parameters(size))
+
+    def peakmem_markov_binary_tree(self, size):
+        markov_binary_tree(**markov_parameters(size))
+
+    def time_markov_arrays(self, size):
+        markov_arrays(**markov_parameters(size))
+
+    def peakmem_markov_arrays(self, size):
+        markov_arrays(**markov_parameters(size))
+
+
+class RelativePosition(object):
+    params = [SIZES, SEGMENT_LENGTHS]
+    param_names = ['size', 'segment_length']
+    timeout = TIMEOUT
+    number = 1
+
+    def setup(self, size, segment_length):
+        self.g = architecture(size, segment_length, conductances=False)
+        self.arrays = architecture_arrays(size, segment_length)
+        # the axis index is part of the computation
+        self.arrays.axis = None
+
+    def time_compute_relative_position(self, size, segment_length):
+        radius.compute_relative_position(self.g)
+
+    def peakmem_compute_relative_position(self, size, segment_length):
+        radius.compute_relative_position(self.g)
+
+    def time_relative_position(self, size, segment_length):
+        radius.relative_position(self.arrays)
@@ -0,0 +1,63 @@
+"""
+Benchmarks of the conductances and of the flux computations.
+"""
+from hydroroot import conductance, flux
+
+from .common import (JV, K0, PSI_BASE, PSI_E, SEGMENT_LENGTHS, SIZES, TIMEOUT, architecture, axial_law,
+                     primary_length)
+
+
+class Conductance(object):
+    params = [SIZES, SEGMENT_LENGTHS]
+    param_names = ['size', 'segment_length']
+    timeout = TIMEOUT
+    number = 1
+
+    def setup(self, size, segment_length):
+        self.g = architecture(size, segment_length, conductances=False)
+        self.law = axial_law()
+        conductance.fit_property_from_spline(self.g, self.law, 'position', 'K_exp')
+
+    def time_fit_property_from_spline(self, size, segment_length):
+        conductance.fit_property_from_spline(self.g, self.law, 'position', 'K_exp')
+
+    def time_compute_K(self, size, segment_length):
+        conductance.compute_K(self.g)
+
+    def time_compute_k(self, size, segment_length):
+        conductance.compute_k(self.g, K0)
+
+
+class Flux(object):
+    params = [SIZES, SEGMENT_LENGTHS, [False, True], [True, False]]
+    param_names = ['size', 'segment_length', 'vectorized', 'invert_model']
+    timeout = TIMEOUT
+    number = 1
+
+    def setup(self, size, segment_length, vectorized, invert_model):
+        self.g = architecture(size, segment_length)
+
+    def time_flux(self, size, segment_length, vectorized, invert_model):
+        flux.flux(self.g, JV, PSI_E, PSI_BASE, invert_model=invert_model, vectorized=vectorized)
+
+    def peakmem_flux(self, size, segment_length, vectorized, invert_model):
+        flux.flux(self.g, JV, PSI_E, PSI_BASE, invert_model=invert_model, vectorized=vectorized)
+
+
+class CutAndSetConductance(object):
+    params = [SIZES, SEGMENT_LENGTHS]
+    param_names = ['size', 'segment_length']
+    timeout = TIMEOUT
+    number = 1
+
+    def setup(self, size, segment_length):
+        self.g = architecture(size, segment_length)
+        # cut in the middle of the primary root, between two vertices: cut_and_set_conductance fails when both a
+        # vertex and its parent end at the cut length
+        self.cut_length = 0.5 * primary_length(size, segment_length) + 0.5 * segment_length
+
+    def time_cut_and_set_conductance(self, size, segment_length):
+        flux.cut_and_set_conductance(self.g, self.cut_length, threshold=segment_length)
+
+    def peakmem_cut_and_set_conductance(self, size, segment_length):
+        flux.cut_and_set_conductance(self.g, self.cut_length, threshold=segment_length)
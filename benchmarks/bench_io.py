@@ -0,0 +1,61 @@
+"""
+Benchmarks of the reading and writing of the architecture files: aquaporin format and RSML.
+"""
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from hydroroot import hydro_io
+from hydroroot.generator.measured_root import mtg_from_aqua_data
+
+from .common import SEGMENT_LENGTHS, SIZES, TIMEOUT, architecture, architecture_arrays, continuous_architecture
+
+
+class AquaFile(object):
+    params = [SIZES, SEGMENT_LENGTHS]
+    param_names = ['size', 'segment_length']
+    timeout = TIMEOUT
+    number = 1
+
+    def setup(self, size, segment_length):
+        self.g = architecture(size, segment_length, conductances=False)
+        f = StringIO()
+        hydro_io.export_mtg_to_aqua_file(self.g, f, segment_length)
+        f.seek(0)
+        self.df = hydro_io.read_aqua_file(f)
+
+    def time_export_mtg_to_aqua_file(self, size, segment_length):
+        hydro_io.export_mtg_to_aqua_file(self.g, StringIO(), segment_length)
+
+    def time_mtg_from_aqua_data(self, size, segment_length):
+        mtg_from_aqua_data(self.df, segment_length)
+
+    def peakmem_mtg_from_aqua_data(self, size, segment_length):
+        mtg_from_aqua_data(self.df, segment_length)
+
+
+class RSML(object):
+    params = [SIZES, SEGMENT_LENGTHS]
+    param_names = ['size', 'segment_length']
+    timeout = TIMEOUT
+    number = 1
+
+    def setup(self, size, segment_length):
+        arrays = architecture_arrays(size, segment_length)
+        self.g = arrays.to_mtg()
+        # one polyline unit per vertex
+        self.g_c = continuous_architecture(arrays)
+        self.directory = tempfile.mkdtemp()
+
+    def teardown(self, size, segment_length):
+        shutil.rmtree(self.directory)
+
+    def time_import_rsml_to_discrete_mtg(self, size, segment_length):
+        hydro_io.import_rsml_to_discrete_mtg(self.g_c, segment_length, resolution=segment_length)
+
+    def peakmem_import_rsml_to_discrete_mtg(self, size, segment_length):
+        hydro_io.import_rsml_to_discrete_mtg(self.g_c, segment_length, resolution=segment_length)
+
+    def time_export_mtg_to_rsml(self, size, segment_length):
+        hydro_io.export_mtg_to_rsml(self.g, os.path.join(self.directory, 'out.rsml'), segment_length)
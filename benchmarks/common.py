@@ -0,0 +1,110 @@
+"""
+Architectures and parameters shared by the benchmarks.
+
+The architectures are generated by markov_arrays without length law, so that their number of vertices only
+depends on the length of the primary root: a lateral is as long as the rest of its bearing axis.
+The `size` parameter of the benchmarks is the approximate number of vertices, the `segment_length` parameter
+is the length of the vertices in m.
+"""
+import numpy as np
+
+from openalea.mtg import MTG
+
+from hydroroot import conductance, radius
+from hydroroot.generator.markov import markov_arrays
+from hydroroot.length import fit_law
+
+SIZES = [1000, 10000, 100000, 1000000]
+SEGMENT_LENGTHS = [1e-4, 1e-3]
+
+BRANCHING_DELAY = 20
+SEED = 2
+
+# test/parameters_test_yaml.yml
+AXIAL_CONDUCTANCE_DATA = ([0, 1.5e-2, 4.0e-2, 6.0e-2, 7.65e-2, 9.65e-2, 11.75e-2, 14.85e-2, 19.75e-2],
+                          [2.90E-05, 1.24E-04, 1.77E-03, 2.18E-03, 1.83E-03, 3.05E-03, 4.19E-03, 3.45E-03,
+                           2.60E-03])
+K0 = 92.0
+JV = 0.1
+PSI_E = 0.4
+PSI_BASE = 0.101325
+
+# maximum time of a benchmark in s, the MTG traversals of the largest architectures take minutes
+TIMEOUT = 1800
+
+
+def primary_vertices(size, delay=BRANCHING_DELAY):
+    """ Number of vertices of the primary root of an architecture of about `size` vertices.
+
+    With a lateral every `delay` vertices, as long as the rest of the primary root, a primary root of
+    n vertices bears about n**2 / (2 delay) vertices.
+    """
+    return int(delay * (np.sqrt(1. + 2. * size / delay) - 1.))
+
+
+def primary_length(size, segment_length):
+    """ Length of the primary root (in m) of the architecture of about `size` vertices."""
+    return primary_vertices(size) * segment_length
+
+
+def markov_parameters(size):
+    """ Parameters of markov_binary_tree and markov_arrays for an architecture of about `size` vertices."""
+    return dict(nb_vertices=primary_vertices(size), branching_variability=0.1, branching_delay=BRANCHING_DELAY,
+                nude_tip_length=0, order_max=1, seed=SEED)
+
+
+def axial_law():
+    return fit_law(*AXIAL_CONDUCTANCE_DATA)
+
+
+def architecture_arrays(size, segment_length=1e-4):
+    """ RootArrays of about `size` vertices with length, radius, position and relative_position."""
+    arrays = markov_arrays(**markov_parameters(size))
+    arrays.length = np.full(len(arrays), float(segment_length))
+    radius.ordered_radius_arrays(arrays, ref_radius=1e-4, order_decrease_factor=0.7)
+    return radius.relative_position(arrays)
+
+
+def architecture(size, segment_length=1e-4, conductances=True):
+    """ MTG of architecture_arrays(size, segment_length), with the K and k properties if `conductances`."""
+    g = architecture_arrays(size, segment_length).to_mtg()
+    if conductances:
+        g = conductance.fit_property_from_spline(g, axial_law(), 'position', 'K_exp')
+        g = conductance.compute_K(g)
+        g = conductance.compute_k(g, K0)
+    return g
+
+
+def continuous_architecture(arrays):
+    """ Continuous MTG, as read by rsml.rsml2mtg, of the axes of `arrays`, one polyline unit per vertex.
+
+    The plant is at scale 1 and the axes at scale 2, with their polyline in the `geometry` property.
+    The primary root goes down, the laterals are horizontal, on each side in turn.
+    """
+    arrays.compute_axes()
+    nb_axes = len(arrays.axis_ptr) - 1
+
+    direction = np.zeros((nb_axes, 2))
+    direction[0] = (0., -1.)
+    direction[1:, 0] = np.where(np.arange(1, nb_axes) % 2, 1., -1.)
+    position = np.zeros((len(arrays), 2))
+    for lo, hi in arrays.levels(start=1):
+        position[lo:hi] = position[arrays.parent[lo:hi]] + direction[arrays.axis[lo:hi]]
+
+    g = MTG()
+    plant = g.add_component(g.root, label='P')
+    axes = []
+    geometry = {}
+    for a in range(nb_axes):
+        vertices = arrays.axis_of(a)
+        if a == 0:
+            vid = g.add_component(plant, label='A')
+        else:
+            # the polyline of a lateral starts at its branching point
+            branch = arrays.parent[vertices[0]]
+            vid = g.add_child(axes[arrays.axis[branch]], edge_type='+', label='A')
+            vertices = np.concatenate(([branch], vertices))
+        axes.append(vid)
+        geometry[vid] = position[vertices].tolist()
+    g.properties()['geometry'] = geometry
+    return g
@@ -9,14 +9,13 @@
 import glob
 import rsml
 import argparse
-import sys
 
 from openalea.mtg import traversal
 
 from hydroroot import radius
 from hydroroot.main import hydroroot_flow
 from hydroroot.init_parameter import Parameters  # import work in progress for reading init file
-from hydroroot.hydro_io import export_mtg_to_rsml, import_rsml_to_discrete_mtg
+from hydroroot.hydro_io import export_mtg_to_rsml, import_rsml_to_discrete_mtg, rsml_resolution
 
 from shared_functions import radial, axial
 
@@ -110,26 +109,13 @@ if __name__ == '__main__':
     axfold = parameter.output['axfold'][0]
     radfold = parameter.output['radfold'][0]
 
-    rsml_units_to_metre = {}
-    rsml_units_to_metre['m'] = 1.0
-    rsml_units_to_metre['cm'] = 1.0e-2
-    rsml_units_to_metre['mm'] = 1.0e-3
-    rsml_units_to_metre['um'] = 1.0e-6
-    rsml_units_to_metre['nm'] = 1.0e-9
-
     filename = []
     for f in parameter.archi['input_file']:
         filename = filename + (glob.glob(parameter.archi['input_dir'] + f))
 
     # import rsml into continuous mtg representation
     g_c = rsml.rsml2mtg(filename[0])
-    resolution = g_c.graph_properties()['metadata']['resolution']
-    unit = g_c.graph_properties()['metadata']['unit']
-
-    if unit not in list(rsml_units_to_metre.keys()):
-        sys.exit('wrong unit in rsml file, unit must be one of the following: m, cm, mm, um, nm.')
-
-    resolution *= rsml_units_to_metre[unit] # rsml file unit to meter
+    resolution = rsml_resolution(g_c) # rsml file unit to meter
 
     # continuous mtg to discrete mtg
     g = import_rsml_to_discrete_mtg(g_c, segment_length = parameter.archi['segment_length'], resolution = resolution)
@@ -147,9 +133,7 @@ if __name__ == '__main__':
 
     # redo the import from rsml to discrete MTG from the exported one
     g_c = rsml.rsml2mtg("example_rsml_export.rsml")
-    resolution = g_c.graph_properties()['metadata']['resolution']
-    unit = g_c.graph_properties()['metadata']['unit']
-    resolution *= rsml_units_to_metre[unit] # rsml file unit to meter
+    resolution = rsml_resolution(g_c) # rsml file unit to meter
     g2 = import_rsml_to_discrete_mtg(g_c, segment_length = parameter.archi['segment_length'], resolution = resolution)
     g2, primary_length2, _length2, surface2 = root_creation(g2)
     g2, Keq2, Jv2 = hydro_calculation(g2, axfold = axfold, radfold = radfold)
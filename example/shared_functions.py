@@ -24,28 +24,10 @@ from hydroroot import radius, markov
 from hydroroot.law import histo_relative_law
 from hydroroot.generator.measured_root import mtg_from_aqua_data
 from hydroroot.display import plot as mtg_scene
+from hydroroot.hydro_io import read_aqua_file
 
-# read architecture file
-def read_archi_data(fn):
-    """
-    Read a csv (tab separated) file with the architecture in the following format
-        |'distance_from_base_(mm)' | 'lateral_root_length_(mm)' | order |
-        |float | float | string|
-        order = 1 for laterals of 1st order ob the primary
-        order = n-m for the lateral number m on the lateral number n of 1st order
-        order = n-m-o for the lateral number o of the previous one
-        etc.
-        Each branch finish with a nude part, i.e. a distance from base (the tip value) and a zero length
-
-    :param fn: string - the architecture filename in csv format
-
-    :return: DataFrame
-    """
-    df = pd.read_csv(fn, sep = '\t', dtype = {'order': str})
-    df['db'] = df['distance_from_base_(mm)'] * 1.e-3
-    df['lr'] = df['lateral_root_length_(mm)'] * 1.e-3
-
-    return df
+# read architecture file, see hydro_io.read_aqua_file for the format
+read_archi_data = read_aqua_file
 
 #################################################################################
 # MTG construction either from data reconstructed() or generated from parameters
@@ -2,6 +2,7 @@
 
 Define a set of methods to ease the analysis and simulation.
 """
+import numpy as np
 import pandas
 # from hydroroot.main import hydroroot
 from openalea.mtg.traversal import pre_order2
@@ -40,7 +41,7 @@ def nb_roots(g, l, root=1, dl=1e-4, max_order=None):
     count = 0
     for v in g:
 
-        if order and order.get(v) >= max_order:
+        if order and order.get(v, 0) >= max_order:
             continue
 
         pid = g.parent(v)
@@ -49,13 +50,99 @@ def nb_roots(g, l, root=1, dl=1e-4, max_order=None):
     return count
 
 
-def intercept(g, dists, max_order=None):
-    """Compute intercepts at a given length from collet."""
+def intercept(g, dists, max_order=None, index=None):
+    """Compute intercepts at a given length from collet.
 
-    intercepts = [nb_roots(g, x, max_order=max_order) for x in dists]
+    Same result as nb_roots for each distance, using an InterceptIndex built once for all the distances.
+    An index already built for `g` may be given.
+    """
+    if index is None:
+        index = InterceptIndex.from_mtg(g)
+
+    intercepts = index.count(dists, max_order=max_order).tolist()
     return intercepts
 
 
+class InterceptIndex(object):
+    """ Index of the segments of an architecture by their distance from the base.
+
+    The vertex v, of parent p, is intercepted at the distance l from the base if
+    distance[p] <= l <= distance[v] (see nb_roots and hydroroot.flux.segments_at_length).
+    The intervals ends are sorted once, then the number of intercepted segments is found by binary search,
+    and the list of the intercepted segments in O(log n + k) when the distance is the same for all
+    the vertices of a same depth (the default).
+
+    :Parameters:
+        - `arrays` (RootArrays) - the architecture
+        - `dl` (float) - the distance of a vertex is (depth + 1) * dl, accumulated as in nb_roots
+        - `distance` (array) - the distance from the base of each vertex, used instead of dl if given
+
+    :Example::
+
+        index = InterceptIndex(arrays)
+        counts = index.count([0.01, 0.02, 0.03], max_order=2)
+        vids = index.segments(0.04)
+    """
+
+    def __init__(self, arrays, dl=1e-4, distance=None):
+        self.arrays = arrays
+        if distance is None:
+            level_distance = np.cumsum(np.full(len(arrays.level_ptr) - 1, dl))
+            distance = np.repeat(level_distance, np.diff(arrays.level_ptr))
+        self.distance = np.asarray(distance, dtype=float)
+
+        # one interval per vertex, except the base
+        start = self.distance[arrays.parent[1:]]
+        end = self.distance[1:]
+        self.by_start = np.argsort(start, kind='stable') + 1
+        self.start = start[self.by_start - 1]
+        # end sorted in the order of start: the intercepted segments are contiguous in by_start
+        self.end_by_start = end[self.by_start - 1]
+        self.monotone = bool((np.diff(self.end_by_start) >= 0).all())
+
+        self._sorted = {}
+
+    @classmethod
+    def from_mtg(cls, g, dl=1e-4):
+        """ Build the index of the MTG `g`, using its property mylength if any, as nb_roots does."""
+        from hydroroot.root_arrays import RootArrays
+
+        arrays = RootArrays.from_mtg(g, properties=())
+        distance = None
+        if 'mylength' in g.property_names():
+            distance = arrays.as_array(g.property('mylength'))
+        return cls(arrays, dl=dl, distance=distance)
+
+    def sorted_ends(self, max_order=None):
+        """ Return the sorted starts and ends of the intervals of the vertices of order < max_order."""
+        if max_order not in self._sorted:
+            start, end = self.start, self.end_by_start
+            if max_order is not None:
+                kept = self.arrays.order[self.by_start] < max_order
+                start, end = start[kept], end[kept]
+            self._sorted[max_order] = start, np.sort(end)
+        return self._sorted[max_order]
+
+    def count(self, dists, max_order=None):
+        """ Number of segments intercepted at each distance of `dists`, only the orders < max_order if given."""
+        start, end = self.sorted_ends(max_order)
+        dists = np.asarray(dists, dtype=float)
+        # the intervals started before l minus the ones ended before l
+        return np.searchsorted(start, dists, side='right') - np.searchsorted(end, dists, side='left')
+
+    def segments(self, l, max_order=None):
+        """ Return the vertex ids of the segments intercepted at the distance `l`."""
+        hi = np.searchsorted(self.start, l, side='right')
+        if self.monotone:
+            lo = np.searchsorted(self.end_by_start[:hi], l, side='left')
+            index = self.by_start[lo:hi]
+        else:
+            index = self.by_start[:hi][self.end_by_start[:hi] >= l]
+        if max_order is not None:
+            index = index[self.arrays.order[index] < max_order]
+        return self.arrays.vids[index].tolist()
+
+
 def read_data(data):
     """Merge data and return a Dataframe."""
     names = ('relative_position', 'internode_length', 'LR_length', 'distance_to_tip')
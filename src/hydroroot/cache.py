@@ -0,0 +1,186 @@
+"""
+Persistent cache of generated root architectures.
+
+A generated architecture only depends on the inputs of the generator (seed, lengths, length laws, ...).
+The cache stores the compiled RootArrays on disk as compressed NPZ files, named by a hash of these inputs,
+so that a repeated simulation skips the generation and the geometrical computations.
+The number of files is bounded, the least recently used ones are removed first.
+
+Example::
+
+    cache = ArchitectureCache('~/.hydroroot/cache', max_entries=500)
+    key = cache.key(seed=seed, primary_length=0.13, length_data=parameter.archi['length_data'])
+    arrays = cache.get_or_create(key, lambda: RootArrays.from_mtg(generate(...)))
+    print(cache.hits, cache.misses)
+"""
+import glob
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from hydroroot.root_arrays import RootArrays
+
+VERSION = 1
+
+
+class ArchitectureCache(object):
+    """ Directory of RootArrays stored as compressed NPZ files, indexed by a hash of the generator inputs.
+
+    :Attributes:
+        - `directory` (str) - where the files are stored, created if needed
+        - `max_entries` (int) - maximum number of files, None for no limit
+        - `hits`, `misses` (int) - number of successful and failed `get`
+    """
+
+    def __init__(self, directory, max_entries=1000):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(**inputs):
+        """ Return the hash of the generator inputs.
+
+        The values may be numbers, strings, None, arrays, pandas DataFrame or list of them.
+        Two calls give the same key if and only if the inputs have the same names and values.
+        """
+        h = hashlib.sha1(('hydroroot-%d' % VERSION).encode())
+        for name in sorted(inputs):
+            h.update(name.encode())
+            _update_hash(h, inputs[name])
+        return h.hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def __contains__(self, key):
+        return os.path.exists(self.filename(key))
+
+    def __len__(self):
+        return len(self._entries())
+
+    def get(self, key):
+        """ Return the RootArrays stored with `key`, None if it is not in the cache."""
+        fn = self.filename(key)
+        try:
+            with np.load(fn) as data:
+                arrays = _from_npz(data)
+        except (IOError, OSError, KeyError, ValueError):
+            # missing file or one removed by another process while reading
+            self.misses += 1
+            return None
+
+        # the modification time is the time of the last use
+        _touch(fn)
+        self.hits += 1
+        return arrays
+
+    def put(self, key, arrays):
+        """ Store `arrays` (RootArrays) with `key`, then remove the least recently used files if needed."""
+        fd, tmp = tempfile.mkstemp(suffix='.npz', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **_to_npz(arrays))
+            # atomic, so that concurrent processes never read a partial file
+            os.replace(tmp, self.filename(key))
+            _touch(self.filename(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def get_or_create(self, key, create):
+        """ Return the RootArrays stored with `key`, or build it by calling `create()` and store it."""
+        arrays = self.get(key)
+        if arrays is None:
+            arrays = create()
+            self.put(key, arrays)
+        return arrays
+
+    def evict(self):
+        """ Remove the least recently used files beyond `max_entries`."""
+        if self.max_entries is None:
+            return
+        entries = self._entries()
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=_mtime)
+        for fn in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+
+    def clear(self):
+        """ Remove all the files of the cache and reset the counters."""
+        for fn in self._entries():
+            os.remove(fn)
+        self.hits = self.misses = 0
+
+    def _entries(self):
+        return [fn for fn in glob.glob(os.path.join(self.directory, '*.npz'))
+                if not os.path.basename(fn).startswith('tmp')]
+
+
+def _update_hash(h, value):
+    if hasattr(value, 'to_numpy'):
+        # pandas objects
+        _update_hash(h, list(getattr(value, 'columns', [])))
+        value = value.to_numpy()
+    if isinstance(value, np.ndarray) and value.dtype == object:
+        value = value.tolist()
+    if isinstance(value, np.ndarray):
+        h.update(('array%s%s' % (value.dtype.str, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        h.update(('list%d' % len(value)).encode())
+        for v in value:
+            _update_hash(h, v)
+    elif isinstance(value, dict):
+        h.update(('dict%d' % len(value)).encode())
+        for k in sorted(value):
+            _update_hash(h, k)
+            _update_hash(h, value[k])
+    else:
+        h.update(('%s:%r' % (type(value).__name__, value)).encode())
+
+
+def _to_npz(arrays):
+    data = dict(version=VERSION, parent=arrays.parent, edge_type=arrays.edge_type, vids=arrays.vids,
+                order=arrays.order)
+    for name in arrays.PROPERTIES:
+        if arrays.get(name) is not None:
+            data['property_' + name] = arrays.get(name)
+    for name, values in arrays.properties.items():
+        data['property_' + name] = values
+    return data
+
+
+def _from_npz(data):
+    if int(data['version']) != VERSION:
+        raise ValueError('Cache file version %d, expected %d' % (int(data['version']), VERSION))
+    properties = dict((name[len('property_'):], data[name]) for name in data.files if name.startswith('property_'))
+    return RootArrays(data['parent'], edge_type=data['edge_type'], vids=data['vids'], order=data['order'],
+                      **properties)
+
+
+def _touch(fn):
+    # explicit time, the one set by the file system may be too coarse to order the accesses
+    now = time.time()
+    try:
+        os.utime(fn, (now, now))
+    except OSError:
+        pass
+
+
+def _mtime(fn):
+    try:
+        return os.stat(fn).st_mtime
+    except OSError:
+        return 0
@@ -0,0 +1,178 @@
+"""
+Compression of the unbranched chains of vertices into super-elements.
+
+A chain is a maximal sequence of vertices with one child each, but the last one: it starts at the base or at a
+child of a branching vertex, and ends at a tip or at a branching vertex. Along a chain the hydraulic network is a
+ladder of resistances: with the potentials u = psi - psi_e relative to the outside, the state (u, J) at the top
+of a vertex (its psi_out and J_out) is obtained from the state at its bottom (its psi_in and the flux of its
+children) by the transfer matrix
+    T = [[1 + k / K, -1 / K], [-k, 1]]
+The product of the matrices of a chain is the exact super-element of the chain, whatever the variations of K
+and k along it. The flux is solved on the tree of the chains, with as many levels as branching points between
+the base and the tips, then expanded back to the vertices with the partial products of the chains.
+
+The transfer matrices have the sign pattern [[+, -], [-, +]] which is kept by their products, so the formulas
+below are sums of positive terms: the products are normalized and their scale is kept as a logarithm.
+
+Example::
+
+    solver = CompressedFlux(arrays, K, k)
+    solver.solve(0.4, 0.101325)
+    print(solver.Jv, len(solver.chains))
+    solver.expand()
+    solver.update_mtg(g)
+"""
+import numpy as np
+
+from hydroroot.root_arrays import RootArrays
+
+
+class CompressedFlux(object):
+    """Compute the water potential and fluxes on the tree of the chains of vertices.
+
+    Same model and results as :class:`flux.ArrayFlux` with a uniform psi_e and invert_model, but the sweeps
+    are done on the chains: one level per branching point instead of one level per vertex.
+
+    :Attributes:
+        - `chains` (RootArrays) - the tree of the chains, the vids are the index of the top vertex of each chain
+        - `chain` (array) - the index of the chain of each vertex
+        - `Keq_chain` (array) - the equivalent conductance of each chain with its subtree
+        - `Jv` (float) - the output flux at the base
+    """
+
+    def __init__(self, arrays, K, k):
+        """
+        :Parameters:
+            - `arrays` (RootArrays) - the root architecture
+            - `K` (dict or array) - axial conductance, arrays are in the order of `arrays.vids`
+            - `k` (dict or array) - lateral conductance, arrays are in the order of `arrays.vids`
+        """
+        self.arrays = arrays
+        self.K = arrays.as_array(K)
+        self.k = arrays.as_array(k)
+        n = len(arrays)
+        parent = arrays.parent
+        child_ptr = arrays.child_ptr
+        single = np.diff(child_ptr) == 1
+        self._below = np.where(single, np.minimum(child_ptr[:-1], n - 1), -1)
+
+        # chains: a new one at the base and at each child of a branching vertex
+        top = np.ones(n, dtype=bool)
+        top[1:] = ~single[parent[1:]]
+        tops = np.flatnonzero(top)
+        chain = np.empty(n, dtype=int)
+        chain[tops] = np.arange(len(tops))
+        for lo, hi in arrays.levels(start=1):
+            inner = ~top[lo:hi]
+            chain[lo:hi][inner] = chain[parent[lo:hi][inner]]
+        chain_parent = np.full(len(tops), -1)
+        chain_parent[1:] = chain[parent[tops[1:]]]
+
+        # breadth first order of the chains
+        self.chains = RootArrays.from_parent(chain_parent, vids=tops)
+        rank = np.empty(len(tops), dtype=int)
+        rank[chain[self.chains.vids]] = np.arange(len(tops))
+        self.chain = rank[chain]
+        self.top = self.chains.vids
+
+        # partial products from the bottom of the chains, P[v] = T[v] P[below], normalized by exp(scale[v])
+        K, k = self.K, self.k
+        P = np.empty((n, 4))
+        scale = np.zeros(n)
+        below = self._below
+        for lo, hi in arrays.levels(reverse=True):
+            b = below[lo:hi]
+            inner = b >= 0
+            Pb = np.where(inner[:, np.newaxis], P[np.maximum(b, 0)], [1., 0., 0., 1.])
+            a = (1. + k[lo:hi] / K[lo:hi]) * Pb[:, 0] - Pb[:, 2] / K[lo:hi]
+            c = -k[lo:hi] * Pb[:, 0] + Pb[:, 2]
+            d_ = -k[lo:hi] * Pb[:, 1] + Pb[:, 3]
+            b_ = (1. + k[lo:hi] / K[lo:hi]) * Pb[:, 1] - Pb[:, 3] / K[lo:hi]
+            m = np.maximum(a, d_)
+            P[lo:hi] = np.column_stack((a, b_, c, d_)) / m[:, np.newaxis]
+            scale[lo:hi] = np.where(inner, scale[np.maximum(b, 0)], 0.) + np.log(m)
+        self.P = P
+        self.scale = scale
+
+    def solve(self, psi_e=0.4, psi_base=0.101325):
+        """ Compute the equivalent conductance and the potentials of the chains.
+
+        :Parameters:
+            - `psi_e` (float) - hydric potential outside the roots in MPa
+            - `psi_base` (float) - hydric potential at the root base in MPa
+
+        :Returns:
+            - `Jv` (float) - the output flux at the base
+        """
+        if np.ndim(psi_e):
+            raise ValueError('CompressedFlux: psi_e is expected to be the same for all the vertices')
+        chains = self.chains
+        a, b, c, d = self.P[self.top].T
+
+        # equivalent conductances from the deepest chains, Yb being the sum of the ones of the children
+        nb = len(chains)
+        Keq = np.zeros(nb)
+        Yb = np.zeros(nb)
+        for lo, hi in chains.levels(reverse=True):
+            Yb[lo:hi] = chains.sum_children(Keq, lo, hi)
+            Keq[lo:hi] = (d[lo:hi] * Yb[lo:hi] - c[lo:hi]) / (a[lo:hi] - b[lo:hi] * Yb[lo:hi])
+
+        # potentials at the top and at the bottom of the chains from the base
+        u_top = np.empty(nb)
+        u_top[0] = psi_base - psi_e
+        u_bottom = np.empty(nb)
+        for lo, hi in chains.levels():
+            if lo > 0:
+                u_top[lo:hi] = u_bottom[chains.parent[lo:hi]]
+            u_bottom[lo:hi] = u_top[lo:hi] * np.exp(-self.scale[self.top[lo:hi]]) / \
+                (a[lo:hi] - b[lo:hi] * Yb[lo:hi])
+
+        self.psi_e = psi_e
+        self.psi_base = psi_base
+        self.Keq_chain = Keq
+        self.Yb = Yb
+        self.u_top = u_top
+        self.u_bottom = u_bottom
+        self.Jv = Keq[0] * (psi_e - psi_base)
+        return self.Jv
+
+    def expand(self, chains=None):
+        """ Compute `Keq`, `psi_in`, `psi_out`, `j` and `J_out` of the vertices of some chains.
+
+        :Parameters:
+            - `chains` (array) - index of the chains to expand, all if None
+
+        The arrays are in the order of `arrays.vids`, NaN for the vertices of the other chains.
+        """
+        n = len(self.arrays)
+        if chains is None:
+            v = np.arange(n)
+        else:
+            v = np.flatnonzero(np.isin(self.chain, chains))
+        c = self.chain[v]
+        top = self.top[c]
+        Yb = self.Yb[c]
+        P, Pt = self.P[v], self.P[top]
+
+        load = P[:, 0] - P[:, 1] * Yb
+        u_out = np.full(n, np.nan)
+        u_out[v] = self.u_top[c] * np.exp(self.scale[v] - self.scale[top]) * load / (Pt[:, 0] - Pt[:, 1] * Yb)
+        below = self._below[v]
+        u_in = np.full(n, np.nan)
+        u_in[v] = np.where(below >= 0, u_out[np.maximum(below, 0)], self.u_bottom[c])
+
+        Keq = np.full(n, np.nan)
+        Keq[v] = (P[:, 3] * Yb - P[:, 2]) / load
+
+        self.Keq = Keq
+        self.psi_in = u_in + self.psi_e
+        self.psi_out = u_out + self.psi_e
+        self.J_out = -Keq * u_out
+        self.j = -self.k * u_in
+        return self
+
+    def update_mtg(self, g):
+        """ Write the expanded results as the MTG properties 'Keq', 'psi_in', 'psi_out', 'j' and 'J_out'."""
+        for name in ('Keq', 'psi_in', 'psi_out', 'j', 'J_out'):
+            g.properties()[name] = self.arrays.to_property(getattr(self, name))
+        return g
@@ -50,11 +50,10 @@ def compute_K(g, scale_factor=1.):
     """
     length = g.property('length')
     K_exp = g.property('K_exp')
-    K = {}
-    for vid in K_exp:
-        K[vid] = K_exp[vid] / length[vid]
-        K[vid] = K[vid] * scale_factor
-    g.properties()['K'] = K
+    vids = list(K_exp)
+    K = _values(K_exp, vids) / _values(length, vids)
+    K = K * scale_factor
+    g.properties()['K'] = dict(zip(vids, K.tolist()))
     return g
 
 
@@ -98,16 +97,14 @@ def compute_k(g, k0 = 300.):
     """
     #print 'entering radial k fitting'
 
-    radius = g.property('radius')
-    length = g.property('length')
-    kr={}
-    if k0 == 'k0':
-        k0 = g.property('k0')
-        kr = dict((vid, radius[vid] * 2 * pi * length[vid] * k0[vid]) for vid in g.vertices(scale=g.max_scale()))
-    else:
-        kr = dict((vid, radius[vid] * 2 * pi * length[vid] * k0) for vid in g.vertices(scale=g.max_scale()))
+    vids = list(g.vertices(scale=g.max_scale()))
+    radius = _values(g.property('radius'), vids)
+    length = _values(g.property('length'), vids)
+    if isinstance(k0, str) and k0 == 'k0':
+        k0 = _values(g.property('k0'), vids)
+    kr = radius * 2 * pi * length * k0
 
-    g.properties()['k'] = kr
+    g.properties()['k'] = dict(zip(vids, kr.tolist()))
     #print 'exiting radial k fitting'
     return g
 
@@ -171,17 +168,105 @@ def fit_property_from_spline(g, spline, prop_in, prop_out):
     And evaluate the spline to compute the property 'prop_out'
     """
 
-    #spline = UnivariateSpline(x, y, s=s)
-    keys = list(g.property(prop_in).keys())
-    x_values = np.array(list(g.property(prop_in).values()))
+    prop = g.property(prop_in)
+    x_values = np.fromiter(prop.values(), dtype=float, count=len(prop))
 
     y_values = spline(x_values)
 
-    g.properties()[prop_out] = dict(list(zip(keys, y_values)))
+    g.properties()[prop_out] = dict(zip(prop.keys(), y_values.tolist()))
 
     return g
 
 
+class ArrayConductance(object):
+    """ Axial and radial conductances of the vertices of a RootArrays.
+
+    The conductivity laws are evaluated once on the arrays of positions, the conductances for other
+    scale factors (axfold, radfold) are then obtained by a multiplication, without evaluating the laws again.
+    Same values as fit_property_from_spline followed by compute_K and compute_k.
+
+    :Parameters:
+        - `arrays` (RootArrays) - the root architecture with the length, radius and position arrays
+        - `axial_law` (function) - the axial conductivity K_exp as function of the position (e.g. fit_law(xa, ya))
+        - `radial_law` (function) - the radial conductivity k0 as function of the position, used if `k0` is None
+        - `k0` (float) - the radial conductivity of all the vertices
+
+    :Example::
+
+        conductances = ArrayConductance(arrays, fit_law(xa, ya), k0=92.)
+        for axfold in (0.5, 1., 2.):
+            K, k = conductances.compute(axfold=axfold)
+    """
+
+    def __init__(self, arrays, axial_law, radial_law=None, k0=None):
+        assert (radial_law is None) != (k0 is None), "Either radial_law or k0 is expected"
+        self.arrays = arrays
+        self._K = self._k = None
+        self.set_axial_law(axial_law)
+        self.set_radial_law(radial_law, k0)
+
+    def set_axial_law(self, axial_law):
+        """ Change the axial conductivity law, K will be computed again."""
+        self.axial_law = axial_law
+        self._K = None
+
+    def set_radial_law(self, radial_law=None, k0=None):
+        """ Change the radial conductivity law or the value of k0, k will be computed again."""
+        self.radial_law = radial_law
+        self.k0 = k0
+        self._k = None
+
+    def axial(self, axfold=1.):
+        """ Return the axial conductances K = K_exp(position) / length * axfold."""
+        if self._K is None:
+            self._K = self.axial_law(self.arrays.position) / self.arrays.length
+        return self._K * axfold
+
+    def radial(self, radfold=1.):
+        """ Return the radial conductances k = radius * 2 pi * length * k0(position) * radfold."""
+        if self._k is None:
+            k0 = self.k0 if self.radial_law is None else self.radial_law(self.arrays.position)
+            self._k = self.arrays.radius * 2 * pi * self.arrays.length * k0
+        return self._k * radfold
+
+    def compute(self, axfold=1., radfold=1.):
+        """ Return the arrays K and k for the scale factors `axfold` and `radfold`."""
+        return self.axial(axfold), self.radial(radfold)
+
+
+def spline_gradient(x, x_values, gradient, k=1, s=0.):
+    """ Chain rule through a spline law: derivatives with respect to the y data of the law.
+
+    The law is the spline fitted on (x, y) as in fit_property_from_csv, evaluated at `x_values`, and `gradient`
+    is the derivative of a function with respect to these values. An interpolating spline (s=0) is linear
+    in y, each y data contributes to the values through the spline fitted on (x, unit vector).
+
+    :Parameters:
+        - `x` (list) - the x data of the law (e.g. axial_conductance_data[0])
+        - `x_values` (array) - where the law is evaluated (e.g. the positions of the vertices)
+        - `gradient` (array) - the derivatives with respect to the law values at `x_values`
+        - `k`, `s` - the spline parameters, s must be 0
+
+    :Returns:
+        - array of the derivatives with respect to each y data
+
+    :Example::
+
+        # derivatives of Jv with respect to the axial conductance data, K = K_exp * axfold / length
+        dJv_dK, dJv_dk = f.adjoint()
+        dJv_dy = spline_gradient(xa, arrays.position, dJv_dK * axfold / arrays.length)
+    """
+    assert s == 0., "the spline must interpolate the data to be linear in y"
+    x_values = np.asarray(x_values)
+    gradient = np.asarray(gradient)
+    result = np.zeros(len(x))
+    for i in range(len(x)):
+        unit = np.zeros(len(x))
+        unit[i] = 1.
+        result[i] = np.dot(UnivariateSpline(x, unit, k=k, s=s)(x_values), gradient)
+    return result
+
+
 def fit_property_from_csv(g, csvdata, prop_in, prop_out, k=1., s=0., plot=False, direct_input=None):
     """ Fit a 1D spline from (x, y) csv extracted data or from direct input dictionnary
 
@@ -231,6 +316,10 @@ def fit_property_from_csv(g, csvdata, prop_in, prop_out, k=1., s=0., plot=False,
     return g
 
 
+def _values(prop, vids):
+    return np.fromiter((prop[v] for v in vids), dtype=float, count=len(vids))
+
+
 def fit_K(g, s=0.):   # DEPRECATED
     x = np.linspace(0.,1.,100)
     y = np.linspace(50, 500, 100)+100*np.random.random(100)-50
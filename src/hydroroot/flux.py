@@ -24,6 +24,10 @@ Flux computation.
 from openalea.mtg import traversal
 from openalea.mtg.traversal import *
 import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+from hydroroot.root_arrays import RootArrays
 
 class Flux(object):   # edit this to also allow for flux computation instead just redistribution
     """Compute the water potential and fluxes at each vertex of the MTG.
@@ -213,201 +217,611 @@ class Flux(object):   # edit this to also allow for flux computation instead jus
 
 
 
-class RadialShuntFlux(Flux):
-    """ Compute the water potential and fluxes at each vertex of the MTG.
+class ArrayFlux(object):
+    """Compute the water potential and fluxes at each vertex of the MTG with NumPy arrays.
 
-    On each vertex, the topology of the radial resistance network
-    has one direct shortcut to the parent. The shortcut has two new parameters a and b.
+    Same model as :class:`Flux`, but the MTG is compiled once into a RootArrays and
+    the traversals are replaced by vectorized sweeps level by level.
+    The results are kept as arrays in the order of `arrays.vids`, they are written in the MTG
+    properties only by :meth:`update_mtg`.
     """
+    PROPERTIES = ('Keq', 'psi_in', 'psi_out', 'j', 'J_out')
 
-    def __init__(self, a=1., b=0., **kwds):
-        """ Flux computes water potential and fluxes at each vertex of the MTG `g`.
+    def __init__(self, g,
+                 Jv, psi_e, psi_base,
+                 invert_model=False,
+                 k=None, K=None, CONSTANT=1.,
+                 arrays=None):
+        """ ArrayFlux computes water potential and fluxes at each vertex of the MTG `g`.
 
         :Parameters:
-            - `g` (MTG) - the root architecture
-            - `k` (dict) - lateral conductance
-            - `K` (dict) - axial conductance
+            - `g` (MTG) - the root architecture, may be None if `arrays` is given
             - `Jv` (float) - water flux at the root base in microL/s
             - `psi_e` - hydric potential outside the roots (pressure chamber) in MPa
                 if None, then consider that the value has been defined on each vertex.
             - `psi_base` - hydric potential at the root base (e.g. atmospheric pressure for decapited plant) in MPa
-            - `invert_model` - when false, distribute output flux within the root ; when true, compute the output flux for the given root and conditions
-            - `a` - relative factor to the main radial path conductivity.
-            - `b` - relative factor to the shortcut path conductivity.
-
-        :Algorithm:
+            - `invert_model` - when false, distribute output flux within the root ; when true, compute the output flux
+                for the given root and conditions.
+            - `k` (dict or array) - lateral conductance, arrays are in the order of `arrays.vids`
+                if None, taken from `arrays` property 'k' or from the MTG
+            - `K` (dict or array) - axial conductance, arrays are in the order of `arrays.vids`
+                if None, taken from `arrays` property 'K' or from the MTG
+            - `arrays` (RootArrays) - the compiled architecture, built from `g` if None
 
         :Example:
 
-            flux = RadialShuntFlux(g, ..., a=0.8, b=0.2)
+            f = ArrayFlux(g, ...)
+            f.run()
+            f.update_mtg()
         """
-        Flux.__init__(self, **kwds)
-        self.a = a if a else g.property('a')
-        self.b = b if b else g.property('b')
+        self.CONSTANT = CONSTANT  # used for sensitivity analysis
+        self.g = g
+        if arrays is None:
+            arrays = RootArrays.from_mtg(g, properties=())
+        self.arrays = arrays
+
+        self.k = np.array(self.get_array('k', k))
+        self.K = np.array(self.get_array('K', K))
+        self.Jv = Jv
+        self.HAS_SOIL = psi_e is None
+        self.psi_e = self.get_array('psi_e', None) if self.HAS_SOIL else psi_e
+        self.psi_base = psi_base
+        self.invert_model = invert_model
 
+    def get_array(self, name, values):
+        """ Return `values` as an array, if None use the property `name` of the arrays or of the MTG."""
+        if values is None:
+            values = self.arrays.get(name)
+            if values is None:
+                values = self.g.property(name)
+        return self.arrays.as_array(values)
 
     def run(self):
         """ Compute the water potential and fluxes of each segments
 
-        For each vertex of the root, compute :
-            - the water potential (:math:`\psi^{\text{out}}`) at the base;
-            - the water flux (`J`) at the base;
-            - the lateral water flux (`j`) entering the segment.
+        Same outputs as :meth:`Flux.run` stored as arrays: `Keq`, `psi_in`, `psi_out`, `j` and `J_out`.
 
         :Algorithm:
-            The algorithm has two stages:
-                - First, on each segment, an equivalent conductance is computed in post_order (children before parent).
-                - Finally, the water flux and potential are computed in pre order (parent then children).
+            - First, the equivalent conductances are computed level by level from the deepest one.
+            - Then, the water potentials are computed level by level from the base.
+            - Finally the fluxes are computed, from the tips for invert_model or from the base otherwise.
         """
+        self.compute_Keq()
+        self.compute_fluxes()
+        return self
+
+    def compute_Keq(self):
+        """ Compute the equivalent conductances `Keq`, and their sum over the children `Keq_children`."""
+        arrays = self.arrays
+        k = self.k; K = self.K
+        n = len(arrays)
+
+        Keq = np.zeros(n)
+        Keq_children = np.zeros(n)
+        for lo, hi in arrays.levels(reverse=True):
+            Keq_children[lo:hi] = arrays.sum_children(Keq, lo, hi)
+            r = 1. / (k[lo:hi] + Keq_children[lo:hi])
+            R = 1. / K[lo:hi]
+            Keq[lo:hi] = 1. / (r + R)
+
+        self.Keq = Keq
+        self.Keq_children = Keq_children
+        self.set_Jv_global()
+
+    def set_Jv_global(self):
+        psi_e = self.psi_e[0] if self.HAS_SOIL else self.psi_e
+        self.Jv_global = self.Keq[0] * (psi_e - self.psi_base)
+
+    def compute_fluxes(self):
+        """ Compute `psi_in`, `psi_out`, `j` and `J_out` from the equivalent conductances."""
+        arrays = self.arrays
+        k = self.k; K = self.K; parent = arrays.parent
+        Keq = self.Keq; Keq_children = self.Keq_children
+        psi_e = self.psi_e; psi_base = self.psi_base
+        n = len(arrays)
+
+        # Water potential computation according to Millman theorem: psi_in = a * psi_out + b
+        denominator = k + K + Keq_children
+        a = K / denominator
+        b = psi_e * (k + Keq_children) / denominator
+
+        psi_out = np.empty(n)
+        psi_in = np.empty(n)
+        psi_out[0] = psi_base
+        psi_in[0] = a[0] * psi_base + b[0]
+        for lo, hi in arrays.levels(start=1):
+            psi_out[lo:hi] = psi_in[parent[lo:hi]]
+            psi_in[lo:hi] = a[lo:hi] * psi_out[lo:hi] + b[lo:hi]
+
+        j = (psi_e - psi_in) * k
+
+        J_out = np.empty(n)
+        if not self.invert_model:  # distribute a given output into the root system
+            J_out[0] = self.Jv
+            for lo, hi in arrays.levels(start=1):
+                p = parent[lo:hi]
+                J_out[lo:hi] = (J_out[p] - j[p]) * (Keq[lo:hi] / Keq_children[p])
+        else:  # compute the water output for the given root system and conditions
+            J_out[:] = j
+            for lo, hi in arrays.levels(reverse=True):
+                J_out[lo:hi] += arrays.sum_children(J_out, lo, hi)
+
+        self.psi_in = psi_in
+        self.psi_out = psi_out
+        self.j = j
+        self.J_out = J_out
+
+    def adjoint(self):
+        """ Compute the derivatives of the output flux Jv_global with respect to the conductances of each vertex.
+
+        Must be called after :meth:`run`. The adjoint of the linear system of the potentials is the potential
+        phi of the same network with psi_e = 0 and psi_base = 1, computed by one sweep from the base with the
+        equivalent conductances already known. Then
+            - dJv/dk[v] = phi_in[v] * (psi_e - psi_in[v])
+            - dJv/dK[v] = (phi_out[v] - phi_in[v]) * (psi_in[v] - psi_out[v])
+
+        The derivatives are exact for a uniform psi_e.
 
-        g = self.g; k = self.k; K = self.K ; CONSTANT = self.CONSTANT
-        Jv = self.Jv; psi_e = self.psi_e; psi_base = self.psi_base
-        length = self.length; invert_model = self.invert_model
+        :Returns:
+            - `dJv_dK` (array) - in the order of `arrays.vids`
+            - `dJv_dk` (array) - in the order of `arrays.vids`
 
-        # NEW addition
-        a = self.a
-        b = self.b
+        See conductance.spline_gradient to get the derivatives with respect to the data of a conductance law.
+        """
+        arrays = self.arrays
+        parent = arrays.parent
+        k = self.k; K = self.K
 
-        # Select the base of the root
-        v_base = next(g.component_roots_at_scale_iter(g.root, scale=g.max_scale()))
+        a = K / (k + K + self.Keq_children)
+        phi_in = np.empty(len(arrays))
+        phi_out = np.empty(len(arrays))
+        phi_out[0] = 1.
+        phi_in[0] = a[0]
+        for lo, hi in arrays.levels(start=1):
+            phi_out[lo:hi] = phi_in[parent[lo:hi]]
+            phi_in[lo:hi] = a[lo:hi] * phi_out[lo:hi]
 
-        # Add properties
-        g.add_property('Keq')
-        g.add_property('psi_in')
-        g.add_property('psi_out')
-        g.add_property('j')
-        g.add_property('J_out')
+        self.dJv_dk = phi_in * (self.psi_e - self.psi_in)
+        self.dJv_dK = (phi_out - phi_in) * (self.psi_in - self.psi_out)
 
-        # NEW properties
-        g.add_property('alpha')
-        g.add_property('beta')
+        return self.dJv_dK, self.dJv_dk
 
-        # Convert axial conductivities to axial conductances
-        # Fabrice 2020-01-17: commented lines below because a MTG property must not changed see conductance.compute_K
-        #                   and here K is a shadow copy of g.property('K') then g.property('K') is modified below
-        # for vid in K:
-        #     K[vid] /= length[vid]
-        #     K[vid] *= CONSTANT
+    def update(self, vertices, K=None, k=None, fluxes=True):
+        """ Update the solution after a change of the conductances of a few vertices.
 
-        # Equivalent conductance computation
-        Keq = g.property('Keq')
-        alpha = g.property('alpha')
-        beta = g.property('beta')
+        Only the equivalent conductances of the modified vertices and of their ancestors are recomputed,
+        i.e. O(depth) instead of O(n), then `Keq` and `Jv_global` are up to date.
+        A local change modifies the water potential of the whole root system, the potentials and fluxes are
+        then recomputed by a full vectorized sweep if `fluxes` is True.
 
-        #print 'entering Keq computation'
+        :Parameters:
+            - `vertices` (array) - indices (in the order of `arrays.vids`) of the modified vertices
+            - `K` (float or array) - the new axial conductances of `vertices`, unchanged if None
+            - `k` (float or array) - the new lateral conductances of `vertices`, unchanged if None
+            - `fluxes` (bool) - if True recompute `psi_in`, `psi_out`, `j` and `J_out`
 
-        # TODO
-        # NEW EQUATION g, children Keq, k, K, a, b
-        # equation
-        for v in traversal.post_order2(g, v_base):
-            # compute
-            r, ra, rb, R = 0., 0., 0., 0.
-            # compute Keq[v]
-            #r = 1./(k[v] + sum(Keq[cid] for cid in g.children_iter(v)))
-            #R = 1./K[v]
-            #Keq[v] = 1./(r+R)
-            # compute alpha and beta
-            Keqc = sum(Keq[cid] for cid in g.children_iter(v))
-            alpha[v] = a*b*k[v] + (a+b)*K[v]+b*Keqc
-            alpha[v] /= a*b*k[v] + K[v]*(1+a+b)
-
-            beta[v] = K[v] + b*Keqc
-            beta[v] /= a*b*k[v] + K[v]*(1+a+b)
+        :Example:
 
-        #print 'exiting Keq computation'
+            f = ArrayFlux(g, ...).run()
+            f.update(vertices, K=f.K[vertices] * 2)
+        """
+        arrays = self.arrays
+        parent = arrays.parent
+        vertices = np.asarray(vertices, dtype=int)
+
+        if K is not None:
+            self.K[vertices] = K
+        if k is not None:
+            self.k[vertices] = k
+        vertices = np.unique(vertices)
+
+        # the modified vertices and their ancestors
+        path = [vertices]
+        ancestors = vertices
+        while len(ancestors):
+            ancestors = np.unique(parent[ancestors])
+            ancestors = ancestors[ancestors >= 0]
+            path.append(ancestors)
+        path = np.unique(np.concatenate(path))
+
+        # update Keq level by level from the deepest one
+        levels = np.searchsorted(arrays.level_ptr, path, side='right') - 1
+        bounds = np.flatnonzero(np.diff(levels)) + 1
+        for group in reversed(np.split(path, bounds)):
+            self.update_Keq(group)
+
+        self.set_Jv_global()
+        if fluxes:
+            self.compute_fluxes()
+
+        return self
+
+    def update_Keq(self, vertices):
+        """ Compute again `Keq` of vertices of the same level, and propagate the change to `Keq_children`."""
+        k = self.k; K = self.K; Keq = self.Keq; Keq_children = self.Keq_children
+        previous = Keq[vertices]
+        Keq[vertices] = 1. / (1. / (k[vertices] + Keq_children[vertices]) + 1. / K[vertices])
+        p = self.arrays.parent[vertices]
+        if p[0] >= 0:
+            np.add.at(Keq_children, p, Keq[vertices] - previous)
+
+    def update_mtg(self, g=None):
+        """ Write the results as the MTG properties PROPERTIES: 'Keq', 'psi_in', 'psi_out', 'j' and 'J_out'.
 
-        # Water flux and water potential computation
-        psi_out = g.property('psi_out')
-        psi_in = g.property('psi_in')
-        j = g.property('j')
-        J_out = g.property('J_out')
+        :Returns:
+            - `g` (MTG)
+        """
+        g = self.g if g is None else g
+        for name in self.PROPERTIES:
+            g.properties()[name] = self.arrays.to_property(getattr(self, name))
+        return g
 
 
+class RadialShuntFlux(ArrayFlux):
+    """Compute the water potential and fluxes at each vertex of the MTG with a radial shortcut.
 
-        # TODO Write the two systems
-        if not(invert_model) :
-            # distribute a given output into the root system
+    On each vertex, the topology of the radial resistance network has one direct shortcut to the parent.
+    The radial conductance k of a vertex is split in two paths:
+        - the main path, of conductance a * k, from the outside (psi_e) to the xylem of the vertex (psi_in)
+        - the shortcut, of conductance b * k, from the outside to the xylem of the parent (psi_out)
+    With a = 1 and b = 0 this is the model of :class:`Flux`, with the same boundary conditions in both modes.
 
-            #print 'entering Jv distribution'
+    The network is solved by sweeps over the levels as in :class:`ArrayFlux`. From the tips to the base, the
+    potential of each vertex is written psi_in = alpha * psi_out + beta, then the potentials are computed from the
+    base. The per vertex psi_e (psi_e=None) is taken into account exactly.
+    """
+    PROPERTIES = ArrayFlux.PROPERTIES + ('alpha', 'beta')
 
-            for v in traversal.pre_order2(g, v_base):
-            #compute psi according to Millman theorem, then compute radial flux
-                parent = g.parent(v)
-                brothers = g.children_iter(parent)
-                children = g.children_iter(v)
+    def __init__(self, a=1., b=0., **kwds):
+        """ RadialShuntFlux computes water potential and fluxes at each vertex of the MTG `g`.
 
-                Keq_brothers = sum( Keq[cid] for cid in brothers)
-                Keq_children = sum( Keq[cid] for cid in children)
+        :Parameters:
+            - `a` (float, dict or array) - relative factor to the main radial path conductivity,
+                if None taken from the property 'a' of `arrays` or of the MTG
+            - `b` (float, dict or array) - relative factor to the shortcut path conductivity,
+                if None taken from the property 'b' of `arrays` or of the MTG
+            - the other parameters are the ones of :class:`ArrayFlux`: `g`, `Jv`, `psi_e`, `psi_base`,
+                `invert_model`, `k`, `K`, `CONSTANT` and `arrays`
 
-                if parent is None:
-                    assert v == v_base
-                    psi_out[v] = psi_base
-                    J_out[v] = Jv
-                else:
-                    psi_out[v] = psi_in[parent]
-                    J_out[v] = (J_out[parent] - j[parent]) * ( Keq[v] / Keq_brothers )
+        :Example:
 
-                if not self.HAS_SOIL:
-                    # TODO
-                    #psi_in[v] = (K[v] * psi_out[v] + psi_e * (k[v] + Keq_children)) / (k[v] + K[v] + Keq_children)
-                    #j[v] = (psi_e - psi_in[v]) * k[v]
-                    pass
-                else:
-                    # TODO
-                    #psi_in[v] = (K[v] * psi_out[v] + psi_e[v] * (k[v] + Keq_children)) / (k[v] + K[v] + Keq_children)
-                    #j[v] = (psi_e[v] - psi_in[v]) * k[v]
-                    pass
+            f = RadialShuntFlux(g=g, Jv=0.1, psi_e=0.4, psi_base=0.101325, invert_model=True, a=0.8, b=0.2)
+            f.run()
+            f.update_mtg()
+        """
+        ArrayFlux.__init__(self, **kwds)
+        self.a = self.get_array('a', a)
+        self.b = self.get_array('b', b)
+
+    def compute_Keq(self):
+        """ Compute the equivalent conductances `Keq` and the coefficients `alpha` and `beta` from the tips.
+
+        Keq[v] is the conductance of the subtree of v seen from the xylem of its parent, shortcut included, and
+        `source` is Keq times the equivalent outside potential of this subtree:
+            - alpha = K / (K + a k + Keq_children)
+            - beta = (a k psi_e + source_children) / (K + a k + Keq_children)
+            - Keq = K (a k + Keq_children) / (K + a k + Keq_children) + b k
+            - source = K beta + b k psi_e
+        """
+        arrays = self.arrays
+        n = len(arrays)
+        self.Keq = np.zeros(n)
+        self.Keq_children = np.zeros(n)
+        self.source = np.zeros(n)
+        self.source_children = np.zeros(n)
+        self.alpha = np.empty(n)
+        self.beta = np.empty(n)
+        for lo, hi in arrays.levels(reverse=True):
+            self.update_Keq(np.arange(lo, hi))
+        self.set_Jv_global()
+
+    def update_Keq(self, vertices):
+        """ Compute again `Keq`, `source`, `alpha` and `beta` of vertices of the same level, and propagate the
+        change to `Keq_children` and `source_children`."""
+        K = self.K[vertices]
+        ak = self.a[vertices] * self.k[vertices]
+        bk = self.b[vertices] * self.k[vertices]
+        psi_e = np.broadcast_to(np.asarray(self.psi_e, dtype=float), (len(self.arrays),))[vertices]
+
+        radial = ak + self.Keq_children[vertices]
+        denominator = K + radial
+        self.alpha[vertices] = K / denominator
+        self.beta[vertices] = (ak * psi_e + self.source_children[vertices]) / denominator
+        Keq = K * radial / denominator + bk
+        source = K * self.beta[vertices] + bk * psi_e
+
+        p = self.arrays.parent[vertices]
+        if p[0] >= 0:
+            np.add.at(self.Keq_children, p, Keq - self.Keq[vertices])
+            np.add.at(self.source_children, p, source - self.source[vertices])
+        self.Keq[vertices] = Keq
+        self.source[vertices] = source
+
+    def set_Jv_global(self):
+        self.Jv_global = self.source[0] - self.Keq[0] * self.psi_base
+
+    def compute_fluxes(self):
+        """ Compute `psi_in`, `psi_out`, `j` and `J_out` from `alpha` and `beta`.
+
+        j is the water entering the vertex by both radial paths, and J_out the water leaving the subtree of the
+        vertex, i.e. the sum of j over the subtree for invert_model, or the output flux Jv distributed between
+        the children in proportion to their Keq otherwise, as in :class:`Flux`.
+        """
+        arrays = self.arrays
+        parent = arrays.parent
+        alpha = self.alpha; beta = self.beta
+        n = len(arrays)
+
+        psi_out = np.empty(n)
+        psi_in = np.empty(n)
+        psi_out[0] = self.psi_base
+        psi_in[0] = alpha[0] * psi_out[0] + beta[0]
+        for lo, hi in arrays.levels(start=1):
+            psi_out[lo:hi] = psi_in[parent[lo:hi]]
+            psi_in[lo:hi] = alpha[lo:hi] * psi_out[lo:hi] + beta[lo:hi]
+
+        j = self.k * (self.a * (self.psi_e - psi_in) + self.b * (self.psi_e - psi_out))
+
+        J_out = np.empty(n)
+        if not self.invert_model:  # distribute a given output into the root system
+            J_out[0] = self.Jv
+            for lo, hi in arrays.levels(start=1):
+                p = parent[lo:hi]
+                J_out[lo:hi] = (J_out[p] - j[p]) * (self.Keq[lo:hi] / self.Keq_children[p])
+        else:
+            J_out[:] = j
+            for lo, hi in arrays.levels(reverse=True):
+                J_out[lo:hi] += arrays.sum_children(J_out, lo, hi)
+
+        self.psi_in = psi_in
+        self.psi_out = psi_out
+        self.j = j
+        self.J_out = J_out
+
+    def adjoint(self):
+        """ Compute the derivatives of the output flux Jv_global with respect to the conductances of each vertex.
+
+        Same as :meth:`ArrayFlux.adjoint`, the potential phi of the network with psi_e = 0 and psi_base = 1 being
+        phi_in = alpha * phi_out. The lateral conductance k of a vertex is shared by both radial paths:
+            - dJv/dk[v] = a[v] * phi_in[v] * (psi_e - psi_in[v]) + b[v] * phi_out[v] * (psi_e - psi_out[v])
+            - dJv/dK[v] = (phi_out[v] - phi_in[v]) * (psi_in[v] - psi_out[v])
+
+        The derivatives are exact, also for a per vertex psi_e.
 
-            #print 'exiting Jv distribution'
+        :Returns:
+            - `dJv_dK` (array) - in the order of `arrays.vids`
+            - `dJv_dk` (array) - in the order of `arrays.vids`
+        """
+        arrays = self.arrays
+        parent = arrays.parent
+        alpha = self.alpha
 
-        else :  # compute the water output for the given root system and conditions
+        phi_in = np.empty(len(arrays))
+        phi_out = np.empty(len(arrays))
+        phi_out[0] = 1.
+        phi_in[0] = alpha[0]
+        for lo, hi in arrays.levels(start=1):
+            phi_out[lo:hi] = phi_in[parent[lo:hi]]
+            phi_in[lo:hi] = alpha[lo:hi] * phi_out[lo:hi]
 
-            #print 'entering Psi computation'
-            for v in traversal.pre_order2(g, v_base):
-            #compute psi according to Millman theorem from root base to root tips
-                parent = g.parent(v)
-                children = g.children_iter(v)
-                if parent is None:
-                    assert v == v_base
-                    psi_out[v] = psi_base
-                else:
-                    psi_out[v] = psi_in[parent]
-                Keq_children = sum( Keq[cid] for cid in children )
+        self.dJv_dk = (self.a * phi_in * (self.psi_e - self.psi_in) +
+                       self.b * phi_out * (self.psi_e - self.psi_out))
+        self.dJv_dK = (phi_out - phi_in) * (self.psi_in - self.psi_out)
 
-                # TODO
-                if not self.HAS_SOIL:
-                    psi_in[v] = (K[v] * psi_out[v] + psi_e * (-a * k[v] * beta[v] + Keq_children)) / (a * k[v] + K[v] + Keq_children - a * k[v] * alpha[v])
-                    #psi_in[v] = (K[v] * psi_out[v] + psi_e * (k[v] + Keq_children)) / (k[v] + K[v] + Keq_children)
-                else:
-                    psi_in[v] = (K[v] * psi_out[v] + psi_e[v] * (-a * k[v] * beta[v] + Keq_children)) / (a * k[v] + K[v] + Keq_children - a * k[v] * alpha[v])
-                    # psi_in[v] = (K[v] * psi_out[v] + psi_e[v] * (k[v] + Keq_children)) / (k[v] + K[v] + Keq_children)
+        return self.dJv_dK, self.dJv_dk
 
-            #print 'exiting Psi computation'
 
-            #print 'entering Jv computation'
-            for v in traversal.post_order2(g, v_base):
-            # compute water flux according to the psis from root tips to root base
-                if not self.HAS_SOIL:
-                    j[v] = (psi_e - psi_in[v]) * k[v] * alpha[v]
-                else:
-                    j[v] = (psi_e[v] - psi_in[v]) * k[v] * alpha[v]
-                children = g.children_iter(v)
-                if children is None:
-                    J_out[v] = j[v]
-                else:  # TODO CHECK THIS !!!
-                    influx = j[v] + sum( J_out[cid] for cid in children )
-                    J_out[v] = influx #(psi_in[v]-psi_out[v])*K[v]
+class SparseFlux(object):
+    """Compute the water potential and fluxes by solving the linear system of the hydraulic network.
 
-            if not self.HAS_SOIL:
-                Jv_global = Keq[v_base] * (psi_e - psi_base)
-            else:
-                Jv_global = Keq[v_base] * (psi_e[v_base] - psi_base)
+    The unknowns are the water potentials psi_in of the vertices. The water conservation at each vertex v writes
+        (k[v] + K[v] + sum(K[c] for c in children)) psi_in[v] - K[v] psi_in[parent] - sum(K[c] psi_in[c])
+            = k[v] psi_e[v] (+ K[v] psi_base at the base)
+
+    The matrix, the conductance Laplacian plus diag(k), depends only on K and k. It is factorized once, with the
+    unknowns ordered from the tips to the base so that the factorization has no fill-in and costs O(n).
+    Then each boundary condition (psi_e, psi_base) costs one back-substitution, see :meth:`solve`.
+
+    With a per vertex psi_e the solution is exact, whereas the Millman recursion of :class:`Flux` assumes that the
+    subtree of a vertex is at the psi_e of this vertex.
+    """
+
+    def __init__(self, arrays, K, k):
+        """
+        :Parameters:
+            - `arrays` (RootArrays) - the root architecture
+            - `K` (dict or array) - axial conductance, arrays are in the order of `arrays.vids`
+            - `k` (dict or array) - lateral conductance, arrays are in the order of `arrays.vids`
+
+        :Example:
+
+            solver = SparseFlux(arrays, K, k)
+            for psi_e in (0.2, 0.3, 0.4):
+                solver.solve(psi_e, 0.101325)
+                print(solver.Jv)
+        """
+        self.arrays = arrays
+        self.K = arrays.as_array(K)
+        self.k = arrays.as_array(k)
+
+        n = len(arrays)
+        # unknown i of the system is the vertex n-1-i: tips first, base last
+        self.perm = np.arange(n - 1, -1, -1)
+        rank = n - 1 - np.arange(n)
+
+        K = self.K
+        diagonal = self.k + K
+        diagonal += np.bincount(arrays.parent[1:], weights=K[1:], minlength=n)
+        child = rank[1:]
+        parent = rank[arrays.parent[1:]]
+        rows = np.concatenate((rank, child, parent))
+        cols = np.concatenate((rank, parent, child))
+        values = np.concatenate((diagonal, -K[1:], -K[1:]))
+
+        self.matrix = sparse.csc_matrix((values, (rows, cols)), shape=(n, n))
+        self.lu = splu(self.matrix, permc_spec='NATURAL', diag_pivot_thresh=0., options=dict(SymmetricMode=True))
+
+    def solve(self, psi_e=0.4, psi_base=0.101325):
+        """ Compute the water potentials and fluxes for the given boundary conditions.
+
+        :Parameters:
+            - `psi_e` - hydric potential outside the roots in MPa, either a float, a per vertex array of shape (n,)
+                or several per vertex conditions of shape (n, m)
+            - `psi_base` - hydric potential at the root base in MPa, float or array of shape (m,)
+
+        Set the arrays `psi_in`, `psi_out`, `j`, `J_out` of shape (n,) or (n, m), and `Jv` the flux at the base.
+
+        :Returns:
+            - `psi_in` (array)
+        """
+        arrays = self.arrays
+        n = len(arrays)
+        K = self.K; k = self.k
+        psi_e = np.asarray(psi_e, dtype=float)
+        psi_base = np.asarray(psi_base, dtype=float)
+
+        if psi_e.ndim == 2 or psi_base.ndim == 1:
+            # several boundary conditions, one per column
+            shape = (n, psi_e.shape[1] if psi_e.ndim == 2 else len(psi_base))
+            _k, _K = k[:, np.newaxis], K[:, np.newaxis]
+            if psi_e.ndim == 1:
+                psi_e = psi_e[:, np.newaxis]
+        else:
+            shape = (n,)
+            _k, _K = k, K
+
+        rhs = np.broadcast_to(_k * psi_e, shape).copy()
+        rhs[0] += K[0] * psi_base
+
+        psi_in = self.lu.solve(rhs[self.perm])[self.perm]
+
+        psi_out = np.empty(shape)
+        psi_out[1:] = psi_in[arrays.parent[1:]]
+        psi_out[0] = psi_base
+
+        self.psi_in = psi_in
+        self.psi_out = psi_out
+        self.j = (psi_e - psi_in) * _k
+        self.J_out = (psi_in - psi_out) * _K
+        self.Jv = self.J_out[0]
+
+        return psi_in
+
+    def update_mtg(self, g):
+        """ Write the results of a single boundary condition as the MTG properties 'psi_in', 'psi_out', 'j' and 'J_out'.
+        """
+        for name in ('psi_in', 'psi_out', 'j', 'J_out'):
+            g.properties()[name] = self.arrays.to_property(getattr(self, name))
+        return g
+
+
+def batch_flux(arrays, K, k, axfold=1., radfold=1., psi_e=0.4, psi_base=0.101325, a=1., b=0.):
+    """ Compute the equivalent conductance and the output flux of one architecture for many sets of conductances.
+
+    All the sets are solved in the same sweeps over the levels of `arrays`, each vertex holding one value per set.
+
+        :Parameters:
+            - `arrays` (RootArrays) - the root architecture
+            - `K` (array) - axial conductances, shape (n,) or (nb_sets, n) in the order of `arrays.vids`
+            - `k` (array) - radial conductances, shape (n,) or (nb_sets, n) in the order of `arrays.vids`
+            - `axfold` (float or array) - factor(s) applied to K, shape (nb_sets,)
+            - `radfold` (float or array) - factor(s) applied to k, shape (nb_sets,)
+            - `psi_e` (float or array) - hydric potential outside the roots in MPa, one per set if array
+            - `psi_base` (float or array) - hydric potential at the root base in MPa, one per set if array
+            - `a` (float or array) - relative factor to the main radial path conductivity of RadialShuntFlux,
+                one per vertex if array
+            - `b` (float or array) - relative factor to the shortcut path conductivity of RadialShuntFlux,
+                one per vertex if array
+
+        :Returns:
+            - `Keq` (array) - the equivalent conductance at the base, shape (nb_sets,)
+            - `Jv` (array) - the output flux at the base, shape (nb_sets,)
+
+        :Example::
+
+            # K and k computed for axfold = radfold = 1, then 5 x 5 combinations of factors
+            ax, rad = np.meshgrid(np.linspace(0.5, 2, 5), np.linspace(0.5, 2, 5))
+            Keq, Jv = batch_flux(arrays, K, k, axfold=ax.ravel(), radfold=rad.ravel())
+    """
+    K = np.atleast_2d(np.asarray(K, dtype=float)).T * np.asarray(axfold, dtype=float)
+    k = np.atleast_2d(np.asarray(k, dtype=float)).T * np.asarray(radfold, dtype=float)
+    K, k = np.broadcast_arrays(K, k)
+    a = np.asarray(a, dtype=float).reshape(-1, 1)
+    b = np.asarray(b, dtype=float).reshape(-1, 1)
+    ak, bk = np.broadcast_arrays(a * k, b * k)
+
+    n, nb_sets = K.shape
+    Keq = np.zeros((n, nb_sets))
+    for lo, hi in arrays.levels(reverse=True):
+        radial = ak[lo:hi] + arrays.sum_children(Keq, lo, hi)
+        Keq[lo:hi] = K[lo:hi] * radial / (K[lo:hi] + radial) + bk[lo:hi]
+
+    Keq_base = Keq[0]
+    Jv = Keq_base * (np.asarray(psi_e) - np.asarray(psi_base))
+
+    return Keq_base, Jv
+
+
+def cut_flux(arrays, K, k, cut_lengths, psi_e=0.4, psi_base=0.101325, threshold=1e-4):
+    """ Compute the equivalent conductance and the output flux of an architecture cut at several lengths.
+
+    Same model as cut_and_set_conductance followed by flux: the vertices beyond `cut_length` from the base are
+    removed and, at the cut tips, the radial conductance is set to the axial one.
+    The distance from the base is the one of segments_at_length, i.e. (depth + 1) * threshold, so that the
+    architecture cut at a given length is a prefix of the levels of `arrays`. All the cuts are solved in one
+    sweep from the deepest level, one column per cut, without any copy of the architecture.
+
+        :Parameters:
+            - `arrays` (RootArrays) - the uncut root architecture
+            - `K` (dict or array) - axial conductances, arrays are in the order of `arrays.vids`
+            - `k` (dict or array) - radial conductances, arrays are in the order of `arrays.vids`
+            - `cut_lengths` (list) - lengths (m) from the base at which the architecture is cut
+            - `psi_e` (float) - hydric potential outside the roots in MPa
+            - `psi_base` (float) - hydric potential at the root base in MPa
+            - `threshold` (float) - length of the vertices used to compute the distance from the base, see segments_at_length
+
+        :Returns:
+            - `Keq` (array) - the equivalent conductance at the base for each cut length
+            - `Jv` (array) - the output flux at the base for each cut length
+
+        :Example::
+
+            Keq, Jv = cut_flux(arrays, K, k, [0.09, 0.06, 0.04])
+    """
+    K = arrays.as_array(K)
+    k = arrays.as_array(k)
+    cut_lengths = np.atleast_1d(np.asarray(cut_lengths, dtype=float))
+
+    # distance from the base of each level, accumulated as in segments_at_length
+    level_length = np.cumsum(np.full(len(arrays.level_ptr) - 1, threshold))
+    # number of levels kept by each cut: the ones strictly before the cut length
+    nb_levels = np.maximum(np.searchsorted(level_length, cut_lengths, side='left'), 1)
+
+    has_children = arrays.nb_children() > 0
+    n = arrays.level_ptr[nb_levels.max()]
+    Keq = np.zeros((n, len(cut_lengths)))
+    for level in range(nb_levels.max() - 1, -1, -1):
+        lo, hi = arrays.level_ptr[level], arrays.level_ptr[level + 1]
+        active = level < nb_levels
+        # cut tips: the vertices of the last kept level that had children
+        cut_tip = (level == nb_levels - 1) & (nb_levels < len(level_length))
+        _k = np.where(has_children[lo:hi, np.newaxis] & cut_tip, K[lo:hi, np.newaxis], k[lo:hi, np.newaxis])
+
+        Keq_children = arrays.sum_children(Keq, lo, hi) if hi < n else 0.
+        r = 1. / (_k + Keq_children)
+        R = 1. / K[lo:hi, np.newaxis]
+        Keq[lo:hi] = np.where(active, 1. / (r + R), 0.)
+
+    Keq_base = Keq[0]
+    Jv = Keq_base * (psi_e - psi_base)
+
+    return Keq_base, Jv
 
 
 def flux(g, Jv=0.1, psi_e=0.4, psi_base=0.101325,
          invert_model=False, k=None, K=None, CONSTANT=1.,
          shunt=False, a=1., b=0.,
-         cut_and_flow=False):
+         cut_and_flow=False, vectorized=False):
     """ flux computes water potential and fluxes at each vertex of the MTG `g`.
 
         :Parameters:
@@ -421,21 +835,29 @@ def flux(g, Jv=0.1, psi_e=0.4, psi_base=0.101325,
         :Optional Parameters:
             - `k` (dict) - lateral conductance
             - `K` (dict) - axial conductance
-            - `shunt` (bool) : use the RadialShunt Flux (True) or the classical one (False)
-            - `a` : relative factor to the main radial path conductivity.
-            - `b` : relative factor to the shortcut path conductivity.
+            - `shunt` (bool) : use the RadialShuntFlux (True) or the classical one (False)
+            - `a` : relative factor to the main radial path conductivity, float, dict or None for the property 'a'.
+            - `b` : relative factor to the shortcut path conductivity, float, dict or None for the property 'b'.
             - 'cut_and_flow (bool): deprecated, used before to differentiate the Keq calculation at the tips to simulate
                         cut and flow experiment.
+            - `vectorized` (bool) : use the array solver ArrayFlux (True) or the MTG traversals (False)
 
         :Example::
 
             my_flux = flux(g)
     """
-    if not shunt:
-        f = Flux(g, Jv, psi_e, psi_base, invert_model, k=k, K=K, CONSTANT=CONSTANT, cut_and_flow=cut_and_flow)
-    else:
-        f = RadialShuntFlux(a, b, g=g, Jv=Jv, psi_e=psi_e, psi_base=psi_base, invert_model=invert_model, k=k, K=K, CONSTANT=CONSTANT)
-
+    if shunt:
+        f = RadialShuntFlux(a, b, g=g, Jv=Jv, psi_e=psi_e, psi_base=psi_base, invert_model=invert_model, k=k, K=K,
+                            CONSTANT=CONSTANT)
+        f.run()
+        return f.update_mtg()
+
+    if vectorized:
+        f = ArrayFlux(g, Jv, psi_e, psi_base, invert_model, k=k, K=K, CONSTANT=CONSTANT)
+        f.run()
+        return f.update_mtg()
+
+    f = Flux(g, Jv, psi_e, psi_base, invert_model, k=k, K=K, CONSTANT=CONSTANT, cut_and_flow=cut_and_flow)
     f.run()
 
     return f.g
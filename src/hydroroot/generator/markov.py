@@ -4,6 +4,9 @@ import numpy as np
 from openalea.mtg import *
 from openalea.mtg import algo
 from openalea.mtg import traversal
+from scipy.interpolate import UnivariateSpline
+
+from hydroroot.root_arrays import RootArrays, _ranges
 #from random import choice
 
 
@@ -213,6 +216,122 @@ def markov_binary_tree(g=None, vid=0, nb_vertices=1500,
     return g
 
 
+def markov_arrays(nb_vertices=1500,
+                  branching_variability=0.1, branching_delay=20,
+                  length_law=None,
+                  nude_tip_length=200, order_max=5,
+                  seed=None, censure_variability=False, **kwargs):
+    """ Vectorized version of markov_binary_tree returning a RootArrays.
+
+    Same parameters and same stochastic model as markov_binary_tree, but the axes of a same order are generated
+    together: branching positions, shifts and lateral lengths are drawn as NumPy arrays from a
+    numpy.random.Generator seeded with `seed`. The random draws are not made in the same sequence, then for a
+    given seed the architecture differs from the one of markov_binary_tree, but it has the same distribution.
+    The laws having a `sample` method (see law.HistoLaw) draw their lengths with the same generator,
+    the random module is also seeded for the other laws that use it.
+
+    branching_variability is assumed to be in [0, 1], so that a shifted branching point can only collide with
+    the shifted previous one.
+
+    :Returns:
+        - `arrays` (RootArrays) - use arrays.to_mtg() to get the MTG
+    """
+    rng = np.random.default_rng(seed)
+    if seed is not None:
+        random.seed(seed)
+
+    several_laws = isinstance(length_law, list)
+    decrease = [(1. - order / 100.) for order in range(1, int(order_max) + 1)]
+    branching_delay = int(branching_delay)
+    var = int(round(branching_variability * branching_delay))
+
+    # vertices in creation order, one block of contiguous vertices per axis
+    parent = [np.array([-1])]
+    order = [np.zeros(1, dtype=int)]
+    nb = 1
+    # primary axis: the base and nb_vertices - 1 successors
+    n0 = int(nb_vertices)
+    parent.append(np.arange(n0 - 1))
+    order.append(np.zeros(n0 - 1, dtype=int))
+    axis_start = np.array([0])
+    axis_length = np.array([n0])
+    nb += n0 - 1
+    current_order = 0
+
+    while len(axis_start) and current_order < order_max:
+        # theoretical branching points of the delayed markov chain: i = delay + m * (delay + 1), i < n - 1
+        nb_branches = np.where(axis_length - 2 >= branching_delay,
+                               (axis_length - 2 - branching_delay) // (branching_delay + 1) + 1, 0)
+        axis = np.repeat(np.arange(len(axis_start)), nb_branches)
+        m = _ranges(nb_branches)
+        i = branching_delay + m * (branching_delay + 1)
+        n = axis_length[axis]
+
+        # shift of the branching points, refused outside of the axis or on an already branched point
+        shift = rng.integers(-var, var + 1, size=len(i))
+        target = i + shift
+        valid = (target > 0) & (target < n - 1) & (shift != 0)
+        same_as_previous = np.zeros(len(i), dtype=bool)
+        same_as_previous[1:] = (target[1:] == target[:-1]) & (axis[1:] == axis[:-1])
+        previous_valid = np.zeros(len(i), dtype=bool)
+        previous_valid[1:] = valid[:-1]
+        accepted = valid & ~(same_as_previous & previous_valid)
+        final = np.where(accepted, target, i)
+
+        # anchors: vertex final + 1 of the axis, position_index (distance to the tip) of the theoretical point
+        anchor = axis_start[axis] + final + 1
+        position_index = n - i
+
+        if length_law:
+            law = (length_law[0] if current_order == 0 else length_law[1]) if several_laws else length_law
+            lateral_length = _evaluate_law(law, position_index, rng).astype(int)
+        else:
+            nb_descendants = n - (final + 1)
+            lateral_length = np.maximum(nb_descendants - nude_tip_length, 1) - 1
+
+        keep = lateral_length > 0
+        anchor, lateral_length = anchor[keep], lateral_length[keep]
+        real_lateral_length = lateral_length
+
+        # branching_variability also apply to the length of LR
+        variation = (lateral_length * branching_variability).astype(int)
+        lateral_length = rng.integers(np.maximum(1, lateral_length - variation), lateral_length + variation + 1)
+
+        if censure_variability:
+            limit = nb_vertices * decrease[current_order]
+            too_long = lateral_length > limit
+            lateral_length = np.where(too_long & (real_lateral_length <= limit), real_lateral_length, lateral_length)
+            lateral_length = np.where(too_long & (real_lateral_length > limit), int(limit), lateral_length)
+
+        # new axes: the first vertex is borne by the anchor, the others follow
+        axis_start = nb + np.cumsum(lateral_length) - lateral_length
+        axis_length = lateral_length
+        total = int(lateral_length.sum())
+        _parent = np.arange(nb - 1, nb + total - 1)
+        _parent[axis_start - nb] = anchor
+        parent.append(_parent)
+        current_order += 1
+        order.append(np.full(total, current_order))
+        nb += total
+
+    parent = np.concatenate(parent)
+    order = np.concatenate(order)
+    edge_type = np.full(len(parent), '<')
+    edge_type[1:][order[1:] != order[parent[1:]]] = '+'
+
+    return RootArrays.from_parent(parent, edge_type=edge_type, order=order)
+
+
+def _evaluate_law(law, positions, rng):
+    """ Evaluate a length law on an array of positions, at once when the law accepts arrays."""
+    if isinstance(law, UnivariateSpline):
+        return np.asarray(law(positions))
+    if hasattr(law, 'sample'):
+        # e.g. law.HistoLaw
+        return law.sample(positions, rng)
+    return np.array([law(p) for p in positions.tolist()])
+
+
 def shuffle_axis(g=None, shuffle=False):
     """ For each subtree of a MTG, change its root node to another node of the same axis.
     """
@@ -7,6 +7,10 @@ from openalea.mtg import algo
 
 SUPERIOR_ORDER = True
 
+# relative to segment_length: a distance read from a file which is a multiple of segment_length up to the
+# rounding errors (e.g. mm to m conversion) does not add an extra vertex
+LENGTH_TOLERANCE = 1e-6
+
 def mtg_builder(
     primary_length,
     primary_length_data,
@@ -269,7 +273,7 @@ def mtg_from_aqua_data(df, segment_length=1e-4):
     for i in length_base:
         len_base = df_order.iloc[i].db
         code = '1'
-        while len_base - prev_len > 0:
+        while len_base - prev_len > segment_length * LENGTH_TOLERANCE:
             # we add segment of segment_length till the next vertice => no lateral root yet so the edge_type is '<'
             prev_len += segment_length
             if 'radius' in df_order: # F. Bauget 2020-11-02 : added the possibility to set real radii
@@ -341,7 +345,7 @@ def add_branching(g, df, ramifs = None, Order = 0, segment_length = 1e-4):
         parent_base = g.node(vid).base_length
 
         if df_order.empty:
-            while len_base - prev_len > 0:
+            while len_base - prev_len > segment_length * LENGTH_TOLERANCE:
                 prev_len += segment_length
                 edge_type = '+' if _root_id == vid else '<'
                 if 'radius' in df_order: # F. Bauget 2020-11-02 : added the possibility to set real radii
@@ -355,7 +359,7 @@ def add_branching(g, df, ramifs = None, Order = 0, segment_length = 1e-4):
             for i in length_base:
                 len_base = df_order.db[i]
                 edge_type = '+' if _root_id == vid else '<'
-                while len_base - prev_len > 0:
+                while len_base - prev_len > segment_length * LENGTH_TOLERANCE:
                     prev_len += segment_length
                     if 'radius' in df_order:  # F. Bauget 2020-11-02 : added the possibility to set real radii
                         vid = g.add_child(vid, edge_type = edge_type, label = 'S', base_length = parent_base + prev_len,
@@ -0,0 +1,373 @@
+"""
+Time-stepped growth of a root architecture.
+
+At each time step the growing axes are extended by a few vertices, and the laterals emerge on the branching
+points that are far enough from the tip of their bearing axis, or once their bearing axis has stopped growing.
+The branching model is the one of markov_arrays: when the growth is over, the architecture has the same
+distribution as the one generated at once.
+
+The vertices are stored in creation order (the parent before its children) in arrays which capacity is
+doubled when full, so that adding m vertices costs O(m) amortized. The positions, the conductances and the
+equivalent conductances `Keq` are only computed again on the axes that have grown and on the path from their
+branching point to the base. The subtrees of the axes whose growth is over are not visited again. Keq is
+composed along the axes, order after order, by a scan of the axes cut in chunks of sqrt(axis size) vertices:
+about 2 sqrt(axis size) vectorized steps rather than one step per level of the tree.
+The position of a vertex is measured from the tip of its axis, so all the vertices of a growing axis change of
+conductance at each step: the steps update several times the final number of vertices, and a growth of 30 steps
+costs 2 to 3 times one computation of the final architecture (see benchmarks/bench_growth.py).
+
+Example::
+
+    root = GrowingRoot(fit_law(*axial_data), k0=92., primary_length=0.13, growth_rate=[1e-2, 5e-3], seed=2)
+    for day in range(30):
+        root.step()
+    df = pd.DataFrame(root.history)
+    f = flux.ArrayFlux(None, 0.1, 0.4, 0.101325, True, arrays=root.to_arrays())
+"""
+from math import pi
+
+import numpy as np
+
+from hydroroot.generator.markov import _evaluate_law
+from hydroroot.root_arrays import RootArrays, _ranges
+
+
+class GrowableArrays(object):
+    """ Arrays of the same size which capacity is doubled when full.
+
+    The arrays are read and written through attributes, e.g. `buffers.length`, which are views of the first
+    len(buffers) values: they must not be kept after an `append`.
+
+    :Attributes:
+        - `capacity` (int) - the number of values allocated
+        - `reallocations` (int) - the number of times the arrays have been allocated again
+    """
+
+    def __init__(self, capacity=1024, **dtypes):
+        self.__dict__['_size'] = 0
+        self.__dict__['capacity'] = int(capacity)
+        self.__dict__['reallocations'] = 0
+        self.__dict__['data'] = dict((name, np.zeros(self.capacity, dtype=dtype)) for name, dtype in dtypes.items())
+
+    def __getattr__(self, name):
+        try:
+            return self.data[name][:self._size]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, values):
+        self.data[name][:self._size] = values
+
+    def __len__(self):
+        return self._size
+
+    def reserve(self, size):
+        """ Make room for `size` values, at least doubling the capacity."""
+        if size <= self.capacity:
+            return
+        capacity = max(size, 2 * self.capacity)
+        for name, array in self.data.items():
+            data = np.zeros(capacity, dtype=array.dtype)
+            data[:self._size] = array[:self._size]
+            self.data[name] = data
+        self.__dict__['capacity'] = capacity
+        self.__dict__['reallocations'] += 1
+
+    def append(self, **values):
+        """ Append the same number of values to each array, the arrays not given are appended zeros.
+
+        :Returns:
+            - the index of the appended values
+        """
+        m = len(next(iter(values.values())))
+        lo, hi = self._size, self._size + m
+        self.reserve(hi)
+        for name, array in self.data.items():
+            array[lo:hi] = values.get(name, 0)
+        self.__dict__['_size'] = hi
+        return np.arange(lo, hi)
+
+
+class GrowingRoot(object):
+    """ Root architecture growing by time steps, with its conductances and equivalent conductances.
+
+    :Parameters:
+        - `axial_law` (function) - the axial conductivity K_exp as function of the position (e.g. fit_law(xa, ya))
+        - `radial_law` (function) - the radial conductivity k0 as function of the position, used if `k0` is None
+        - `k0` (float) - the radial conductivity of all the vertices
+        - `primary_length` (float) - final length of the primary root in m
+        - `growth_rate` (float or list) - growth of the axes at each step in m, one per order, the last one
+            being used for the higher orders
+        - `branching_delay` (float) - average distance between two branching points in m
+        - `branching_variability` (float) - variability of the branching points and of the lateral lengths
+        - `nude_length` (float) - length from the tip without laterals in m
+        - `order_max` (int) - maximum order of the laterals
+        - `segment_length` (float) - length of the vertices in m
+        - `length_law` (function or list) - as in markov_arrays, the final number of vertices of a lateral from
+            the number of vertices between its branching point and the tip of its bearing axis
+        - `ref_radius`, `order_decrease_factor` (float) - the radius of the vertices, see ordered_radius_arrays
+        - `psi_e`, `psi_base` (float) - hydric potentials outside the roots and at the base in MPa, for `Jv`
+        - `seed` (int) - seed of the random generator
+        - `capacity` (int) - initial number of vertices of the arrays
+
+    :Attributes:
+        - `vertices` (GrowableArrays) - per vertex arrays in creation order: parent, axis, rank (in its axis),
+            branch (True for a '+' edge), successor (the next vertex of the axis, -1 for the tip), order, length,
+            radius, position, K, k, Keq and Keq_laterals (the sum of Keq of the laterals it bears)
+        - `axes` (GrowableArrays) - per axis arrays: anchor (the vertex bearing the axis, -1 for the primary
+            root), tip, size, max_size and order
+        - `Keq`, `Jv` (float) - the equivalent conductance and the output flux at the base
+        - `history` (list) - one dict per step with the keys step, nb_vertices, length, nb_updated, Keq and Jv
+    """
+
+    def __init__(self, axial_law, radial_law=None, k0=None,
+                 primary_length=0.13, growth_rate=1e-3,
+                 branching_delay=2e-3, branching_variability=0.25, nude_length=0.021, order_max=4,
+                 segment_length=1e-4, length_law=None, ref_radius=7e-5, order_decrease_factor=0.7,
+                 psi_e=0.4, psi_base=0.101325, seed=None, capacity=1024):
+        assert (radial_law is None) != (k0 is None), "Either radial_law or k0 is expected"
+        self.axial_law = axial_law
+        self.radial_law = radial_law
+        self.k0 = k0
+        self.segment_length = float(segment_length)
+        self.growth_rate = np.maximum(1, np.round(np.atleast_1d(growth_rate) / self.segment_length)).astype(int)
+        self.branching_delay = int(round(branching_delay / self.segment_length))
+        self.branching_variability = branching_variability
+        self.nude_length = int(round(nude_length / self.segment_length))
+        self.order_max = int(order_max)
+        self.length_law = length_law
+        self.ref_radius = ref_radius
+        self.order_decrease_factor = order_decrease_factor
+        self.psi_e = psi_e
+        self.psi_base = psi_base
+        self.rng = np.random.default_rng(seed)
+
+        self.vertices = GrowableArrays(capacity, parent=int, axis=int, rank=int, branch=bool, order=int,
+                                       successor=int, length=float, radius=float, position=float, K=float,
+                                       k=float, Keq=float, Keq_laterals=float)
+        self.axes = GrowableArrays(64, anchor=int, tip=int, size=int, max_size=int, order=int)
+
+        # laterals which branching point is not yet far enough from the tip: axis, rank and vertex of the
+        # branching point (-1 if not yet created), final number of vertices
+        self._pending = dict((name, np.zeros(0, dtype=int)) for name in ('axis', 'rank', 'anchor', 'max_size'))
+
+        self.step_count = 0
+        self.Keq = self.Jv = 0.
+        self.history = []
+        self._add_axes(np.array([-1]), np.zeros(1, dtype=int),
+                       np.array([int(round(primary_length / self.segment_length))]))
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def _add_axes(self, anchor, order, max_size):
+        """ Create new axes without vertices, and draw their branching points as markov_arrays."""
+        axes = self.axes
+        new = axes.append(anchor=anchor, tip=np.full(len(anchor), -1), size=np.zeros(len(anchor), dtype=int),
+                          max_size=max_size, order=order)
+
+        keep = order < self.order_max
+        new, n, order = new[keep], max_size[keep], order[keep]
+        delay = self.branching_delay
+        var = int(round(self.branching_variability * delay))
+
+        # theoretical branching points i = delay + m * (delay + 1), i < n - 1, shifted inside the axis
+        nb_branches = np.where(n - 2 >= delay, (n - 2 - delay) // (delay + 1) + 1, 0)
+        axis = np.repeat(new, nb_branches)
+        i = delay + _ranges(nb_branches) * (delay + 1)
+        n = np.repeat(n, nb_branches)
+        target = i + self.rng.integers(-var, var + 1, size=len(i))
+        final = np.where((target > 0) & (target < n - 1), target, i)
+        # the distinct (axis, final) pairs, sorted
+        m = int(n.max()) + 1 if len(n) else 1
+        axis, final = np.divmod(np.unique(axis * m + final), m)
+        n = axes.max_size[axis]
+
+        if self.length_law:
+            several_laws = isinstance(self.length_law, list)
+            lateral_length = np.zeros(len(axis), dtype=int)
+            for primary in (True, False):
+                on = (axes.order[axis] == 0) == primary
+                law = (self.length_law[0] if primary else self.length_law[1]) if several_laws else self.length_law
+                if on.any():
+                    lateral_length[on] = _evaluate_law(law, n[on] - final[on], self.rng).astype(int)
+        else:
+            lateral_length = np.maximum(n - (final + 1) - self.nude_length, 1) - 1
+        keep = lateral_length > 0
+        axis, final, lateral_length = axis[keep], final[keep], lateral_length[keep]
+        variation = (lateral_length * self.branching_variability).astype(int)
+        lateral_length = self.rng.integers(np.maximum(1, lateral_length - variation), lateral_length + variation + 1)
+
+        pending = self._pending
+        for name, values in (('axis', axis), ('rank', final + 1), ('anchor', np.full(len(axis), -1)),
+                             ('max_size', lateral_length)):
+            pending[name] = np.concatenate((pending[name], values))
+
+    def step(self):
+        """ Grow the architecture by one time step and update Keq and Jv.
+
+        :Returns:
+            - self
+        """
+        vertices, axes, pending = self.vertices, self.axes, self._pending
+
+        # emergence of the laterals far enough from the tip of their bearing axis, or which bearing axis has
+        # stopped growing
+        bearing = pending['axis']
+        ready = (pending['anchor'] >= 0) & ((axes.size[bearing] - pending['rank'] >= self.nude_length) |
+                                            (axes.size[bearing] == axes.max_size[bearing]))
+        if ready.any():
+            self._add_axes(pending['anchor'][ready], axes.order[pending['axis'][ready]] + 1,
+                           pending['max_size'][ready])
+            # the branching points of the new axes are appended after the ready ones
+            ready = np.concatenate((ready, np.zeros(len(pending['axis']) - len(ready), dtype=bool)))
+            for name in pending:
+                pending[name] = pending[name][~ready]
+
+        # growth of the axes, one block of vertices per axis
+        growing = np.flatnonzero(axes.size < axes.max_size)
+        size = axes.size[growing]
+        m = np.minimum(self.growth_rate[np.minimum(axes.order[growing], len(self.growth_rate) - 1)],
+                       axes.max_size[growing] - size)
+        start = np.where(size > 0, axes.tip[growing], axes.anchor[growing])
+        offset = _ranges(m)
+        first = len(vertices) + np.cumsum(m) - m
+        axis = np.repeat(growing, m)
+        parent = len(vertices) + np.arange(m.sum()) - 1
+        parent[first - len(vertices)] = start
+        order = axes.order[axis]
+        rank = np.repeat(size, m) + offset
+        new = vertices.append(parent=parent, axis=axis, rank=rank, branch=(rank == 0) & (axis > 0),
+                              successor=np.full(len(parent), -1), order=order, length=self.segment_length,
+                              radius=self.ref_radius * self.order_decrease_factor ** order)
+        vertices.successor[parent[rank > 0]] = new[rank > 0]
+        axes.size[growing] = size + m
+        axes.tip[growing] = first + m - 1
+
+        # the branching points created in this step
+        block = np.full(len(axes), -1)
+        block[growing] = first - size
+        created = (pending['anchor'] < 0) & (pending['rank'] < axes.size[pending['axis']])
+        pending['anchor'][created] = block[pending['axis'][created]] + pending['rank'][created]
+
+        updated = self._update(growing)
+
+        self.step_count += 1
+        self.history.append(dict(step=self.step_count, nb_vertices=len(vertices),
+                                 length=float(vertices.length.sum()), nb_updated=len(updated),
+                                 Keq=self.Keq, Jv=self.Jv))
+        return self
+
+    def _update(self, grown):
+        """ Update the positions, the conductances and Keq of the axes `grown` and of the path to the base."""
+        vertices, axes = self.vertices, self.axes
+        axis, rank = vertices.axis, vertices.rank
+
+        # the whole axes which have grown, the vertices up to the branching point on their bearing axes
+        need = np.full(len(axes), -1)
+        need[grown] = axes.max_size[grown]
+        for order in range(self.order_max, 0, -1):
+            lateral = np.flatnonzero((axes.order == order) & (need >= 0))
+            anchor = axes.anchor[lateral]
+            np.maximum.at(need, axis[anchor], rank[anchor])
+
+        on_grown = np.zeros(len(axes), dtype=bool)
+        on_grown[grown] = True
+        updated = np.flatnonzero(rank <= need[axis])
+        moved = updated[on_grown[axis[updated]]]
+
+        # positions and conductances, as relative_position and ArrayConductance
+        length = vertices.length[moved]
+        position = (axes.size[axis[moved]] - 1 - rank[moved]) * length
+        k0 = self.k0 if self.radial_law is None else self.radial_law(position)
+        vertices.data['position'][moved] = position
+        vertices.data['K'][moved] = self.axial_law(position) / length
+        vertices.data['k'][moved] = vertices.radius[moved] * 2 * pi * length * k0
+
+        # Keq of the axes from the highest order, the changes propagated to Keq_laterals of the branching points
+        Keq, Keq_laterals = vertices.data['Keq'], vertices.data['Keq_laterals']
+        for order in range(axes.order.max(), -1, -1):
+            group = updated[vertices.order[updated] == order]
+            if not len(group):
+                continue
+            # the updated vertices of an axis are the ranks 0 to size - 1, sorted axis after axis
+            size = np.bincount(axis[group], minlength=len(axes))
+            start = np.cumsum(size) - size
+            group[start[axis[group]] + rank[group]] = group.copy()
+            # the last vertex of each axis, and the Keq of the vertex following it
+            last = (start + size - 1)[size > 0]
+            following = vertices.successor[group[last]]
+            x = np.where(following >= 0, Keq[np.maximum(following, 0)], 0.)
+
+            previous = Keq[group]
+            Keq[group] = _axis_Keq(vertices.K[group], vertices.k[group] + Keq_laterals[group], last, x)
+            first = rank[group] == 0
+            if order > 0:
+                np.add.at(Keq_laterals, vertices.parent[group[first]], Keq[group[first]] - previous[first])
+
+        self.Keq = Keq[0]
+        self.Jv = self.Keq * (self.psi_e - self.psi_base)
+        return updated
+
+    def to_arrays(self):
+        """ Return the architecture as a RootArrays in breadth first order.
+
+        The vids are the creation index plus one, the arrays K, k and Keq are set as properties.
+        """
+        v = self.vertices
+        return RootArrays.from_parent(v.parent, edge_type=np.where(v.branch, '+', '<'), vids=np.arange(1, len(v) + 1),
+                                      order=v.order, length=v.length, radius=v.radius, position=v.position,
+                                      K=v.K, k=v.k, Keq=v.Keq)
+
+
+def _axis_Keq(K, c, last, x):
+    """ Equivalent conductances along axes.
+
+    Along an axis, Keq of a vertex is a linear fractional function of the Keq x of the next vertex:
+        Keq = K (x + c) / (x + K + c) = (K x + K c) / (x + K + c)
+    with c = k + the Keq of the laterals it bears. The axes are cut in chunks of about sqrt(size) vertices, laid
+    out as the columns of a 2D array. The coefficients [[K, K c], [1, K + c]] are composed row after row from
+    the tip side of the chunks, then Keq is carried from chunk to chunk: about 2 sqrt(size) vectorized steps and
+    O(n) operations, instead of one step per vertex.
+
+    :Parameters:
+        - `K`, `c` (array) - the vertices of the axes one after the other, each axis from its base
+        - `last` (array) - the index of the last vertex of each axis
+        - `x` (array) - the Keq of the vertex following the last vertex of each axis, 0 for a tip
+
+    :Returns:
+        - `Keq` (array)
+    """
+    n = len(K)
+    size = np.diff(np.append(-1, last))
+    width = max(1, int(np.sqrt(size.max())))
+    nb_chunks = (size + width - 1) // width
+    first_chunk = np.cumsum(nb_chunks) - nb_chunks
+
+    # the place of each vertex: its chunk and its distance to the tip side of the chunk, the rest is padded
+    # with the identity
+    q = np.repeat(last, size) - np.arange(n)
+    nb = nb_chunks.sum()
+    place = q % width * nb + np.repeat(first_chunk, size) + q // width
+    a, b, c_, d = np.zeros((4, width * nb))
+    a[:] = d[:] = 1.
+    a[place], b[place], c_[place], d[place] = K, K * c, 1., K + c
+    a, b, c_, d = (array.reshape(width, nb) for array in (a, b, c_, d))
+
+    for j in range(1, width):
+        e, f, g, h = a[j - 1], b[j - 1], c_[j - 1], d[j - 1]
+        a_, b_, g_, d_ = a[j], b[j], c_[j], d[j]
+        a[j], b[j], c_[j], d[j] = a_ * e + b_ * g, a_ * f + b_ * h, g_ * e + d_ * g, g_ * f + d_ * h
+        # the coefficients are positive, their scale does not change the function
+        scale = np.maximum(a[j], d[j])
+        a[j] /= scale; b[j] /= scale; c_[j] /= scale; d[j] /= scale
+
+    # the Keq following each chunk, from the tips
+    y = np.empty(nb)
+    y[first_chunk] = x
+    for m in range(1, nb_chunks.max()):
+        chunks = first_chunk[nb_chunks > m] + m
+        p = chunks - 1
+        y[chunks] = (a[-1, p] * y[p] + b[-1, p]) / (c_[-1, p] * y[p] + d[-1, p])
+
+    return ((a * y + b) / (c_ * y + d)).ravel()[place]
@@ -4,6 +4,10 @@ date: 2019-12-20
 
 Functions related to io process in hydroroot
 """
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
 import pandas as pd
 import numpy as np
 
@@ -13,72 +17,76 @@ from openalea.mtg.traversal import *
 
 from rsml import continuous, io
 
+from scipy.spatial import cKDTree
+
 from hydroroot import display
+from hydroroot.generator.measured_root import mtg_from_aqua_data
+from hydroroot.root_arrays import RootArrays
 
 
-def export_mtg_to_aqua_file(g, filename = "out.csv"):
+def export_mtg_to_aqua_file(g, filename = "out.csv", segment_length = 1.0e-4):
     """
     Export a MTG architecture in a csv file into format used by aquaporin team
     g: MTG
-    filename: the name of the output file
+    filename: the name of the output file or a file object opened in text mode
+    segment_length: length of the vertices in m, used if g has no 'length' property
 
           the format is: 3 columns separated by tab
          * 1st col: "distance_from_base_(mm)" distance in mm from base on the parent root where starts the lateral root
          * 2nd col: "lateral_root_length_(mm)" length in mm of the corresponding lateral root
          * 3d col: "order" = 1 if parent root is the primary root, = 1-n if the parent root is a lateral root that
-                            starts at the node n on the parent root
+                            starts at the node n on the parent root, 1-n-m for the lateral m of the lateral 1-n, etc.
 
-    It uses only the mtg properties 'position', 'order' and 'edge_type' because they are the only ones saved in
-    simulated architecture
-    At this stage (2019-12-20) only up to the 2d order
+    Each root bearing laterals ends with its tip: its length and a zero lateral length.
+    All the orders are exported. The distances are computed from the vertex lengths, as in
+    generator.measured_root.mtg_from_aqua_data, so that the MTG read from the file has the same topology.
+    The rows are written one axis after the other, using the axis index of RootArrays.
     """
-
-    results = {'distance_from_base_(mm)': [], 'lateral_root_length_(mm)': [], 'order': []}
-
-    v_base = next(g.component_roots_at_scale_iter(g.root, scale = g.max_scale()))
-
-    count = 0
-    for v in pre_order2(g, 1):
-        parent = g.parent(v)
-        if g.edge_type(v) == '+' and g.order(v) == 1:
-            # position is the length from tip so the total racine length is the 1st position on the racine
-            racine_length = g.property('position')[min(axis(g, parent))] * 1e3  # unit change: m to mm
-            results['distance_from_base_(mm)'].append(racine_length - g.property('position')[parent] * 1e3)
-
-            LR_length = g.property('position')[v] * 1e3
-            results['lateral_root_length_(mm)'].append(LR_length)
-            results['order'].append(1)
-
-    results['distance_from_base_(mm)'].append(racine_length)
-    results['lateral_root_length_(mm)'].append(0)
-    results['order'].append(1)
-
-    count = 0
-    count2 = 0
-    for v in pre_order2(g, 1):
-        parent = g.parent(v)
-        if g.edge_type(v) == '+' and g.order(v) == 1:
-            count2 = 0
-            count += 1
-            for v2 in pre_order2(g, v):
-                parent2 = g.parent(v2)
-                if g.edge_type(v2) == '+' and parent != parent2:
-                    racine_length = g.property('position')[min(axis(g, parent2))] * 1e3
-                    results['distance_from_base_(mm)'].append(racine_length - g.property('position')[parent2] * 1e3)
-
-                    LR_length = g.property('position')[v2] * 1e3
-                    results['lateral_root_length_(mm)'].append(LR_length)
-                    results['order'].append('-'.join((str(1), str(count))))
-
-                    count2 = count
-
-            if count == count2:
-                results['distance_from_base_(mm)'].append(racine_length)
-                results['lateral_root_length_(mm)'].append(0)
-                results['order'].append('-'.join((str(1), str(count))))
-
-    df = pd.DataFrame(results, columns = ['distance_from_base_(mm)', 'lateral_root_length_(mm)', 'order'])
-    df.to_csv(filename, sep = '\t', index = False)
+    arrays = RootArrays.from_mtg(g, properties = ('length',))
+    if arrays.length is None:
+        arrays.set('length', segment_length)
+    arrays.compute_axes()
+
+    # distance of each vertex from the start of its axis, accumulated from the branching point as done by
+    # mtg_from_aqua_data, the base of the primary root is at 0
+    axis_start = arrays.axis_ptr[:-1]
+    first = arrays.axis_vertices[axis_start[1:]]
+    distance = np.zeros(len(arrays))
+    distance[first] = arrays.length[first]
+    successor = arrays.axis_rank > 0
+    for lo, hi in arrays.levels(start = 1):
+        succ = successor[lo:hi]
+        distance[lo:hi][succ] = distance[arrays.parent[lo:hi][succ]] + arrays.length[lo:hi][succ]
+    axis_length = distance[arrays.axis_vertices[arrays.axis_ptr[1:] - 1]]
+
+    # the laterals of each axis sorted by distance from its base, i.e. by rank of the branching vertex
+    parent = arrays.parent[first]
+    laterals = np.lexsort((first, arrays.axis_rank[parent], arrays.axis[parent]))
+    lateral_axis = arrays.axis[first[laterals]]
+    lateral_ptr = np.searchsorted(arrays.axis[parent[laterals]], np.arange(len(axis_start) + 1))
+
+    db = (distance[parent[laterals]] * 1e3).tolist()
+    lr = (axis_length[lateral_axis] * 1e3).tolist()
+    tip = (axis_length * 1e3).tolist()
+    lateral_axis = lateral_axis.tolist()
+    lateral_ptr = lateral_ptr.tolist()
+
+    f = open(filename, 'w') if isinstance(filename, str) else filename
+    try:
+        f.write('distance_from_base_(mm)\tlateral_root_length_(mm)\torder\n')
+        code = {0: '1'}
+        for a in range(len(axis_start)):
+            lo, hi = lateral_ptr[a], lateral_ptr[a + 1]
+            if a > 0 and lo == hi:
+                # a lateral without lateral is given by its length only
+                continue
+            for count, i in enumerate(range(lo, hi)):
+                code[lateral_axis[i]] = '%s-%d' % (code[a], count + 1)
+                f.write('%r\t%r\t%s\n' % (db[i], lr[i], code[a]))
+            f.write('%r\t%r\t%s\n' % (tip[a], 0., code[a]))
+    finally:
+        if f is not filename:
+            f.close()
 
 def export_mtg_to_rsml(g_discrete, filename = None, segment_length = 1.0e-4):
     """
@@ -145,7 +153,7 @@ def export_mtg_to_rsml(g_discrete, filename = None, segment_length = 1.0e-4):
     else:
         return g
 
-def import_rsml_to_discrete_mtg(g_c, segment_length = 1.0e-4, resolution = 1.0e-4):
+def import_rsml_to_discrete_mtg(g_c, segment_length = 1.0e-4, resolution = 1.0e-4, legacy = False):
     # F. Bauget 2020-03-18 : RSML continuous from rsml2mtg()  to hydroroot disctrete copied from rsml
     # don't use parent node because rsml from other places don't have them but only coordinates of polylines
     """
@@ -155,95 +163,283 @@ def import_rsml_to_discrete_mtg(g_c, segment_length = 1.0e-4, resolution = 1.0e-
       - Add a sequence of segments to all axes from their `geometry` attribute
 
 
-    Based only on the coordinates of the polylines:
-        - calculation of the euclidian distance between points of polylines then add the segment needed
-        - to place a lateral on its parent axe, we calcul the distance between the 1st point of the lateral
-          and the vertices of the parent axe and take the shortest distance to select the branshing vertex on the axe
+    Based only on the coordinates of the polylines (see rsml_to_arrays):
+        - the number of segments of an axis is given by the arc length of its polyline
+        - to place a lateral on its parent axe, we take the vertex of the parent axe nearest to the 1st point
+          of the lateral
 
 
     :Parameters:
         - `g_c` (MTG) - the continuous MTG to convert
         - `segment_length` (Float) - the segment length in meter (m)
         - `resolution` (float) - the resolution of the polylines coordinates, in polylines unit per meter (unit/m)
+        - `legacy` (bool) - reproduce the discretization of the previous versions, see rsml_to_arrays
     """
+    arrays = rsml_to_arrays(g_c, segment_length = segment_length, resolution = resolution, legacy = legacy)
 
+    g = arrays.to_mtg()
+    vids = list(g.vertices(scale = g.max_scale()))
+    g.properties()['label'] = dict.fromkeys(vids, 'S')
+    g.properties()['base_length'] = {vids[0]: 0.}
 
-    geometry = g_c.property('geometry')
+    return g
 
-    _order = 0 # _order = 0 => 1st axe <=> primary root
 
-    g = MTG()
-    rid = seg = g.add_component(g.root)
+def rsml_to_arrays(g_c, segment_length = 1.0e-4, resolution = 1.0e-4, legacy = False):
+    """
+    Discretize the axes of a continuous MTG (e.g. read by rsml.rsml2mtg) into a RootArrays
+
+    Each axis of polyline arc length L is made of int(L / segment_length) segments (at least one), allocated as
+    one block and placed along the polyline every segment_length from its first point. The vertices of an axis
+    are indexed in a KD-tree (scipy.spatial.cKDTree) and a lateral is branched on the vertex of its parent axis
+    nearest to its 1st point.
+    The primary root starts with a base vertex at its 1st point. Other axes without parent are branched on
+    this base vertex.
+
+    With `legacy`, the vertices are the ones of the MTG traversal of the previous versions:
+        - an interval of length l of the polylines is made of int(l / segment_length) segments, at least one,
+          or of the same number of segments as the previous interval if l is 0
+        - a lateral is branched on the vertex of the parent axe at the polyline point found by a scan of the
+          distances to the 1st point of the lateral, stopped at the first one not decreasing: when the parent
+          axe curves back toward the lateral, the scan stops before the nearest point
+        - an axe without parent continues the previous axe
 
-    rnid = g.node(rid)
-    rnid.base_length = 0.
-    rnid.length = segment_length
-    rnid.label = 'S'
-    rnid.order = _order
-    rnid.edge_type = '<'
+    :Parameters:
+        - `g_c` (MTG) - the continuous MTG to convert
+        - `segment_length` (Float) - the segment length in meter (m)
+        - `resolution` (float) - the resolution of the polylines coordinates, in polylines unit per meter (unit/m)
+        - `legacy` (bool) - discretize the polylines interval by interval and branch the laterals by the scan
 
+    :Returns:
+        - RootArrays with the length property, vertices ordered from the base
+    """
+    parent, edge_type, order = [np.array([-1])], [np.array(['<'])], [np.array([0])]
+    size = [1]
+
+    def add(first, first_edge_type, n, _order):
+        # n vertices following each other from `first`, return their index
+        index = np.arange(size[0], size[0] + n)
+        _parent = index - 1
+        _parent[0] = first
+        _edge_type = np.full(n, '<')
+        _edge_type[0] = first_edge_type
+        parent.append(_parent)
+        edge_type.append(_edge_type)
+        order.append(np.full(n, _order))
+        size[0] += n
+        return index
+
+    if legacy:
+        _legacy_rsml_axes(g_c, segment_length, resolution, add)
+    else:
+        _rsml_axes(g_c, segment_length, resolution, add)
 
-    axe_segments = {}
+    parent = np.concatenate(parent)
+    return RootArrays.from_parent(parent, edge_type = np.concatenate(edge_type), order = np.concatenate(order),
+                                  length = np.full(len(parent), segment_length))
+
+
+def _rsml_axes(g_c, segment_length, resolution, add):
+    # the axes discretized by arc length, the laterals branched on the nearest vertex of their parent axe
+    geometry = g_c.property('geometry')
+
+    # for each axis: the index and the coordinates of its vertices, the KD-tree of the coordinates
+    vertices = {}
+    trees = {}
+    axis_order = {}
 
     for axe in continuous.toporder(g_c, g_c.max_scale()):
-        # get segment on parent branch
+        pos = np.array(geometry[axe], dtype = float).reshape(len(geometry[axe]), -1)
+        # arc length of the polyline points in metre
+        arc = np.concatenate(([0.], np.cumsum(np.sqrt(np.sum(np.diff(pos, axis = 0)**2, axis = 1))) * resolution))
+        # the tolerance avoids to loose a segment on a polyline which length is a multiple of segment_length
+        n = max(1, int(arc[-1] / segment_length + 1e-6))
+
         p_axe = g_c.parent(axe)
-        v = axe
-        _order = 0
-        while g_c.parent(v) is not None:
-            v = g_c.parent(v)
-            _order += 1
+        if p_axe is None:
+            _order = 0
+            if not vertices:
+                # the primary root: the base vertex at the 1st point, then the axis
+                vertices[axe] = (np.array([0]), pos[:1])
+                first_edge_type = '<'
+            else:
+                first_edge_type = '+'
+            branch = 0
+        else:
+            _order = axis_order[p_axe] + 1
+            if p_axe not in trees:
+                trees[p_axe] = cKDTree(vertices[p_axe][1])
+            distance, i = trees[p_axe].query(pos[0])
+            branch = vertices[p_axe][0][i]
+            first_edge_type = '+'
+        axis_order[axe] = _order
+
+        # vertices placed every segment_length along the polyline
+        s = np.arange(1, n + 1) * segment_length
+        coordinates = np.column_stack([np.interp(s, arc, x) for x in pos.T])
+        index = add(branch, first_edge_type, n, _order)
+
+        if axe in vertices:
+            index = np.concatenate((vertices[axe][0], index))
+            coordinates = np.concatenate((vertices[axe][1], coordinates))
+        vertices[axe] = (index, coordinates)
+
+
+def _legacy_rsml_axes(g_c, segment_length, resolution, add):
+    # the polylines discretized interval by interval, the laterals branched by the scan with an early stop
+    geometry = g_c.property('geometry')
 
+    # the vertex at each point of the polylines, (axe, i) for the point i
+    axe_segments = {}
+    axis_order = {}
+    seg = 0
+    n = 1
 
-        if p_axe is not None:
-            # parent axe
-            pos_axe = np.array(geometry[p_axe])
-            # vec_axe = np.diff(pos_axe,axis=0)**2
-            # _length_axe = np.sqrt(np.sum(vec_axe, axis = 1))*resolution
+    for axe in continuous.toporder(g_c, g_c.max_scale()):
+        p_axe = g_c.parent(axe)
+        _order = 0 if p_axe is None else axis_order[p_axe] + 1
+        axis_order[axe] = _order
 
         pos = np.array(geometry[axe])
-        vec = np.diff(pos,axis=0)**2
-        _length = np.sqrt(np.sum(vec, axis = 1)) * resolution
-
+        _length = np.sqrt(np.sum(np.diff(pos, axis = 0)**2, axis = 1)) * resolution
+        if _length[0] > 0.0:
+            n = max(1, int(_length[0]/segment_length))
 
         if _order == 0:
             # primary root
-            axe_segments[(axe, 0)] = seg # the first
-            if _length[0] > 0.0:
-                n = int(_length[0]/segment_length)
-                if n == 0: n = 1
-            for j in range(n):
-                seg = g.add_child(seg, edge_type='<', label = 'S', length = segment_length, order = _order)
-
+            axe_segments[(axe, 0)] = seg
+            seg = add(seg, '<', n, _order)[-1]
         else:
-            min = 1.0e10
-            for i, p in enumerate(pos_axe):
-                # search for the smallest distance between each nodes of p_axe and the 1st node of the child
-                distance = np.sqrt(np.sum((p-pos[0])**2.0))
-                if distance < min:
-                    min = distance
+            # the first point i > 1 of the parent axe not closer to the 1st point of the lateral than the previous
+            # one, the last point if none
+            min_distance = 1.0e10
+            for i, p in enumerate(geometry[p_axe]):
+                distance = np.sqrt(np.sum((np.asarray(p) - pos[0])**2))
+                if distance < min_distance:
+                    min_distance = distance
                 elif i > 1:
                     break
 
             seg = axe_segments[(p_axe, i - 1)] # branching vertex on parent axe
+            seg = add(seg, '+', 1, _order)[-1]
+            if n > 1:
+                seg = add(seg, '<', n - 1, _order)[-1]
 
-            seg = g.add_child(seg, edge_type='+', label = 'S', length = segment_length, order = _order)
-            if _length[0] > 0.0:
-                n = int(_length[0]/segment_length)
-                if n == 0: n = 1
-            for j in range(n-1):
-                seg = g.add_child(seg, edge_type='<', label = 'S', length = segment_length, order = _order)
-
-        axe_segments[(axe, 1 )] = seg
+        axe_segments[(axe, 1)] = seg
 
         # create the other segments
         for i, l in enumerate(_length[1:]):
             if l > 0.0:
-                n = int(l/segment_length)
-                if n == 0: n = 1
-            for j in range(int(n)):
-                seg = g.add_child(seg, edge_type = '<', label = 'S', length = segment_length, order = _order)
+                n = max(1, int(l/segment_length))
+            seg = add(seg, '<', n, _order)[-1]
             axe_segments[(axe, i + 2)] = seg
 
 
-    return g
+RSML_UNITS_TO_METRE = {'m': 1.0, 'cm': 1.0e-2, 'mm': 1.0e-3, 'um': 1.0e-6, 'nm': 1.0e-9}
+
+# extensions of the architecture files searched in a directory
+ARCHITECTURE_EXTENSIONS = ('.rsml', '.txt')
+
+
+def read_aqua_file(filename):
+    """
+    Read an architecture file in the format used by aquaporin team (see export_mtg_to_aqua_file)
+
+    :return: DataFrame with the columns of the file plus 'db' and 'lr', the distance from base and the
+             lateral root length in m, as expected by generator.measured_root.mtg_from_aqua_data
+    """
+    df = pd.read_csv(filename, sep = '\t', dtype = {'order': str})
+    df['db'] = df['distance_from_base_(mm)'] * 1.e-3
+    df['lr'] = df['lateral_root_length_(mm)'] * 1.e-3
+
+    return df
+
+
+def rsml_resolution(g_c):
+    """ Return the resolution of a continuous MTG read from a RSML file in metre per polyline unit."""
+    metadata = g_c.graph_properties()['metadata']
+    unit = metadata['unit']
+    if unit not in RSML_UNITS_TO_METRE:
+        raise ValueError('wrong unit in rsml file, unit must be one of the following: m, cm, mm, um, nm.')
+    return metadata['resolution'] * RSML_UNITS_TO_METRE[unit]
+
+
+def read_architecture(filename, segment_length = 1.0e-4):
+    """
+    Read an architecture file, RSML (.rsml) or aquaporin format (other extensions), into a RootArrays
+
+    :Parameters:
+        - `filename` (string) - the architecture file
+        - `segment_length` (float) - the segment length in meter (m)
+
+    :Returns:
+        - RootArrays with the length property
+    """
+    if filename.lower().endswith('.rsml'):
+        g_c = io.rsml2mtg(filename)
+        return rsml_to_arrays(g_c, segment_length = segment_length, resolution = rsml_resolution(g_c))
+
+    g = mtg_from_aqua_data(read_aqua_file(filename), segment_length = segment_length)
+    return RootArrays.from_mtg(g, properties = ('length',))
+
+
+def iter_architectures(source, segment_length = 1.0e-4, processes = None, max_pending = None):
+    """
+    Read architecture files in a pool of processes, generating the results as they are read
+
+    The files are submitted to the pool as the results are consumed, at most `max_pending` files are read
+    or waiting to be consumed at the same time, so that the memory used does not depend on the number of files.
+
+    :Parameters:
+        - `source` (string or list) - a glob pattern, a directory (all its .rsml and .txt files) or a list of files
+        - `segment_length` (float) - the segment length in meter (m)
+        - `processes` (int) - number of worker processes, all the cores if None, no pool if 1
+        - `max_pending` (int) - maximum number of files submitted and not consumed, 2 * processes if None
+
+    :Returns:
+        - generator of (filename, RootArrays), in completion order
+
+    :Example::
+
+        for filename, arrays in iter_architectures('data/*.rsml', processes = 8):
+            K, k = ArrayConductance(arrays, axial_law, k0 = k0).compute()
+            Keq, Jv = batch_flux(arrays, K, k)
+    """
+    filenames = architecture_files(source)
+
+    if processes == 1:
+        for filename in filenames:
+            yield _read_architecture((filename, segment_length))
+        return
+
+    if max_pending is None:
+        max_pending = 2 * (processes or os.cpu_count() or 1)
+
+    with ProcessPoolExecutor(processes) as executor:
+        tasks = iter(filenames)
+        pending = set()
+        while True:
+            for filename in tasks:
+                pending.add(executor.submit(_read_architecture, (filename, segment_length)))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when = FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def architecture_files(source):
+    """ Return the sorted list of files given by a glob pattern, a directory or a list of files."""
+    if isinstance(source, (list, tuple)):
+        return list(source)
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, f) for f in os.listdir(source)
+                      if f.lower().endswith(ARCHITECTURE_EXTENSIONS))
+    return sorted(glob.glob(source))
+
+
+def _read_architecture(task):
+    filename, segment_length = task
+    return filename, read_architecture(filename, segment_length = segment_length)
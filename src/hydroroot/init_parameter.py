@@ -45,7 +45,7 @@ class Parameters():
         - hydro: inputs related to the hydrodynamics
                 *  k0: float, the radial conductivity
                 *  axial_conductance_data: list of 2 list of float, the axial conductance vs distance from the tip
-        - solute: inputs related to solutes transport eather permating or not
+        - solute: inputs related to solutes transport eather permating or not (see solute.SoluteFlux)
                 *  J_s: float, active pumping rate
                 *  P_s: float, permeability coefficient
                 *  Cse: float, concentration of permeating solutes
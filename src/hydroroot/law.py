@@ -130,7 +130,7 @@ def histo_relative_law(x, y, size=5e-2, scale_x=1., scale_y=1e-3, scale=1e-4, pl
     Algorithm:
       - First, discretize the X values in different intervals of size `size`.
       - Compute the histogram from the set of points include in each interval.
-      - Return a function that compute a value in a given histogram
+      - Return a function that compute a value in a given histogram (a HistoLaw)
     """
 
     x = np.array(x) * scale_x
@@ -140,36 +140,107 @@ def histo_relative_law(x, y, size=5e-2, scale_x=1., scale_y=1e-3, scale=1e-4, pl
 
     X, values = discretize(x, y, size)
 
-    means = [np.mean(ys) for ys in values]
+    return HistoLaw(X, values, scale=scale, uniform=uniform)
+
+
+class HistoLaw(object):
+    """ Length law drawing a value in the histogram of the interval containing a position.
 
-    def return_law(position, scale=scale):
-        for i, x_min in enumerate(X):
-            if position*scale <= x_min:
-                break
-        index = max(i-1, 0)
-        points = values[index]
+    The intervals, their values, minimum, maximum and mean are computed once.
+    Calling the law with a position draws one length with the random module, as done since the first version
+    of histo_relative_law, so that the architectures generated with a given seed are unchanged.
+    HistoLaw.sample draws the lengths of many positions at once with a numpy.random.Generator,
+    with the same distributions.
+
+    :Parameters:
+        - `X` (list) - the lower bound of the intervals, sorted
+        - `values` (list) - the list of the values in each interval
+        - `scale` (float) - the length of a vertex, a position is position * scale and a length is length / scale
+        - `uniform` - how a length is drawn in an interval:
+            - False: one of the values of the interval
+            - True: uniformly between the minimum and the maximum of the values
+            - 'expo': exponential distribution with the mean of the values, bounded by their maximum
+    """
+
+    def __init__(self, X, values, scale=1e-4, uniform=False):
+        self.X = np.asarray(X, dtype=float)
+        self.values = [list(points) for points in values]
+        self.scale = scale
+        self.uniform = uniform
+
+        counts = np.array([len(points) for points in self.values])
+        self.counts = counts
+        self.ptr = np.concatenate(([0], np.cumsum(counts)))
+        self.flat_values = np.array([v for points in self.values for v in points], dtype=float)
+        self.means = np.array([np.mean(points) if points else 0. for points in self.values])
+        self.min = np.array([min(points) if points else 0. for points in self.values])
+        self.max = np.array([max(points) if points else 0. for points in self.values])
+
+    def index(self, positions, scale=None):
+        """ Return the index of the interval of each position (array)."""
+        if scale is None:
+            scale = self.scale
+        # the first X >= position * scale, the interval before, the before last one when there is none
+        i = np.searchsorted(self.X, np.asarray(positions) * scale, side='left')
+        i = np.minimum(i, len(self.X) - 1)
+        return np.maximum(i - 1, 0)
+
+    def __call__(self, position, scale=None):
+        if scale is None:
+            scale = self.scale
+        index = int(self.index(position, scale))
+        points = self.values[index]
         n = len(points)
 
         if n == 0:
             return 0.
 
-        if uniform=='expo':
-            v = means[index]
+        if self.uniform == 'expo':
+            v = self.means[index]
             length = random.expovariate(1. / v) if v > 0 else 0.
             # shoud not exceed the law, some randomness around length is done in markov, branching_variability
-            if length > max(points):
-                length = max(points)
-        elif not uniform:
-            index_value = random.randint(0,n-1)
+            if length > self.max[index]:
+                length = float(self.max[index])
+        elif not self.uniform:
+            index_value = random.randint(0, n - 1)
             length = points[index_value]
         else:
-            min_y = min(points)
-            max_y = max(points)
-            length = min_y + (max_y-min_y)*random.random()
+            min_y = float(self.min[index])
+            max_y = float(self.max[index])
+            length = min_y + (max_y - min_y) * random.random()
+
+        return length / scale
+
+    def sample(self, positions, rng=None, scale=None):
+        """ Draw a length for each position of the array `positions`.
+
+        :Parameters:
+            - `positions` (array) - the positions, in number of vertices
+            - `rng` (numpy.random.Generator) - the random generator, a new one if None
+            - `scale` (float) - the length of a vertex, self.scale if None
+
+        :Returns:
+            - array of the lengths, in number of vertices
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        if scale is None:
+            scale = self.scale
+        index = self.index(positions, scale)
+        n = self.counts[index]
+
+        if self.uniform == 'expo':
+            v = self.means[index]
+            length = rng.exponential(np.where(v > 0, v, 1.))
+            length = np.where(v > 0, np.minimum(length, self.max[index]), 0.)
+        elif not self.uniform:
+            last = np.maximum(len(self.flat_values) - 1, 0)
+            length = self.flat_values[np.minimum(self.ptr[index] + rng.integers(0, np.maximum(n, 1)), last)]
+        else:
+            length = self.min[index] + (self.max[index] - self.min[index]) * rng.random(np.shape(index))
 
-        return length/scale
+        return np.where(n > 0, length, 0.) / scale
 
-    return return_law
 
 def reference_relative_law(x, y, size=5e-2, scale_x=1., scale_y=1e-3):
     """ Return a length law from [0,1] to absolute length.
@@ -0,0 +1,204 @@
+"""
+Simulation of populations of generated root architectures.
+
+The parameters given as lists in a Parameters object (seed, primary_length, branching_delay, nude_length,
+radfold and axfold) define a Cartesian grid of simulations. Each architecture of the grid is generated once,
+then all its (axfold, radfold) conductances are solved together (see flux.batch_flux).
+The architectures are distributed over a pool of processes and the results are returned as rows of a table
+(list of dict) as soon as they are computed.
+
+Example::
+
+    parameter = Parameters()
+    parameter.read_file('parameters.yml')
+    df = run_population(parameter, processes=8)
+"""
+import itertools
+import random
+from math import pi
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from hydroroot import radius
+from hydroroot.cache import ArchitectureCache
+from hydroroot.conductance import ArrayConductance
+from hydroroot.flux import batch_flux
+from hydroroot.generator import markov
+from hydroroot.law import histo_relative_law
+from hydroroot.length import fit_law
+from hydroroot.root_arrays import RootArrays
+
+COLUMNS = ['seed', 'primary_length (m)', 'branching_delay (m)', 'nude_length (m)', 'axfold', 'radfold',
+           'length (m)', 'surface (m2)', 'Keq', 'Jv (uL/s)']
+
+# the parameters, other than the ones of the grid, used to build an architecture
+GENERATOR_PARAMETERS = ('length_data', 'segment_length', 'branching_variability', 'order_max', 'ref_radius',
+                        'order_decrease_factor')
+
+_caches = {}
+
+
+def architecture_grid(parameter):
+    """ Return the list of architectures to generate and the list of (axfold, radfold) to apply to each of them.
+
+    :Parameters:
+        - `parameter` (Parameters) - read from a yaml file, the list valued parameters define the grid
+
+    :Returns:
+        - list of (seed, primary_length, branching_delay, nude_length), a seed None is replaced by a random one
+        - list of (axfold, radfold)
+    """
+    archi = parameter.archi
+    seeds = [random.randrange(100000000) if seed is None else seed for seed in _as_list(archi['seed'])]
+
+    architectures = list(itertools.product(seeds,
+                                           _as_list(archi['primary_length']),
+                                           _as_list(archi['branching_delay']),
+                                           _as_list(archi['nude_length'])))
+    conductances = list(itertools.product(_as_list(parameter.output['axfold']),
+                                          _as_list(parameter.output['radfold'])))
+    return architectures, conductances
+
+
+def iter_population(parameter, processes=None, chunksize=1, cache=None):
+    """ Simulate the grid of architectures defined by `parameter`, generating the result rows as they are computed.
+
+    :Parameters:
+        - `parameter` (Parameters) - the model parameters
+        - `processes` (int) - number of worker processes, all the cores if None, no pool if 1
+        - `chunksize` (int) - number of architectures sent at once to a worker
+        - `cache` (str) - directory of an ArchitectureCache of the generated architectures, no cache if None
+
+    :Returns:
+        - generator of dict, one per (architecture, axfold, radfold), with the keys COLUMNS.
+          The rows of an architecture are contiguous, the architectures are in completion order.
+    """
+    architectures, conductances = architecture_grid(parameter)
+    tasks = [(architecture, conductances, parameter.archi, parameter.hydro, parameter.exp, cache)
+             for architecture in architectures]
+
+    if processes == 1:
+        for rows in map(simulate_architecture, tasks):
+            for row in rows:
+                yield row
+    else:
+        pool = Pool(processes)
+        try:
+            for rows in pool.imap_unordered(simulate_architecture, tasks, chunksize):
+                for row in rows:
+                    yield row
+        finally:
+            pool.terminate()
+
+
+def run_population(parameter, processes=None, chunksize=1, cache=None):
+    """ Simulate the grid of architectures defined by `parameter` and return the results as a DataFrame.
+
+    See iter_population for the parameters.
+    """
+    return pd.DataFrame(list(iter_population(parameter, processes, chunksize, cache)), columns=COLUMNS)
+
+
+def simulate_architecture(task):
+    """ Generate one architecture and compute its flux for a list of (axfold, radfold).
+
+    The architecture is built by compile_architecture, or read from the cache if any,
+    then the conductances are computed from axial_conductance_data and k0.
+
+    :Parameters:
+        - `task` (tuple) - ((seed, primary_length, branching_delay, nude_length), [(axfold, radfold), ...],
+                            archi, hydro, exp, cache) archi, hydro and exp are the dict of a Parameters object,
+                            cache is a directory or None
+
+    :Returns:
+        - list of dict, one row per (axfold, radfold)
+    """
+    (seed, primary_length, delta, nude_length), conductances, archi, hydro, exp, directory = task
+    segment_length = archi['segment_length']
+
+    if directory is None:
+        arrays = compile_architecture(seed, primary_length, delta, nude_length, archi)
+    else:
+        cache = _get_cache(directory)
+        key = architecture_key(seed, primary_length, delta, nude_length, archi)
+        arrays = cache.get_or_create(key, lambda: compile_architecture(seed, primary_length, delta, nude_length,
+                                                                       archi))
+    surface = (2 * pi * arrays.radius * arrays.length).sum()
+
+    K, k = ArrayConductance(arrays, fit_law(*hydro['axial_conductance_data']), k0=hydro['k0']).compute()
+
+    axfold, radfold = np.array(conductances).T
+    Keq, Jv = batch_flux(arrays, K, k, axfold=axfold, radfold=radfold,
+                         psi_e=exp['psi_e'], psi_base=exp['psi_base'])
+
+    _length = len(arrays) * segment_length
+    return [dict(zip(COLUMNS, (seed, primary_length, delta, nude_length, ax, rad, _length, surface, keq, jv)))
+            for ax, rad, keq, jv in zip(axfold, radfold, Keq, Jv)]
+
+
+def compile_architecture(seed, primary_length, delta, nude_length, archi):
+    """ Generate an architecture and compute its geometry as in the example scripts.
+
+    markov_binary_tree with the length laws of `length_data`, then ordered_radius, compute_length and
+    compute_relative_position, the last three computed on arrays.
+
+    :Returns:
+        - RootArrays with length, radius, position and relative_position
+    """
+    g = generate_architecture(seed, primary_length, delta, nude_length, archi)
+
+    arrays = RootArrays.from_mtg(g, properties=())
+    arrays.length = np.full(len(arrays), float(archi['segment_length']))
+    radius.ordered_radius_arrays(arrays, archi['ref_radius'], archi['order_decrease_factor'])
+    return radius.relative_position(arrays)
+
+
+def architecture_key(seed, primary_length, delta, nude_length, archi):
+    """ Return the ArchitectureCache key of the architecture built by compile_architecture."""
+    return ArchitectureCache.key(seed=seed, primary_length=primary_length, branching_delay=delta,
+                                 nude_length=nude_length,
+                                 **dict((name, archi[name]) for name in GENERATOR_PARAMETERS))
+
+
+def generate_architecture(seed, primary_length, delta, nude_length, archi):
+    """ Generate a MTG with markov_binary_tree and the length laws computed from archi['length_data']."""
+    segment_length = archi['segment_length']
+    length_data = archi['length_data']
+
+    length_max_secondary = length_data[0].LR_length_mm.max() * 1e-3  # in m
+    law_order1 = length_law(length_data[0], scale_x=primary_length / 100., scale=segment_length)
+    law_order2 = length_law(length_data[1], scale_x=length_max_secondary / 100., scale=segment_length)
+
+    return markov.markov_binary_tree(
+        nb_vertices=int(primary_length / segment_length),
+        branching_variability=archi['branching_variability'],
+        branching_delay=int(delta / segment_length),
+        length_law=[law_order1, law_order2],
+        nude_tip_length=int(nude_length / segment_length),
+        order_max=archi['order_max'],
+        seed=seed)
+
+
+def length_law(df, scale_x=1 / 100., scale_y=1., scale=1e-4, uniform='expo'):
+    """ Lateral length law from a DataFrame with the columns LR_length_mm and relative_distance_to_tip."""
+    x = df.relative_distance_to_tip.tolist()
+    y = df.LR_length_mm.tolist()
+
+    # size of the windows: 5%
+    size = 5. * scale_x
+
+    return histo_relative_law(x, y, size=size, scale_x=scale_x, scale_y=1.e-3 * scale_y, scale=scale,
+                              plot=False, uniform=uniform)
+
+
+def _get_cache(directory):
+    # one cache per process and directory, so that its counters are kept between the tasks
+    if directory not in _caches:
+        _caches[directory] = ArchitectureCache(directory)
+    return _caches[directory]
+
+
+def _as_list(parameter):
+    return parameter if isinstance(parameter, list) else [parameter]
@@ -10,6 +10,10 @@ from openalea.mtg import *
 from openalea.mtg import algo
 from math import pi
 
+import numpy as np
+
+from hydroroot.root_arrays import RootArrays
+
 
 
 
@@ -19,38 +23,77 @@ def cont_radius(g, r_base, r_tip):
 
     Set radius for elements of a mtg with an increase rate computed from
     given base and tip radius in a continuous way.
+
+    The computation is done on arrays, see cont_radius_arrays.
     """
     r_base, r_tip = float(r_base), float(r_tip)
 
     assert (r_base>r_tip),"Base radius should be greater than tip radius"
 
-    base = next(g.component_roots_iter(g.root))
-    base = g.node(base)
-    base.radius = r_base
-
-    _tips = dict((vid, g.order(vid)) for vid in g.vertices_iter(scale = g.max_scale()) if g.is_leaf(vid))
-    tips = {}
-    for tip,order in _tips.items():
-        tips.setdefault(order, []).append(tip)
-
-    max_order = max(tips)
-    for order in range(max_order+1):
-        for tip in tips[order]:
-            l = [g.node(vid) for vid in algo.axis(g,tip)]
-            n = len(l)
-            if n==1:  # only one segment in the lateral root - very young lateral
-                l[0].radius = r_tip
-            else :    # more than one segment in the lateral root
-                parent = l[0].parent()
-                r0 = parent.radius if parent else r_base
-                dr = (r0-r_tip)/(n-1)
-                for node in l:
-                    if node.radius==r0:  # keep the value of the base/junction radius for the first segment  of the lateral
-                        continue
-                    node.radius = node.parent().radius - dr  # decrease the radius from base to tip
+    arrays = _topology(g)
+    previous = g.property('radius')
+    arrays.radius = np.array([previous.get(v, np.nan) for v in arrays.vids.tolist()], dtype=float)
+    cont_radius_arrays(arrays, r_base, r_tip)
 
+    # the vertices without radius are the ones never reached from a tip
+    known = ~np.isnan(arrays.radius)
+    g.properties().setdefault('radius', {}).update(zip(arrays.vids[known].tolist(), arrays.radius[known].tolist()))
     return g
 
+def cont_radius_arrays(arrays, r_base, r_tip):
+    """ Compute the radius of each vertex of a RootArrays, decreasing continuously along each axis.
+
+    Same results as cont_radius: the base has the radius `r_base`. Along an axis of n vertices borne by a vertex
+    of radius r0 (`r_base` for the main axis), the radius decreases from r0 by steps of (r0 - r_tip) / (n - 1),
+    a vertex keeping its previous radius if it is equal to r0. An axis of one vertex has the radius `r_tip`.
+    The axes without any tip reachable through '<' edges from their first vertex keep their previous radius.
+
+    :Parameters:
+        - `arrays` (RootArrays) - the architecture, its radius array, if any, is the previous radius
+        - `r_base`, `r_tip` (float) - radius of the base and of the tips (in m)
+
+    :Returns:
+        - `arrays` with the radius array, NaN for the vertices without a previous radius and not computed
+    """
+    r_base, r_tip = float(r_base), float(r_tip)
+    n = len(arrays)
+    if arrays.axis is None:
+        arrays.compute_axes()
+    parent = arrays.parent
+    branch = arrays.edge_type == '+'
+    successor = ~branch
+    successor[0] = False
+
+    previous = np.full(n, np.nan) if arrays.radius is None else np.array(arrays.radius, dtype=float)
+    previous[0] = r_base
+
+    # the axes processed by cont_radius: the ones starting at the base or at a branch,
+    # of which the first vertex leads to a tip through '<' edges
+    leads_to_tip = arrays.nb_children() == 0
+    for lo, hi in arrays.levels(start=1, reverse=True):
+        kids = np.arange(lo, hi)[successor[lo:hi] & leads_to_tip[lo:hi]]
+        leads_to_tip[parent[kids]] = True
+    first = arrays.axis_vertices[arrays.axis_ptr[:-1]]
+    computed = (leads_to_tip[first] & (branch[first] | (first == 0)))[arrays.axis]
+    size = arrays.axis_size()[arrays.axis]
+
+    radius = previous.copy()
+    if computed[0]:
+        radius[0] = r_tip if size[0] == 1 else r_base
+    r0 = np.empty(n)
+    r0[0] = r_base
+    for lo, hi in arrays.levels(start=1):
+        p = parent[lo:hi]
+        r0[lo:hi] = np.where(branch[lo:hi], radius[p], r0[p])
+        dr = (r0[lo:hi] - r_tip) / np.maximum(size[lo:hi] - 1, 1)
+        value = np.where(previous[lo:hi] == r0[lo:hi], r0[lo:hi], radius[p] - dr)
+        value[size[lo:hi] == 1] = r_tip
+        done = computed[lo:hi]
+        radius[lo:hi][done] = value[done]
+
+    arrays.radius = radius
+    return arrays
+
 def discont_radius(g, r_base, r_tip):
     """ Compute the radius of each segment of a root system.
 
@@ -59,39 +102,65 @@ def discont_radius(g, r_base, r_tip):
 
     Radius can be discontinuous e.g. for a young/small lateral on an old root,
     the young root radius is very small initially compared to the old one.
+
+    The computation is done on arrays, see discont_radius_arrays.
     """
     r_base, r_tip = float(r_base), float(r_tip)
 
     assert (r_base>r_tip),"Base radius should be greater than tip radius"
 
-    base = next(g.component_roots_iter(g.root))
-    base = g.node(base)
-    base.radius = r_base
-
-    _tips = dict((vid, g.order(vid)) for vid in g.vertices_iter(scale = g.max_scale()) if not algo.sons(g,vid,EdgeType='<'))
-    tips = {}
-    for tip,order in _tips.items():
-        tips.setdefault(order, []).append(tip)
+    arrays = discont_radius_arrays(_topology(g), r_base, r_tip)
+    g.properties().setdefault('radius', {}).update(arrays.to_property(arrays.radius))
+    return g
 
-    max_order = max(tips)
+def discont_radius_arrays(arrays, r_base, r_tip):
+    """ Compute the radius of each vertex of a RootArrays, increasing at the same rate from every tip.
 
-    max_len = 0
-    for order in range(max_order+1):   #find the longest axis length among all axis
-        for tip in tips[order]:
-            max_len = max(max_len, len(list(algo.axis(g,tip))))
-    assert (max_len>1), "MTG too short for analysis"
-    growth_rate = (r_base-r_tip)/(max_len-1)    #define growth rate according to radius extremities of the longest axis
+    Same results as discont_radius: the growth rate is (r_base - r_tip) / (n - 1), n being the number of
+    vertices of the longest axis. The radius of a vertex is `r_tip` plus the growth rate times its number of
+    '<' edges to a tip. When several tips are reached, the one with the greatest vertex id is used.
 
-    # radius are computed from tips to bases according to growth rate extrapolated from absolute longest axis of the MTG
-    for order in range(max_order+1):
-        for tip in tips[order]:
-            node = g.node(tip)
-            node.radius = r_tip
-            while node and node.parent() and node.edge_type() != '+':
-                node.parent().radius = node.radius + growth_rate
-                node = node.parent()
+    :Parameters:
+        - `arrays` (RootArrays) - the architecture
+        - `r_base`, `r_tip` (float) - radius of the base of the longest axis and of the tips (in m)
 
-    return g
+    :Returns:
+        - `arrays` with the radius array
+    """
+    r_base, r_tip = float(r_base), float(r_tip)
+    n = len(arrays)
+    if arrays.axis is None:
+        arrays.compute_axes()
+    parent = arrays.parent
+    branch = arrays.edge_type == '+'
+    branch[0] = True
+    successor = ~branch
+
+    first = arrays.axis_vertices[arrays.axis_ptr[:-1]]
+    max_len = arrays.axis_size()[branch[first]].max()
+    assert (max_len>1), "MTG too short for analysis"
+    growth_rate = (r_base-r_tip)/(max_len-1)
+
+    # number of '<' edges between each vertex and the base or branch where its axis starts
+    depth = np.zeros(n, dtype=int)
+    for lo, hi in arrays.levels(start=1):
+        depth[lo:hi] = np.where(branch[lo:hi], 0, depth[parent[lo:hi]] + 1)
+
+    # the tip of each vertex, the one with the greatest vertex id which is reached through '<' edges
+    rank = np.empty(n, dtype=int)
+    rank[np.argsort(arrays.vids, kind='stable')] = np.arange(n)
+    tip = np.arange(n)
+    best = np.full(n, -1)
+    for lo, hi in arrays.levels(start=1, reverse=True):
+        kids = np.arange(lo, hi)[successor[lo:hi]]
+        np.maximum.at(best, parent[kids], rank[tip[kids]])
+        kids = kids[rank[tip[kids]] == best[parent[kids]]]
+        tip[parent[kids]] = tip[kids]
+
+    # same sums as the radius added one growth rate after the other from the tip
+    radius = np.cumsum(np.concatenate(([r_tip], np.full(depth.max(), growth_rate))))
+    arrays.radius = radius[depth[tip] - depth]
+    return arrays
 
 def ordered_radius(g, ref_radius=1e-4, order_decrease_factor=0.5):
     """ Compute the radius of each segment of a root system.
@@ -101,60 +170,34 @@ def ordered_radius(g, ref_radius=1e-4, order_decrease_factor=0.5):
     ref_radius: reference radius of the primary root (in m)
     order_decrease_factor: radius decrease factor applied when increasing order
 
+    The computation is done on arrays, see ordered_radius_arrays.
     """
-    #print 'entering MTG radius setting'
-    max_scale = g.max_scale()
-    ref_r, d_factor = float(ref_radius), float(order_decrease_factor)
-
-    base = next(g.component_roots_iter(g.root))
-
-    orders = algo.orders(g,scale=max_scale)
-    max_order = max(orders)
+    arrays = ordered_radius_arrays(_topology(g), ref_radius, order_decrease_factor)
+    g.properties()['radius'] = arrays.to_property(arrays.radius)
+    return g
 
-    radius_order = {}
-    for order in range(max_order+1):
-        radius_order[order] = ref_r*(d_factor**order)
+def ordered_radius_arrays(arrays, ref_radius=1e-4, order_decrease_factor=0.5):
+    """ Compute the radius of each vertex of a RootArrays from its order.
 
-    g_radius = g.properties()['radius'] = {}
-    for vid, order in orders.items():
-        g_radius[vid] = radius_order[order]
+    Same results as ordered_radius: the radius is ref_radius * order_decrease_factor**order.
 
-    #print 'exiting MTG radius setting'
-    return g
+    :Parameters:
+        - `arrays` (RootArrays) - the architecture
+        - `ref_radius` (float) - reference radius of the primary root (in m)
+        - `order_decrease_factor` (float) - radius decrease factor applied when increasing order
 
+    :Returns:
+        - `arrays` with the radius array
     """
-    max_scale = g.max_scale()
     ref_r, d_factor = float(ref_radius), float(order_decrease_factor)
+    radius_order = np.array([ref_r*(d_factor**order) for order in range(arrays.order.max()+1)])
+    arrays.radius = radius_order[arrays.order]
+    return arrays
 
-    base = g.component_roots_iter(g.root).next()
-
-    base = g.node(base)
-    base.radius = ref_r
-
-    def has_successor(vid):
-        return any(v for v in g.children(vid) if g.edge_type(v) =='<')
-
-    orders = algo.orders(g,scale=max_scale)
-    _tips = dict((vid, orders[vid]) for vid in g.vertices_iter(scale=max_scale) if not has_successor(vid))
-
-    tips = {}
-    for tip,order in _tips.iteritems():
-        tips.setdefault(order, []).append(tip)
-
-    max_order = max(tips)
-
-    # radius are applied from tips to bases and scaled according to root order
-    for order in range(max_order+1):
-        rad = ref_r*(d_factor**order)
-        for tip in tips[order]:
-            node = g.node(tip)
-            node.radius = rad
-            while node and node.parent() and node.edge_type() != '+':
-                node.parent().radius = node.radius
-                node = node.parent()
-
-    return g
-    """
+def _topology(g):
+    # the orders are computed from the edge types, as algo.orders
+    arrays = RootArrays.from_mtg(g, properties=())
+    return RootArrays(arrays.parent, edge_type=arrays.edge_type, vids=arrays.vids)
 
 def compute_length(g, length = 1.e-4):
     """ Set the length of each vertex of the MTG
@@ -200,33 +243,40 @@ def compute_volume(g):
     #print 'leaving volume computation'
     return g, volume
 
-def compute_relative_position(g):
+def compute_relative_position(g, arrays=None):
     """ Compute the position of each segment relative to the axis bearing it.
     Add the properties "position" and "relative_position" to the MTG.
+
+    The computation is done on arrays, see relative_position.
+    If `arrays` (RootArrays of g) is given, its length array is used and its position arrays are set.
     """
-    #print 'entering MTG node positionning computation'
-    scale = g.max_scale()
-    position = {}
-    position_measure = {}
-    axis_length = {}
-    length = g.property('length')
-    root_id = next(g.component_roots_at_scale_iter(g.root, scale=scale))
-    for vid in traversal.post_order2(g, root_id):
-        #sons = algo.sons(g,vid,EdgeType='<')
-        sons = [cid for cid in g.children(vid) if g.edge_type(cid) == '<']
-        position[vid] = position[sons[0]]+1 if sons else 0
-        position_measure[vid] = position[vid] * length[vid]
-        if g.edge_type(vid) == '+' or g.parent(vid) is None:
-            axis_length[vid] = position[vid]
-
-    relative_position = {}
-    for axis_id, _length in axis_length.items():
-        _length = float(max(1, _length))
-        for v in algo.local_axis(g,axis_id):
-            relative_position[v] = position[v] / _length
-
-    g.properties()['position'] = position_measure
-    g.properties()['relative_position'] = relative_position
-    #print 'exiting MTG node positionning computation'
+    if arrays is None:
+        arrays = RootArrays.from_mtg(g, properties=('length',))
+    relative_position(arrays)
+
+    g.properties()['position'] = arrays.to_property(arrays.position)
+    g.properties()['relative_position'] = arrays.to_property(arrays.get('relative_position'))
     return g
 
+def relative_position(arrays):
+    """ Compute the position of each vertex of a RootArrays relative to the axis bearing it.
+
+    The position is the number of vertices between the vertex and the tip of its axis, times its length.
+    The relative position is this number divided by the number of vertices of the axis minus one.
+    The axis index of `arrays` is computed if needed (see RootArrays.compute_axes).
+
+    :Parameters:
+        - `arrays` (RootArrays) - the architecture with the length array
+
+    :Returns:
+        - `arrays` with the position array and the relative_position property
+    """
+    if arrays.axis is None:
+        arrays.compute_axes()
+    size = arrays.axis_size()[arrays.axis]
+    position = size - 1 - arrays.axis_rank
+
+    arrays.position = position * arrays.length
+    arrays.set('relative_position', position / np.maximum(1, size - 1).astype(float))
+    return arrays
+
@@ -0,0 +1,304 @@
+"""
+Compact array representation of a root architecture.
+
+The topology and the properties of the finest scale of a MTG are stored as contiguous NumPy arrays
+(structure of arrays). The vertices are numbered in breadth first order from the base, so that:
+    - the parent of a vertex has a smaller index,
+    - the children of a vertex are contiguous (CSR like, see `child_ptr`),
+    - the vertices of a same depth are contiguous (see `level_ptr`).
+
+A RootArrays is built once per architecture, by RootArrays.from_mtg or RootArrays.from_parent, and may
+be reused by the computations working on arrays (e.g. hydroroot.flux.ArrayFlux).
+"""
+import numpy as np
+
+from openalea.mtg import MTG
+
+
+class RootArrays(object):
+    """ Structure of arrays of a root architecture.
+
+    :Attributes:
+        - `vids` (array) - the MTG vertex id of each index
+        - `parent` (array) - the index of the parent, -1 for the base
+        - `edge_type` (array) - '<' or '+', the edge type with the parent
+        - `child_ptr` (array) - the children of index i are the indices child_ptr[i] to child_ptr[i+1]
+        - `level_ptr` (array) - the vertices of depth d are the indices level_ptr[d] to level_ptr[d+1]
+        - `order` (array) - the number of '+' edges between the base and the vertex
+        - `length`, `radius`, `position` (array or None) - the corresponding MTG properties
+        - `properties` (dict) - other per vertex properties, name: array
+        - `axis`, `axis_rank`, `axis_ptr`, `axis_vertices` (array or None) - the axis index, see compute_axes
+    """
+    PROPERTIES = ('length', 'radius', 'position')
+
+    def __init__(self, parent, edge_type=None, vids=None, order=None, **properties):
+        """ Build a RootArrays from arrays already in breadth first order.
+
+        :Parameters:
+            - `parent` (array) - the index of the parent, -1 for the base, in breadth first order
+            - `edge_type` (array) - '<' or '+', if None the first child is a successor, the others are branches
+            - `vids` (array) - the vertex id of each index, if None 1, 2, ..., n
+            - `order` (array) - the order of each vertex, computed from edge_type if None
+            - `properties` - per vertex arrays, e.g. length=..., radius=...
+
+        Use RootArrays.from_parent when the arrays are not in breadth first order.
+        """
+        self.parent = np.asarray(parent, dtype=int)
+        n = len(self.parent)
+
+        self.vids = np.arange(1, n + 1) if vids is None else np.asarray(vids)
+
+        nb_children = np.bincount(self.parent[1:], minlength=n)
+        self.child_ptr = np.concatenate(([1], 1 + np.cumsum(nb_children)))
+
+        level_ptr = [0, 1]
+        while level_ptr[-1] < n:
+            level_ptr.append(self.child_ptr[level_ptr[-1]])
+        self.level_ptr = np.array(level_ptr)
+
+        if edge_type is None:
+            # the first child of a vertex is on the same axis
+            edge_type = np.full(n, '+')
+            edge_type[self.child_ptr[:-1][nb_children > 0]] = '<'
+            edge_type[0] = '<'
+        self.edge_type = np.asarray(edge_type, dtype='U1')
+
+        if order is None:
+            branch = (self.edge_type == '+').astype(int)
+            order = np.zeros(n, dtype=int)
+            for lo, hi in self.levels(start=1):
+                order[lo:hi] = order[self.parent[lo:hi]] + branch[lo:hi]
+        self.order = np.asarray(order, dtype=int)
+
+        self.length = self.radius = self.position = None
+        self.axis = self.axis_rank = self.axis_ptr = self.axis_vertices = None
+        self.properties = {}
+        for name, values in properties.items():
+            self.set(name, values)
+
+    def __len__(self):
+        return len(self.parent)
+
+    @classmethod
+    def from_parent(cls, parent, edge_type=None, vids=None, order=None, **properties):
+        """ Build a RootArrays from arrays in any topological order (the parent before its children).
+
+        The vertices are renumbered in breadth first order, the children keeping their relative order.
+        """
+        parent = np.asarray(parent, dtype=int)
+        n = len(parent)
+        if vids is None:
+            vids = np.arange(1, n + 1)
+
+        # rank of each vertex in the breadth first order, built level by level
+        rank = np.empty(n, dtype=int)
+        base = np.flatnonzero(parent < 0)
+        assert len(base) == 1, "One and only one base is expected"
+        rank[base] = 0
+        nb = 1
+        kids = np.argsort(parent, kind='stable')[1:]    # vertices grouped by parent, relative order kept
+        nb_children = np.bincount(parent[kids], minlength=n)
+        start = np.concatenate(([0], np.cumsum(nb_children)))
+        level = base
+        while len(level):
+            # level is in breadth first order, then so are the children grouped by parent
+            counts = nb_children[level]
+            if not counts.sum():
+                break
+            index = np.repeat(start[level], counts) + _ranges(counts)
+            level = kids[index]
+            rank[level] = np.arange(nb, nb + len(level))
+            nb += len(level)
+
+        new = np.empty(n, dtype=int)
+        new[rank] = np.arange(n)
+        new_parent = np.where(parent[new] < 0, -1, rank[np.maximum(parent[new], 0)])
+
+        def reorder(values):
+            return None if values is None else np.asarray(values)[new]
+
+        return cls(new_parent, edge_type=reorder(edge_type), vids=reorder(vids), order=reorder(order),
+                   **dict((name, reorder(values)) for name, values in properties.items()))
+
+    @classmethod
+    def from_mtg(cls, g, properties=('length', 'radius', 'position')):
+        """ Compile the finest scale of the MTG `g` into a RootArrays.
+
+        :Parameters:
+            - `g` (MTG) - the root architecture
+            - `properties` (list) - the names of the MTG properties to convert to arrays, missing ones are skipped
+        """
+        v_base = next(g.component_roots_at_scale_iter(g.root, scale=g.max_scale()))
+
+        vids = [v_base]
+        parent = [-1]
+        i = 0
+        while i < len(vids):
+            kids = g.children(vids[i])
+            vids.extend(kids)
+            parent.extend([i] * len(kids))
+            i += 1
+
+        edge_type = g.property('edge_type')
+        edge_type = [edge_type.get(v, '<') for v in vids]
+
+        order = g.property('order')
+        order = [order.get(v) for v in vids]
+        if None in order:
+            order = None
+
+        _properties = {}
+        for name in properties:
+            prop = g.property(name)
+            if prop:
+                _properties[name] = [prop[v] for v in vids]
+
+        return cls(parent, edge_type=edge_type, vids=vids, order=order, **_properties)
+
+    def to_mtg(self, properties=None):
+        """ Build a new MTG from the arrays.
+
+        The i-th vertex of the arrays is the i-th vertex created in the MTG.
+
+        :Parameters:
+            - `properties` (list) - the names of the arrays to set as MTG properties, if None all of them
+
+        :Returns:
+            - `g` (MTG) - with at least the properties edge_type and order
+        """
+        names = list(self.PROPERTIES) + list(self.properties)
+        if properties is not None:
+            names = [name for name in names if name in properties]
+        values = dict((name, self.get(name).tolist()) for name in names if self.get(name) is not None)
+        edge_type = self.edge_type.tolist()
+        order = self.order.tolist()
+        parent = self.parent.tolist()
+
+        g = MTG()
+        vids = [g.add_component(g.root, edge_type=edge_type[0], order=order[0],
+                                **dict((name, v[0]) for name, v in values.items()))]
+        for i in range(1, len(parent)):
+            vids.append(g.add_child(vids[parent[i]], edge_type=edge_type[i], order=order[i],
+                                    **dict((name, v[i]) for name, v in values.items())))
+        return g
+
+    def get(self, name):
+        """ Return the array of a property, None if it is not set."""
+        if name in self.PROPERTIES or name in ('order', 'edge_type'):
+            return getattr(self, name)
+        return self.properties.get(name)
+
+    def set(self, name, values):
+        """ Set the array of a property from an array, a scalar or a dict indexed by vertex id."""
+        values = self.as_array(values)
+        if name in self.PROPERTIES:
+            setattr(self, name, values)
+        else:
+            self.properties[name] = values
+
+    def as_array(self, values):
+        """ Return `values` (dict indexed by vertex id, array or scalar) as an array in the order of `vids`."""
+        if isinstance(values, dict):
+            return np.array([values[v] for v in self.vids.tolist()], dtype=float)
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 0:
+            return np.full(len(self), float(values))
+        return values
+
+    def to_property(self, values):
+        """ Return an array in the order of `vids` as a dict indexed by vertex id."""
+        return dict(zip(self.vids.tolist(), np.asarray(values).tolist()))
+
+    def update_mtg(self, g, names):
+        """ Write the arrays `names` as properties of the MTG `g` which vertices are `vids`."""
+        for name in names:
+            g.properties()[name] = self.to_property(self.get(name))
+        return g
+
+    def levels(self, start=0, reverse=False):
+        """ Iterate over the (lo, hi) bounds of the levels, from the base or from the deepest one."""
+        bounds = list(zip(self.level_ptr[start:-1], self.level_ptr[start + 1:]))
+        return reversed(bounds) if reverse else iter(bounds)
+
+    def sum_children(self, values, lo, hi):
+        """ Sum of `values` over the children of each vertex of the level [lo, hi).
+
+        `values` is either a vector of size n or a matrix of shape (n, m), one column per set of values.
+        """
+        c_lo, c_hi = self.child_ptr[lo], self.child_ptr[hi]
+        if values.ndim == 1:
+            return np.bincount(self.parent[c_lo:c_hi] - lo, weights=values[c_lo:c_hi], minlength=hi - lo)
+
+        if c_lo == c_hi:
+            return np.zeros((hi - lo,) + values.shape[1:])
+        # a row of zeros is appended so that the index of the vertices without children is valid
+        children = np.concatenate((values[c_lo:c_hi], np.zeros((1,) + values.shape[1:])))
+        starts = self.child_ptr[lo:hi] - c_lo
+        result = np.add.reduceat(children, starts, axis=0)
+        result[self.child_ptr[lo + 1:hi + 1] == self.child_ptr[lo:hi]] = 0.
+        return result
+
+    def compute_axes(self):
+        """ Compute the axis index: the axes are numbered and their vertices are stored contiguously.
+
+        An axis starts at the base or at a '+' edge, and follows the first '<' child of each vertex.
+        Sets the attributes:
+            - `axis` - the axis number of each vertex, 0 for the axis of the base, then in breadth first order
+            - `axis_rank` - the rank of each vertex in its axis, 0 for the first vertex
+            - `axis_ptr`, `axis_vertices` - the vertices of the axis a, from its first vertex to its tip, are
+              axis_vertices[axis_ptr[a]:axis_ptr[a+1]]
+
+        :Returns:
+            - self
+        """
+        n = len(self)
+        lt = np.flatnonzero(self.edge_type[1:] == '<') + 1
+        # the successor is the first '<' child, the other vertices start an axis
+        parents, first = np.unique(self.parent[lt], return_index=True)
+        successor = np.zeros(n, dtype=bool)
+        successor[lt[first]] = True
+
+        start = np.flatnonzero(~successor)
+        axis = np.empty(n, dtype=int)
+        axis[start] = np.arange(len(start))
+        axis_rank = np.zeros(n, dtype=int)
+        for lo, hi in self.levels(start=1):
+            succ = successor[lo:hi]
+            parent = self.parent[lo:hi][succ]
+            axis[lo:hi][succ] = axis[parent]
+            axis_rank[lo:hi][succ] = axis_rank[parent] + 1
+
+        self.axis = axis
+        self.axis_rank = axis_rank
+        self.axis_ptr = np.concatenate(([0], np.cumsum(np.bincount(axis, minlength=len(start)))))
+        self.axis_vertices = np.empty(n, dtype=int)
+        self.axis_vertices[self.axis_ptr[axis] + axis_rank] = np.arange(n)
+        return self
+
+    def axis_size(self):
+        """ Number of vertices of each axis."""
+        return np.diff(self.axis_ptr)
+
+    def axis_of(self, a):
+        """ The indices of the vertices of the axis `a`, from its first vertex to its tip."""
+        return self.axis_vertices[self.axis_ptr[a]:self.axis_ptr[a + 1]]
+
+    def nb_children(self):
+        """ Number of children of each vertex."""
+        return np.diff(self.child_ptr)
+
+    def children(self, i):
+        """ The indices of the children of the index `i`."""
+        return np.arange(self.child_ptr[i], self.child_ptr[i + 1])
+
+    def index(self):
+        """ Return a dict vertex id: index."""
+        return dict((v, i) for i, v in enumerate(self.vids.tolist()))
+
+
+def _ranges(counts):
+    """ Concatenation of arange(c) for c in counts."""
+    counts = np.asarray(counts)
+    total = counts.sum()
+    ends = np.cumsum(counts)
+    return np.arange(total) - np.repeat(ends - counts, counts)
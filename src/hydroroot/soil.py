@@ -0,0 +1,213 @@
+"""
+Water potential of the soil around the roots.
+
+The soil is described either by a depth profile (DepthProfile) or by a regular 3D grid (SoilGrid), the grid
+may be a memory mapped file so that a large field is not loaded in memory.
+The potential is interpolated at all the vertices at once, and set as the per vertex `psi_e` used by the
+solvers when psi_e is None (see flux.ArrayFlux).
+
+The interpolation is split in two steps: the stencil (indices and weights of the grid nodes around each
+vertex) only depends on the architecture, it is computed once and applied to as many soil fields as needed.
+A field may also hold several scenarios in its last dimension, the potential is then of shape (n, nb_scenarios)
+as expected by flux.SparseFlux.solve.
+
+Example::
+
+    soil = DepthProfile([0., 0.05, 0.2], [0.4, 0.3, 0.1])
+    arrays.set('psi_e', soil(vertex_depth(arrays)))
+    f = flux.ArrayFlux(g, Jv, None, psi_base, True, arrays=arrays)
+
+    # many drying scenarios of a grid stored on disk
+    soil = SoilGrid.load('psi.npy', origin=(-0.1, -0.1, 0.), spacing=1e-3)
+    stencil = soil.stencil(vertex_position(arrays))
+    for psi in scenarios:
+        psi_e = soil.interpolate(stencil, psi)
+"""
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+class SoilField(ABC):
+    """ Soil water potential interpolated linearly between the nodes of a grid.
+
+    Abstract base of the soil descriptions, which define `stencil` and the number `ndim` of dimensions of the grid.
+
+    Outside of the grid the potential is the one of the nearest border.
+
+    :Attributes:
+        - `psi` (array) - the water potential at the nodes in MPa, the first dimensions are the ones of the grid,
+            the others (if any) are the scenarios
+    """
+    ndim = 1
+
+    def __init__(self, psi):
+        self.psi = psi
+
+    @abstractmethod
+    def stencil(self, positions):
+        """ Return the (index, weight) of the grid nodes around each position, both of shape (n, 2**ndim).
+
+        `index` is the index of the node in the flattened grid.
+        """
+
+    def interpolate(self, stencil, psi=None):
+        """ Interpolate the water potential on a stencil.
+
+        :Parameters:
+            - `stencil` (tuple) - the (index, weight) returned by `stencil`
+            - `psi` (array) - a field with the same grid as `self.psi`, if None `self.psi`
+
+        :Returns:
+            - the water potential, array of shape (n,) or (n, nb_scenarios)
+        """
+        psi = self.psi if psi is None else psi
+        index, weight = stencil
+        # only the nodes of the stencil are read from a memory mapped field
+        nodes = psi.reshape((-1,) + psi.shape[self.ndim:])[index]
+        return np.einsum('ij,ij...->i...', weight, nodes)
+
+    def __call__(self, positions, psi=None):
+        """ Return the water potential at `positions`, see `stencil` and `interpolate`."""
+        return self.interpolate(self.stencil(positions), psi)
+
+
+class DepthProfile(SoilField):
+    """ Water potential as a function of the depth.
+
+    :Parameters:
+        - `depth` (array) - increasing depths of the profile in m
+        - `psi` (array) - the water potential at each depth in MPa, shape (nb_depths,)
+            or (nb_depths, nb_scenarios)
+    """
+
+    def __init__(self, depth, psi):
+        self.depth = np.asarray(depth, dtype=float)
+        SoilField.__init__(self, np.asarray(psi, dtype=float))
+        assert len(self.depth) == len(self.psi), "one water potential per depth is expected"
+
+    def stencil(self, depth):
+        """ Return the (index, weight) of the two depths of the profile around each depth in `depth`."""
+        depth = np.asarray(depth, dtype=float)
+        i = np.searchsorted(self.depth, depth, side='right') - 1
+        return _linear(self.depth, i, depth)
+
+
+class SoilGrid(SoilField):
+    """ Water potential on a regular 3D grid.
+
+    :Parameters:
+        - `psi` (array) - the water potential in MPa, shape (nx, ny, nz) or (nx, ny, nz, nb_scenarios),
+            may be a numpy.memmap
+        - `origin` (tuple) - the coordinates of the node (0, 0, 0) in m
+        - `spacing` (float or tuple) - the distance between two nodes along each axis in m
+    """
+    ndim = 3
+
+    def __init__(self, psi, origin=(0., 0., 0.), spacing=1e-3):
+        SoilField.__init__(self, psi)
+        self.origin = np.asarray(origin, dtype=float)
+        self.spacing = np.broadcast_to(np.asarray(spacing, dtype=float), (3,))
+
+    @classmethod
+    def load(cls, filename, origin=(0., 0., 0.), spacing=1e-3, shape=None, dtype=float):
+        """ Map a grid stored on disk without reading it.
+
+        :Parameters:
+            - `filename` (str) - a .npy file, or a raw binary file if `shape` is given
+            - `shape` (tuple) - the shape of a raw binary file
+            - `dtype` - the type of the values of a raw binary file
+        """
+        if shape is None:
+            psi = np.load(filename, mmap_mode='r')
+        else:
+            psi = np.memmap(filename, dtype=dtype, mode='r', shape=tuple(shape))
+        return cls(psi, origin=origin, spacing=spacing)
+
+    def stencil(self, positions):
+        """ Return the (index, weight) of the 8 grid nodes around each position.
+
+        :Parameters:
+            - `positions` (array) - the coordinates of the vertices in m, shape (n, 3)
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+        shape = self.psi.shape[:3]
+        t = (positions - self.origin) / self.spacing
+
+        index = np.zeros((len(positions), 1), dtype=np.intp)
+        weight = np.ones((len(positions), 1))
+        for axis in range(3):
+            nodes = np.arange(shape[axis], dtype=float)
+            i = np.floor(t[:, axis]).astype(np.intp)
+            _index, _weight = _linear(nodes, i, t[:, axis])
+            # the corners of the cell, combined axis after axis
+            index = (index[:, :, np.newaxis] * shape[axis] + _index[:, np.newaxis, :]).reshape(len(positions), -1)
+            weight = (weight[:, :, np.newaxis] * _weight[:, np.newaxis, :]).reshape(len(positions), -1)
+        return index, weight
+
+
+def _linear(nodes, i, x):
+    """ Index and weight of the nodes i and i + 1 for a linear interpolation at x, constant outside the nodes."""
+    last = len(nodes) - 1
+    i0 = np.clip(i, 0, max(last - 1, 0))
+    i1 = np.minimum(i0 + 1, last)
+    step = nodes[i1] - nodes[i0]
+    w = np.clip((x - nodes[i0]) / np.where(step > 0., step, 1.), 0., 1.)
+    return np.column_stack((i0, i1)), np.column_stack((1. - w, w))
+
+
+def vertex_depth(arrays, angles=(0., 45.), base_depth=0.):
+    """ Depth of the end of each vertex, for architectures without coordinates.
+
+    The axes are straight lines: an axis of order o makes the angle angles[o] (in degree) with the vertical,
+    the last angle is used for the higher orders.
+
+    :Parameters:
+        - `arrays` (RootArrays) - the root architecture with the length property
+        - `angles` (list) - the angle with the vertical of each order in degree
+        - `base_depth` (float) - the depth of the start of the base vertex in m
+
+    :Returns:
+        - `depth` (array) - in m, positive downward
+    """
+    angles = np.radians(np.asarray(angles, dtype=float))
+    dz = arrays.length * np.cos(angles[np.minimum(arrays.order, len(angles) - 1)])
+
+    depth = np.empty(len(arrays))
+    depth[0] = base_depth + dz[0]
+    parent = arrays.parent
+    for lo, hi in arrays.levels(start=1):
+        depth[lo:hi] = depth[parent[lo:hi]] + dz[lo:hi]
+    return depth
+
+
+def vertex_position(arrays, angles=(0., 45.), base=(0., 0., 0.)):
+    """ Coordinates of the end of each vertex, for architectures without coordinates.
+
+    The axes are straight lines at the angles of `vertex_depth` with the vertical, the azimuth of the axis a
+    being a times the golden angle so that the laterals are spread around their parent. The z coordinate is
+    the depth of `vertex_depth`.
+
+    :Parameters:
+        - `arrays` (RootArrays) - the root architecture with the length property
+        - `angles` (list) - the angle with the vertical of each order in degree
+        - `base` (tuple) - the coordinates of the start of the base vertex in m
+
+    :Returns:
+        - `position` (array) - in m, shape (n, 3), the z axis is positive downward
+    """
+    angles = np.radians(np.asarray(angles, dtype=float))
+    angle = angles[np.minimum(arrays.order, len(angles) - 1)]
+    if arrays.axis is None:
+        arrays.compute_axes()
+    azimuth = arrays.axis * np.pi * (3. - np.sqrt(5.))
+    step = arrays.length[:, np.newaxis] * np.column_stack((np.sin(angle) * np.cos(azimuth),
+                                                           np.sin(angle) * np.sin(azimuth),
+                                                           np.cos(angle)))
+
+    position = np.empty((len(arrays), 3))
+    position[0] = np.asarray(base, dtype=float) + step[0]
+    parent = arrays.parent
+    for lo, hi in arrays.levels(start=1):
+        position[lo:hi] = position[parent[lo:hi]] + step[lo:hi]
+    return position
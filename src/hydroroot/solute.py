@@ -0,0 +1,245 @@
+"""
+Coupled water and solute transport.
+
+Extension of the flux computation (see flux.SparseFlux) to the osmotic effect of the solutes, with the
+parameters of the `solute` block of init_parameter.Parameters. The unknowns of each vertex are the xylem water
+potential psi_in and the xylem solute concentration C.
+
+Radial fluxes, from the outside to the xylem of the vertex v of surface A = 2 pi radius length:
+    - water: j = k (psi_e - psi_in - RT Ce + Sigma RT (C - Cse))
+    - solutes: js = A (J_s + P_s (Cse - C)) + (1 - Sigma) j Cse
+Axial fluxes, from the vertex to its parent, the solutes being carried by the water:
+    - water: J_out = K (psi_in - psi_out)
+    - solutes: J_out C
+And the conservation at each vertex:
+    - water: J_out - j - sum(J_out[c] for c in children) = 0
+    - solutes: J_out C - js - sum(J_out[c] C[c] for c in children) = 0
+
+The water flows toward the base (J_out > 0). With Ce = Cse = J_s = P_s = 0 the concentration is 0 and the
+solution is the one of the water transport alone.
+
+Units: the water potentials in MPa, the water fluxes in microL/s, the concentrations in mol/m3 (mM) then the
+solute fluxes in nmol/s, J_s in nmol/s/m2 and P_s in microL/s/m2 (1e-9 m/s).
+"""
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+# gas constant in MPa m3 / mol / K: R T is the osmotic pressure (MPa) of 1 mol/m3
+R = 8.314e-6
+
+
+class SoluteFlux(object):
+    """Compute the water potentials, the solute concentrations and the fluxes by a Newton iteration.
+
+    The equations of a vertex only involve its parent and its children: with the unknowns (psi_in, C) of each
+    vertex ordered from the tips to the base, the LU factorization of the Jacobian has no fill-in and each
+    iteration costs O(n), as in flux.SparseFlux.
+    The water conservation is linear and the solute conservation is bilinear (J_out C), so that a few iterations
+    are needed from the solution of close conditions: the last solution is the initial guess of the next
+    :meth:`solve`.
+
+    :Attributes:
+        - `iterations` (int) - the number of Newton iterations of the last solve
+        - `residuals` (list) - the max norm of the water and solute residuals, (water, solute), before each
+            iteration and at the solution
+    """
+
+    def __init__(self, arrays, K, k, J_s=0., P_s=0., Cse=0., Ce=0., Sigma=1., temperature=298.):
+        """
+        :Parameters:
+            - `arrays` (RootArrays) - the root architecture with the radius and length properties
+            - `K` (dict or array) - axial conductance, arrays are in the order of `arrays.vids`
+            - `k` (dict or array) - lateral conductance, arrays are in the order of `arrays.vids`
+            - `J_s` (float) - active pumping rate in nmol/s/m2
+            - `P_s` (float) - permeability coefficient in microL/s/m2
+            - `Cse` (float) - concentration of the permeating solutes outside the roots in mol/m3
+            - `Ce` (float) - concentration of the non-permeating solutes outside the roots in mol/m3
+            - `Sigma` (float) - reflection coefficient of the permeating solutes
+            - `temperature` (float) - in K
+
+        :Example:
+
+            solver = SoluteFlux.from_parameters(arrays, K, k, parameter)
+            for psi_e in (0.2, 0.3, 0.4):
+                solver.solve(psi_e, 0.101325)
+                print(solver.Jv, solver.iterations)
+        """
+        self.arrays = arrays
+        self.K = arrays.as_array(K)
+        self.k = arrays.as_array(k)
+        self.surface = 2. * np.pi * arrays.radius * arrays.length
+        self.J_s = J_s
+        self.P_s = P_s
+        self.Cse = Cse
+        self.Ce = Ce
+        self.Sigma = Sigma
+        self.RT = R * temperature
+
+        n = len(arrays)
+        # unknowns of vertex i: 2 rank[i] for psi_in and 2 rank[i] + 1 for C, tips first, base last
+        rank = n - 1 - np.arange(n)
+        self._psi = 2 * rank
+        self._C = 2 * rank + 1
+        self.psi_in = None
+        self.C = None
+        self.iterations = 0
+        self.residuals = []
+
+    @classmethod
+    def from_parameters(cls, arrays, K, k, parameter, temperature=298.):
+        """ Build a SoluteFlux from the `solute` block of an init_parameter.Parameters."""
+        solute = parameter.solute
+        return cls(arrays, K, k, J_s=solute['J_s'], P_s=solute['P_s'], Cse=solute['Cse'], Ce=solute['Ce'],
+                   Sigma=solute['Sigma'], temperature=temperature)
+
+    def fluxes(self, psi_in, C, psi_e, psi_base):
+        """ Return the fluxes (j, js, J_out) for the unknowns (psi_in, C)."""
+        parent = self.arrays.parent
+        psi_out = np.empty_like(psi_in)
+        psi_out[0] = psi_base
+        psi_out[1:] = psi_in[parent[1:]]
+
+        j = self.k * (psi_e - psi_in - self.RT * self.Ce + self.Sigma * self.RT * (C - self.Cse))
+        js = self.surface * (self.J_s + self.P_s * (self.Cse - C)) + (1. - self.Sigma) * j * self.Cse
+        J_out = self.K * (psi_in - psi_out)
+        return j, js, J_out
+
+    def residual(self, psi_in, C, psi_e, psi_base):
+        """ Return the residuals of the water and solute conservation at each vertex."""
+        return self._balance(C, *self.fluxes(psi_in, C, psi_e, psi_base))
+
+    def _balance(self, C, j, js, J_out):
+        n = len(self.arrays)
+        children = self.arrays.parent[1:]
+        water = J_out - j - np.bincount(children, weights=J_out[1:], minlength=n)
+        solute = J_out * C - js - np.bincount(children, weights=J_out[1:] * C[1:], minlength=n)
+        return water, solute
+
+    def jacobian(self, psi_in, C, psi_base):
+        """ Return the Jacobian of the residuals, the unknowns and the equations ordered from the tips."""
+        arrays = self.arrays
+        n = len(arrays)
+        parent = arrays.parent[1:]
+        child = np.arange(1, n)
+        K, k = self.K, self.k
+        RT, Sigma, Cse = self.RT, self.Sigma, self.Cse
+        _psi, _C = self._psi, self._C
+
+        J_out = np.empty(n)
+        J_out[0] = K[0] * (psi_in[0] - psi_base)
+        J_out[1:] = K[1:] * (psi_in[1:] - psi_in[parent])
+
+        rows, cols, values = [], [], []
+
+        def add(r, c, v):
+            rows.append(r)
+            cols.append(c)
+            values.append(np.broadcast_to(v, np.shape(r)))
+
+        sum_K = np.bincount(parent, weights=K[1:], minlength=n)
+        sum_KC = np.bincount(parent, weights=K[1:] * C[1:], minlength=n)
+
+        # water conservation of vertex v
+        add(_psi, _psi, K + k + sum_K)
+        add(_psi, _C, -k * Sigma * RT)
+        add(_psi[child], _psi[parent], -K[1:])
+        add(_psi[parent], _psi[child], -K[1:])
+
+        # solute conservation of vertex v, dj/dpsi_in = -k and dj/dC = k Sigma RT
+        add(_C, _psi, K * C + (1. - Sigma) * Cse * k + sum_KC)
+        add(_C, _C, J_out + self.surface * self.P_s - (1. - Sigma) * Cse * k * Sigma * RT)
+        add(_C[child], _psi[parent], -K[1:] * C[1:])
+        add(_C[parent], _psi[child], -K[1:] * C[1:])
+        add(_C[parent], _C[child], -J_out[1:])
+
+        return sparse.csc_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                                 shape=(2 * n, 2 * n))
+
+    def factorize(self, psi_in, C, psi_base):
+        """ LU factorization of the Jacobian in the tips first order, without pivoting so that there is no fill-in."""
+        return splu(self.jacobian(psi_in, C, psi_base), permc_spec='NATURAL', diag_pivot_thresh=0.)
+
+    def initial_guess(self, psi_e, psi_base):
+        """ Solution of the water transport for the concentration of the pumped solutes.
+
+        C = Cse + sqrt(A J_s / (k Sigma RT)), the concentration at which the water drawn by the osmotic gradient
+        carries away the solutes pumped in the vertex. Without water flow nor permeability (P_s = 0), C = Cse
+        would give a singular Jacobian: no water flux to carry the solutes, and no concentration to draw it.
+        """
+        n = len(self.arrays)
+        drive = self.k * self.Sigma * self.RT
+        C = self.Cse + np.sqrt(self.surface * max(self.J_s, 0.) / np.where(drive > 0., drive, np.inf))
+        psi_in = np.full(n, float(psi_base))
+        # the water conservation is linear in psi_in: one Newton step with C fixed
+        water, solute = self.residual(psi_in, C, psi_e, psi_base)
+        rows = self._psi[::-1]
+        # symmetric and diagonally dominant: no pivoting
+        matrix = self.jacobian(psi_in, C, psi_base)[rows][:, rows]
+        lu = splu(matrix.tocsc(), permc_spec='NATURAL', diag_pivot_thresh=0., options=dict(SymmetricMode=True))
+        psi_in -= lu.solve(water[::-1])[::-1]
+        return psi_in, C
+
+    def solve(self, psi_e=0.4, psi_base=0.101325, tol=1e-10, max_iter=50, warm_start=True):
+        """ Compute the water potentials, the concentrations and the fluxes for the given boundary conditions.
+
+        :Parameters:
+            - `psi_e` - hydric potential outside the roots in MPa, float or per vertex array
+            - `psi_base` - hydric potential at the root base in MPa
+            - `tol` (float) - relative tolerance on the residuals, to the largest water and solute fluxes,
+                or on the Newton steps of psi_in and C
+            - `max_iter` (int) - maximum number of iterations
+            - `warm_start` (bool) - start from the last solution if any
+
+        Set the arrays `psi_in`, `psi_out`, `C`, `j`, `js`, `J_out`, `Js_out` (the solute flux to the parent),
+        `Jv` the water flux at the base, and `iterations` and `residuals`.
+
+        :Returns:
+            - `psi_in` (array)
+        """
+        n = len(self.arrays)
+        if warm_start and self.psi_in is not None:
+            psi_in, C = self.psi_in.copy(), self.C.copy()
+        else:
+            psi_in, C = self.initial_guess(psi_e, psi_base)
+
+        self.residuals = []
+        self.iterations = 0
+        small_step = False
+        while True:
+            j, js, J_out = self.fluxes(psi_in, C, psi_e, psi_base)
+            water, solute = self._balance(C, j, js, J_out)
+            norms = np.abs(water).max(), np.abs(solute).max()
+            self.residuals.append(norms)
+            if small_step or (norms[0] <= tol * np.abs(J_out).max() and norms[1] <= tol * np.abs(J_out * C).max()):
+                break
+            if self.iterations == max_iter:
+                raise RuntimeError('SoluteFlux: no convergence after %d iterations, residuals %s'
+                                   % (max_iter, self.residuals[-1]))
+
+            rhs = np.empty(2 * n)
+            rhs[self._psi] = water
+            rhs[self._C] = solute
+            step = self.factorize(psi_in, C, psi_base).solve(rhs)
+            psi_in -= step[self._psi]
+            C -= step[self._C]
+            self.iterations += 1
+            small_step = ((np.abs(step[self._psi]) <= tol * (1. + np.abs(psi_in))).all() and
+                          (np.abs(step[self._C]) <= tol * (1. + np.abs(C))).all())
+
+        self.psi_in = psi_in
+        self.psi_out = np.concatenate(([psi_base], psi_in[self.arrays.parent[1:]]))
+        self.C = C
+        self.j = j
+        self.js = js
+        self.J_out = J_out
+        self.Js_out = J_out * C
+        self.Jv = J_out[0]
+
+        return psi_in
+
+    def update_mtg(self, g):
+        """ Write the results as the MTG properties 'psi_in', 'psi_out', 'C', 'j', 'js' and 'J_out'."""
+        for name in ('psi_in', 'psi_out', 'C', 'j', 'js', 'J_out'):
+            g.properties()[name] = self.arrays.to_property(getattr(self, name))
+        return g
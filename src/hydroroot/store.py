@@ -0,0 +1,181 @@
+"""
+Binary store of root architectures.
+
+A store file holds a collection of architectures in the array representation (see root_arrays.RootArrays):
+the topology and the per vertex properties of each plant are written as typed columns, which are read back
+through a memory map. Opening a store only reads its index, the columns of a plant are loaded from the disk
+when they are used, and the processes opening the same store share the same pages of memory.
+
+File layout (little endian):
+    - header: the magic bytes b'HYDROOT', a null byte, the format version (uint32) and 4 reserved bytes
+    - the columns of each plant, each one aligned on 64 bytes
+    - the index: a JSON document giving, for each plant, its number of vertices, its metadata and
+      the dtype and offset of its columns
+    - footer: the offset and the size of the index (2 uint64)
+
+Example::
+
+    with StoreWriter('population.hrs') as writer:
+        for seed in seeds:
+            writer.append(RootArrays.from_mtg(generate(seed)), seed=seed)
+
+    store = ArchitectureStore('population.hrs')
+    arrays = store[10]          # memory mapped RootArrays
+    print(store.metadata(10))   # {'seed': ...}
+"""
+import json
+import struct
+
+import numpy as np
+
+from hydroroot.root_arrays import RootArrays
+
+MAGIC = b'HYDROOT\x00'
+VERSION = 1
+ALIGNMENT = 64
+
+_HEADER = struct.Struct('<8sII')
+_FOOTER = struct.Struct('<QQ')
+
+
+class StoreWriter(object):
+    """ Write architectures one after the other in a store file.
+
+    :Parameters:
+        - `filename` (str) - the file to create
+
+    The index is written by `close`, a StoreWriter is also a context manager.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.file.write(_HEADER.pack(MAGIC, VERSION, 0))
+        self.plants = []
+
+    def append(self, arrays, **metadata):
+        """ Write the RootArrays `arrays` with its metadata (JSON serializable values, e.g. seed=1)."""
+        columns = dict(parent=arrays.parent, edge_type=arrays.edge_type, vids=arrays.vids, order=arrays.order)
+        for name in arrays.PROPERTIES:
+            if arrays.get(name) is not None:
+                columns['property:' + name] = arrays.get(name)
+        for name, values in arrays.properties.items():
+            columns['property:' + name] = values
+
+        index = {}
+        for name, values in columns.items():
+            values = np.ascontiguousarray(values)
+            values = values.astype(values.dtype.newbyteorder('<'), copy=False)
+            self._align()
+            index[name] = [values.dtype.str, self.file.tell()]
+            self.file.write(values.tobytes())
+
+        self.plants.append(dict(nb_vertices=len(arrays), columns=index, metadata=metadata))
+
+    def close(self):
+        """ Write the index and close the file."""
+        if self.file is None:
+            return
+        index = json.dumps(dict(version=VERSION, plants=self.plants), default=_json_default).encode('utf-8')
+        offset = self.file.tell()
+        self.file.write(index)
+        self.file.write(_FOOTER.pack(offset, len(index)))
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _align(self):
+        padding = -self.file.tell() % ALIGNMENT
+        if padding:
+            self.file.write(b'\x00' * padding)
+
+
+def write_store(filename, arrays_list, metadata=None):
+    """ Write a list of RootArrays in a store file, with a list of metadata dict if any."""
+    with StoreWriter(filename) as writer:
+        for i, arrays in enumerate(arrays_list):
+            writer.append(arrays, **(metadata[i] if metadata else {}))
+
+
+class ArchitectureStore(object):
+    """ Read only access to the architectures of a store file.
+
+    The file is memory mapped, the arrays of the returned RootArrays are views on this map (only the
+    child_ptr and level_ptr arrays are computed in memory). A store may be sent to other processes,
+    which map the same file again.
+
+    :Parameters:
+        - `filename` (str) - a file written by StoreWriter or write_store
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._open()
+
+    def _open(self):
+        self.map = np.memmap(self.filename, dtype=np.uint8, mode='r')
+
+        magic, version, _ = _HEADER.unpack(self.map[:_HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise IOError('%s is not a hydroroot architecture store' % self.filename)
+        if version > VERSION:
+            raise IOError('%s: store version %d is not supported (version <= %d)' % (self.filename, version,
+                                                                                     VERSION))
+        self.version = version
+
+        offset, size = _FOOTER.unpack(self.map[-_FOOTER.size:].tobytes())
+        index = json.loads(self.map[offset:offset + size].tobytes().decode('utf-8'))
+        self.plants = index['plants']
+
+    def __getstate__(self):
+        return dict(filename=self.filename)
+
+    def __setstate__(self, state):
+        self.filename = state['filename']
+        self._open()
+
+    def __len__(self):
+        return len(self.plants)
+
+    def __getitem__(self, i):
+        return self.arrays(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.arrays(i)
+
+    def column(self, i, name):
+        """ Return the column `name` (e.g. 'parent', 'property:radius') of the plant `i` as a read only array."""
+        plant = self.plants[i]
+        dtype, offset = plant['columns'][name]
+        dtype = np.dtype(dtype)
+        n = plant['nb_vertices']
+        return self.map[offset:offset + n * dtype.itemsize].view(dtype)
+
+    def arrays(self, i):
+        """ Return the RootArrays of the plant `i`."""
+        names = self.plants[i]['columns']
+        properties = dict((name[len('property:'):], self.column(i, name)) for name in names
+                          if name.startswith('property:'))
+        return RootArrays(self.column(i, 'parent'), edge_type=self.column(i, 'edge_type'),
+                          vids=self.column(i, 'vids'), order=self.column(i, 'order'), **properties)
+
+    def metadata(self, i):
+        """ Return the metadata dict of the plant `i`."""
+        return self.plants[i]['metadata']
+
+    def nb_vertices(self, i):
+        return self.plants[i]['nb_vertices']
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError('%r is not JSON serializable' % (value,))
@@ -183,3 +183,53 @@ def test_reconstruct_from_aqua_data():
     max_total_length = real_total_length + n * segment_length
 
     assert real_total_length <= total_length <= max_total_length, "error on total length"
+
+def test_export_aqua_file():
+    """ The architecture read from an exported aqua file has the same topology, at any order."""
+    import io
+    import numpy as np
+    from hydroroot import radius
+    from hydroroot.generator import markov
+    from hydroroot.hydro_io import export_mtg_to_aqua_file
+    from hydroroot.root_arrays import RootArrays
+
+    def read(text):
+        df = pandas.read_csv(io.StringIO(text), sep = '\t', dtype = {'order': str})
+        df['db'] = df['distance_from_base_(mm)'] * 1.e-3
+        df['lr'] = df['lateral_root_length_(mm)'] * 1.e-3
+        return df
+
+    def export(g):
+        f = io.StringIO()
+        export_mtg_to_aqua_file(g, f)
+        return f.getvalue()
+
+    fn = 'data/test_reconstruct_from_aqua_data.txt'
+    df = pandas.read_csv(fn, sep = '\t', dtype = {'order': str})
+    df2 = read(export(mtg_from_aqua_data(read(open(fn).read()))))
+    assert list(df2.order) == list(df.order)
+    assert np.allclose(df2['distance_from_base_(mm)'], df['distance_from_base_(mm)'])
+    assert np.allclose(df2['lateral_root_length_(mm)'], df['lateral_root_length_(mm)'])
+
+    g = markov.markov_binary_tree(nb_vertices = 300, branching_delay = 20, nude_tip_length = 30, seed = 2)
+    g = radius.compute_length(g, 1.e-4)
+    text = export(g)
+    g2 = mtg_from_aqua_data(read(text))
+    arrays = RootArrays.from_mtg(g).compute_axes()
+    arrays2 = RootArrays.from_mtg(g2).compute_axes()
+    assert arrays.order.max() >= 3
+    assert sorted(arrays.axis_size()) == sorted(arrays2.axis_size())
+    assert (np.bincount(arrays.order) == np.bincount(arrays2.order)).all()
+    assert export(g2) == text
+
+def test_iter_architectures():
+    from hydroroot.hydro_io import iter_architectures, read_architecture
+
+    files = ['data/test_reconstruct_from_aqua_data.txt', 'data/170426-full-archi-ch2D1.txt',
+             'data/hydroroot-1ter.txt']
+    serial = dict(iter_architectures(files, processes = 1))
+    pool = dict(iter_architectures('data/*.txt', processes = 2, max_pending = 2))
+    assert set(files) <= set(pool)
+    for f in files:
+        assert (serial[f].parent == pool[f].parent).all()
+        assert len(serial[f]) == read_architecture(f).length.size
@@ -159,3 +159,569 @@ def check_length(g, length, segment_length):
 
     assert abs(_length-length) <= segment_length
 
+
+def test_array_flux():
+    length, axial, radial = data()
+    g, surface, volume, Keq, Jv_global = hydro(primary_length=0.09,
+                                               order_decrease_factor=0.7,
+                                               length_data=length,
+                                               axial_conductivity_data=axial,
+                                               radial_conductivity_data=radial,
+                                               seed=2)
+
+    for invert_model in (True, False):
+        g = flux.flux(g, Jv=0.1, psi_e=0.4, psi_base=0.1, invert_model=invert_model)
+        ref = dict((name, dict(g.property(name))) for name in ('Keq', 'psi_in', 'psi_out', 'j', 'J_out'))
+
+        f = flux.ArrayFlux(g, Jv=0.1, psi_e=0.4, psi_base=0.1, invert_model=invert_model)
+        f.run()
+        f.update_mtg()
+        for name in ref:
+            prop = g.property(name)
+            for vid in ref[name]:
+                closed(prop[vid] - ref[name][vid], eps=1e-12, txt="%s differs at vertex %d" % (name, vid))
+
+    closed(f.Keq[0] - Keq)
+
+def test_batch_flux():
+    from hydroroot.root_arrays import RootArrays
+
+    length, axial, radial = data()
+    g, surface, volume, Keq, Jv_global = hydro(primary_length=0.09,
+                                               order_decrease_factor=0.7,
+                                               length_data=length,
+                                               axial_conductivity_data=axial,
+                                               radial_conductivity_data=radial,
+                                               seed=2)
+    arrays = RootArrays.from_mtg(g)
+    K = arrays.as_array(g.property('K'))
+    k = arrays.as_array(g.property('k'))
+
+    axfold = [1., 0.5, 2., 1.]
+    radfold = [1., 1., 3., 0.1]
+    Keqs, Jvs = flux.batch_flux(arrays, K, k, axfold=axfold, radfold=radfold, psi_e=0.4, psi_base=0.1)
+    closed(Keqs[0] - Keq)
+    closed(Jvs[0] - Jv_global)
+
+    for i in range(len(axfold)):
+        f = flux.ArrayFlux(g, 0.1, 0.4, 0.1, True, k=k * radfold[i], K=K * axfold[i], arrays=arrays)
+        f.run()
+        closed(Keqs[i] - f.Keq[0])
+        closed(Jvs[i] - f.Jv_global)
+
+def test_sparse_flux():
+    import numpy as np
+    from hydroroot.root_arrays import RootArrays
+
+    length, axial, radial = data()
+    g, surface, volume, Keq, Jv_global = hydro(primary_length=0.09,
+                                               order_decrease_factor=0.7,
+                                               length_data=length,
+                                               axial_conductivity_data=axial,
+                                               radial_conductivity_data=radial,
+                                               seed=2)
+    arrays = RootArrays.from_mtg(g)
+    solver = flux.SparseFlux(arrays, g.property('K'), g.property('k'))
+
+    # same boundary conditions as hydroroot(), the direct solver is accurate to the round-off of the factorization
+    solver.solve(0.4, 0.1)
+    closed(solver.Jv - Jv_global, eps=1e-12)
+    j = solver.j
+    closed(j.sum() - Jv_global, eps=1e-12)
+
+    # several conditions with the same factorization
+    psi_in = solver.solve(np.column_stack((np.full(len(arrays), 0.4), np.full(len(arrays), 0.3))), [0.1, 0.2])
+    Jv = solver.Jv
+    for i, (psi_e, psi_base) in enumerate(((0.4, 0.1), (0.3, 0.2))):
+        f = flux.ArrayFlux(g, 0.1, psi_e, psi_base, True, k=solver.k, K=solver.K, arrays=arrays)
+        f.run()
+        assert np.abs(psi_in[:, i] - f.psi_in).max() < 1e-12
+        closed(Jv[i] - f.Jv_global, eps=1e-12)
+
+    # per vertex soil potential: the water is conserved at each vertex
+    psi_e = np.linspace(0.2, 0.5, len(arrays))
+    solver.solve(psi_e, 0.1)
+    J_children = np.bincount(arrays.parent[1:], weights=solver.J_out[1:], minlength=len(arrays))
+    assert np.abs(solver.J_out - solver.j - J_children).max() < 1e-12
+
+def shunt_reference(arrays, K, k, a, b, psi_e, psi_base):
+    """ Xylem potentials and output flux of the radial shunt network, assembled as a sparse matrix."""
+    import numpy as np
+    from scipy import sparse
+    from scipy.sparse.linalg import spsolve
+
+    n = len(arrays)
+    parent = arrays.parent[1:]
+    child = np.arange(1, n)
+    ak, bk = a * k, b * k
+    psi_e = np.broadcast_to(psi_e, (n,))
+
+    # water balance at the xylem of each vertex
+    diagonal = K + ak + np.bincount(parent, weights=K[1:] + bk[1:], minlength=n)
+    rhs = ak * psi_e + np.bincount(parent, weights=bk[1:] * psi_e[1:], minlength=n)
+    rhs[0] += K[0] * psi_base
+    rows = np.concatenate((np.arange(n), child, parent))
+    columns = np.concatenate((np.arange(n), parent, child))
+    matrix = sparse.csc_matrix((np.concatenate((diagonal, -K[1:], -K[1:])), (rows, columns)), shape=(n, n))
+    psi_in = spsolve(matrix, rhs)
+    Jv = K[0] * (psi_in[0] - psi_base) + bk[0] * (psi_e[0] - psi_base)
+    return psi_in, Jv
+
+def test_radial_shunt_flux():
+    import numpy as np
+    from hydroroot.root_arrays import RootArrays
+
+    length, axial, radial = data()
+    g, surface, volume, Keq, Jv_global = hydro(primary_length=0.09,
+                                               order_decrease_factor=0.7,
+                                               length_data=length,
+                                               axial_conductivity_data=axial,
+                                               radial_conductivity_data=radial,
+                                               seed=2)
+    arrays = RootArrays.from_mtg(g)
+    n = len(arrays)
+    K = arrays.as_array(g.property('K'))
+    k = arrays.as_array(g.property('k'))
+
+    # without shortcut, same solution as the classical model in both modes
+    for invert_model in (True, False):
+        f = flux.RadialShuntFlux(g=g, Jv=0.1, psi_e=0.4, psi_base=0.1, invert_model=invert_model, arrays=arrays)
+        f.run()
+        ref = flux.ArrayFlux(g, 0.1, 0.4, 0.1, invert_model, arrays=arrays)
+        ref.run()
+        assert np.abs(f.Keq - ref.Keq).max() < 1e-15
+        for name in ('psi_in', 'psi_out', 'j', 'J_out'):
+            assert np.abs(getattr(f, name) - getattr(ref, name)).max() < 1e-12, name
+        closed(f.Jv_global - Jv_global)
+
+    # per vertex factors and soil potential
+    rng = np.random.RandomState(0)
+    a = rng.uniform(0.5, 1., n)
+    b = rng.uniform(0., 0.5, n)
+    arrays.set('psi_e', np.linspace(0.2, 0.5, n))
+    f = flux.RadialShuntFlux(a, b, g=g, Jv=0.1, psi_e=None, psi_base=0.1, invert_model=True, arrays=arrays)
+    f.run()
+    psi_in, Jv = shunt_reference(arrays, K, k, a, b, f.psi_e, 0.1)
+    assert np.abs(f.psi_in - psi_in).max() < 1e-12
+    closed(f.J_out[0] - Jv, eps=1e-12)
+    closed(f.Jv_global - Jv, eps=1e-12)
+    J_children = np.bincount(arrays.parent[1:], weights=f.J_out[1:], minlength=n)
+    assert np.abs(f.J_out - f.j - J_children).max() < 1e-12
+
+    # direct model: same potentials, the output flux is distributed
+    f = flux.RadialShuntFlux(a, b, g=g, Jv=0.05, psi_e=None, psi_base=0.1, arrays=arrays)
+    f.run()
+    assert np.abs(f.psi_in - psi_in).max() < 1e-12
+    closed(f.J_out[0] - 0.05)
+    J_children = np.bincount(arrays.parent[1:], weights=f.J_out[1:], minlength=n)
+    assert np.abs(f.J_out - f.j - J_children)[np.diff(arrays.child_ptr) > 0].max() < 1e-12
+
+    # incremental update of the conductances along the paths to the base
+    f = flux.RadialShuntFlux(a, b, g=g, Jv=0.1, psi_e=None, psi_base=0.1, invert_model=True, arrays=arrays).run()
+    vertices = rng.randint(0, n, 20)
+    K2, k2 = K.copy(), k.copy()
+    K2[vertices] *= 3.
+    k2[vertices[:10]] *= 0.5
+    f.update(vertices, K=K2[vertices], k=k2[vertices])
+    ref = flux.RadialShuntFlux(a, b, g=g, Jv=0.1, psi_e=None, psi_base=0.1, invert_model=True, K=K2, k=k2,
+                               arrays=arrays).run()
+    closed(f.Jv_global - ref.Jv_global)
+    for name in ('Keq', 'alpha', 'beta', 'psi_in', 'J_out'):
+        assert np.abs(getattr(f, name) - getattr(ref, name)).max() < 1e-14 * np.abs(getattr(ref, name)).max(), name
+
+    # adjoint derivatives, centered finite differences
+    dJv_dK, dJv_dk = f.adjoint()
+
+    def shunt_Jv(K, k):
+        return flux.RadialShuntFlux(a, b, g=g, Jv=0.1, psi_e=None, psi_base=0.1, invert_model=True, K=K, k=k,
+                                    arrays=arrays).run().Jv_global
+
+    eps = 1e-3
+    for v in (0, 100, 5000, n - 1):
+        K3 = K2.copy(); K3[v] *= 1 - eps
+        K4 = K2.copy(); K4[v] *= 1 + eps
+        fd = (shunt_Jv(K4, k2) - shunt_Jv(K3, k2)) / (2 * eps * K2[v])
+        assert abs(fd - dJv_dK[v]) <= 1e-3 * abs(dJv_dK[v]), v
+        k3 = k2.copy(); k3[v] *= 1 - eps
+        k4 = k2.copy(); k4[v] *= 1 + eps
+        fd = (shunt_Jv(K2, k4) - shunt_Jv(K2, k3)) / (2 * eps * k2[v])
+        assert abs(fd - dJv_dk[v]) <= 1e-3 * abs(dJv_dk[v]), v
+
+    # uniform factors, population and MTG interfaces
+    Keqs, Jvs = flux.batch_flux(arrays, K, k, radfold=[1., 2.], psi_e=0.4, psi_base=0.1, a=0.8, b=0.2)
+    for i, radfold in enumerate((1., 2.)):
+        f = flux.RadialShuntFlux(0.8, 0.2, g=g, Jv=0.1, psi_e=0.4, psi_base=0.1, invert_model=True,
+                                 k=k * radfold, arrays=arrays)
+        f.run()
+        closed(Keqs[i] - f.Keq[0])
+        closed(Jvs[i] - f.J_out[0], eps=1e-12)
+
+    g = flux.flux(g, 0.1, 0.4, 0.1, True, shunt=True, a=0.8, b=0.2)
+    closed(g.property('J_out')[arrays.vids[0]] - Jvs[0], eps=1e-12)
+    assert len(g.property('alpha')) == n
+
+def test_incremental_flux():
+    import numpy as np
+    from hydroroot.root_arrays import RootArrays
+
+    length, axial, radial = data()
+    g, surface, volume, Keq, Jv_global = hydro(primary_length=0.09,
+                                               order_decrease_factor=0.7,
+                                               length_data=length,
+                                               axial_conductivity_data=axial,
+                                               radial_conductivity_data=radial,
+                                               seed=2)
+    arrays = RootArrays.from_mtg(g)
+    f = flux.ArrayFlux(g, 0.1, 0.4, 0.1, True, arrays=arrays).run()
+
+    np.random.seed(2)
+    vertices = np.random.randint(0, len(arrays), 20)
+    K = f.K.copy()
+    k = f.k.copy()
+    K[vertices] *= 3.
+    k[vertices[:10]] *= 0.5
+    f.update(vertices, K=K[vertices], k=k[vertices])
+
+    ref = flux.ArrayFlux(g, 0.1, 0.4, 0.1, True, K=K, k=k, arrays=arrays).run()
+    closed(f.Jv_global - ref.Jv_global)
+    for name in ('Keq', 'psi_in', 'psi_out', 'j', 'J_out'):
+        assert np.abs(getattr(f, name) - getattr(ref, name)).max() < 1e-14, name
+
+def test_adjoint():
+    import numpy as np
+    from hydroroot.root_arrays import RootArrays
+    from hydroroot import conductance
+    from hydroroot.length import fit_law
+
+    length, axial, radial = data()
+    g, surface, volume, Keq, Jv_global = hydro(primary_length=0.09,
+                                               order_decrease_factor=0.7,
+                                               length_data=length,
+                                               axial_conductivity_data=axial,
+                                               radial_conductivity_data=radial,
+                                               seed=2)
+    arrays = RootArrays.from_mtg(g)
+    f = flux.ArrayFlux(g, 0.1, 0.4, 0.1, True, arrays=arrays).run()
+    dJv_dK, dJv_dk = f.adjoint()
+
+    def Jv(K, k):
+        return flux.ArrayFlux(g, 0.1, 0.4, 0.1, True, K=K, k=k, arrays=arrays).run().Jv_global
+
+    # centered finite differences
+    eps = 1e-3
+    for v in (0, 100, 5000, len(arrays) - 1):
+        K1 = f.K.copy(); K1[v] *= 1 - eps
+        K2 = f.K.copy(); K2[v] *= 1 + eps
+        fd = (Jv(K2, f.k) - Jv(K1, f.k)) / (2 * eps * f.K[v])
+        assert abs(fd - dJv_dK[v]) <= 1e-3 * abs(dJv_dK[v]), v
+        k1 = f.k.copy(); k1[v] *= 1 - eps
+        k2 = f.k.copy(); k2[v] *= 1 + eps
+        fd = (Jv(f.K, k2) - Jv(f.K, k1)) / (2 * eps * f.k[v])
+        assert abs(fd - dJv_dk[v]) <= 1e-3 * abs(dJv_dk[v]), v
+
+    # derivative with respect to the axial conductance data
+    xa, ya = axial
+    dJv_dy = conductance.spline_gradient(xa, arrays.position, dJv_dK / arrays.length)
+    for i in range(len(ya)):
+        y1 = list(ya); y1[i] *= 1 - eps
+        y2 = list(ya); y2[i] *= 1 + eps
+        Jv1 = Jv(fit_law(xa, y1)(arrays.position) / arrays.length, f.k)
+        Jv2 = Jv(fit_law(xa, y2)(arrays.position) / arrays.length, f.k)
+        fd = (Jv2 - Jv1) / (2 * eps * ya[i])
+        assert abs(fd - dJv_dy[i]) <= 1e-5 * abs(dJv_dy[i]), i
+
+def test_cut_flux():
+    from hydroroot.root_arrays import RootArrays
+
+    length, axial, radial = data()
+    g, surface, volume, Keq, Jv_global = hydro(primary_length=0.09,
+                                               order_decrease_factor=0.7,
+                                               length_data=length,
+                                               axial_conductivity_data=axial,
+                                               radial_conductivity_data=radial,
+                                               seed=2)
+    arrays = RootArrays.from_mtg(g)
+    cut_lengths = [0.2, 0.08, 0.04, 0.0405, 0.01]
+    Keqs, Jvs = flux.cut_flux(arrays, g.property('K'), g.property('k'), cut_lengths, psi_e=0.4, psi_base=0.1)
+
+    closed(Keqs[0] - Keq)
+    for cut_length, _Keq in zip(cut_lengths, Keqs):
+        g_cut = flux.cut_and_set_conductance(g, cut_length, threshold=1e-4)
+        g_cut = flux.flux(g_cut, psi_e=0.4, psi_base=0.1, invert_model=True)
+        closed(g_cut.property('Keq')[1] - _Keq)
+
+def test_population():
+    import os
+    from hydroroot import conductance, population, radius
+    from hydroroot.init_parameter import Parameters
+    from hydroroot.length import fit_law
+
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+    parameter = Parameters()
+    parameter.archi['length_file'] = [os.path.join(data_dir, 'length_LR_order1_160615.csv'),
+                                      os.path.join(data_dir, 'length_LR_order2_160909.csv')]
+    parameter.archi['seed'] = [1, 2]
+    parameter.archi['primary_length'] = [0.03, 0.04]
+    parameter.output['axfold'] = [1., 2.]
+    parameter.output['radfold'] = [1., 0.5, 3.]
+    parameter.init_calculation()
+
+    df = population.run_population(parameter, processes=1)
+    assert len(df) == 2 * 2 * 2 * 3
+    df_pool = population.run_population(parameter, processes=2)
+    df_pool = df_pool.sort_values(['seed', 'primary_length (m)', 'axfold', 'radfold']).reset_index(drop=True)
+    df = df.sort_values(['seed', 'primary_length (m)', 'axfold', 'radfold']).reset_index(drop=True)
+    assert (df_pool.Keq == df.Keq).all()
+
+    # same result as the MTG flux for one architecture
+    archi = parameter.archi
+    g = population.generate_architecture(2, 0.04, archi['branching_delay'], archi['nude_length'], archi)
+    g = radius.ordered_radius(g, archi['ref_radius'], archi['order_decrease_factor'])
+    g = radius.compute_length(g, archi['segment_length'])
+    g = radius.compute_relative_position(g)
+    g = conductance.fit_property_from_spline(g, fit_law(*parameter.hydro['axial_conductance_data']),
+                                             'position', 'K_exp')
+    g = conductance.compute_K(g)
+    g = conductance.compute_k(g, parameter.hydro['k0'] * 3.)
+    g = flux.flux(g, psi_e=0.4, psi_base=0.101325, invert_model=True)
+    row = df[(df.seed == 2) & (df['primary_length (m)'] == 0.04) & (df.axfold == 1.) & (df.radfold == 3.)]
+    closed(row.Keq.values[0] - g.property('Keq')[1], eps=1e-12)
+
+def test_array_conductance():
+    import numpy as np
+    from hydroroot import conductance
+    from hydroroot.length import fit_law
+    from hydroroot.root_arrays import RootArrays
+
+    length, axial, radial = data()
+    g, surface, volume, Keq, Jv_global = hydro(primary_length=0.09,
+                                               order_decrease_factor=0.7,
+                                               length_data=length,
+                                               axial_conductivity_data=axial,
+                                               radial_conductivity_data=radial,
+                                               seed=2)
+    arrays = RootArrays.from_mtg(g)
+    conductances = conductance.ArrayConductance(arrays, fit_law(*axial), radial_law=fit_law(*radial))
+    K, k = conductances.compute()
+    assert (K == arrays.as_array(g.property('K'))).all()
+    assert (k == arrays.as_array(g.property('k'))).all()
+
+    # only the scale factors change
+    K2, k2 = conductances.compute(axfold=2., radfold=0.5)
+    g = conductance.compute_K(g, scale_factor=2.)
+    assert (K2 == arrays.as_array(g.property('K'))).all()
+    assert np.allclose(k2, 0.5 * k, rtol=1e-15, atol=0.)
+
+    conductances.set_radial_law(k0=300.)
+    g = conductance.compute_k(g, k0=300.)
+    assert (conductances.radial() == arrays.as_array(g.property('k'))).all()
+
+def test_soil_potential(tmpdir):
+    import numpy as np
+    import pytest
+    from hydroroot.root_arrays import RootArrays
+    from hydroroot.soil import DepthProfile, SoilField, SoilGrid, vertex_depth, vertex_position
+
+    length, axial, radial = data()
+    g, surface, volume, Keq, Jv_global = hydro(primary_length=0.09,
+                                               order_decrease_factor=0.7,
+                                               length_data=length,
+                                               axial_conductivity_data=axial,
+                                               radial_conductivity_data=radial,
+                                               seed=2)
+    arrays = RootArrays.from_mtg(g)
+    depth = vertex_depth(arrays)
+    # the primary root is vertical
+    arrays.compute_axes()
+    primary = arrays.axis_of(0)
+    assert np.abs(depth[primary] - np.cumsum(arrays.length[primary])).max() < 1e-12
+
+    # the fields define their stencil
+    with pytest.raises(TypeError):
+        SoilField(np.zeros(3))
+
+    profile = DepthProfile([0., 0.03, 0.1], [0.4, 0.3, 0.1])
+    psi_e = profile(depth)
+    assert np.abs(psi_e - np.interp(depth, profile.depth, profile.psi)).max() < 1e-15
+
+    # the same profile on a 3D grid stored on disk, the vertices in the plane x = y = 0
+    z = np.arange(0., 0.1 + 1e-9, 1e-3)
+    psi = np.broadcast_to(np.interp(z, profile.depth, profile.psi), (3, 2, len(z)))
+    filename = str(tmpdir.join('psi.npy'))
+    np.save(filename, psi)
+    grid = SoilGrid.load(filename, origin=(-1e-3, 0., 0.), spacing=1e-3)
+    positions = np.column_stack((np.zeros((len(arrays), 2)), depth))
+    assert np.abs(grid(positions) - psi_e).max() < 1e-12
+
+    # the coordinates of the straight axes, at the depth of vertex_depth, with the axis index of the caller
+    axis = arrays.axis
+    position = vertex_position(arrays, base=(0., 0., 0.))
+    assert arrays.axis is axis
+    assert np.abs(position[:, 2] - depth).max() < 1e-12
+    assert np.abs(position[primary, :2]).max() < 1e-15
+    step = position[1:] - position[arrays.parent[1:]]
+    assert np.abs(np.sqrt((step ** 2).sum(axis=1)) - arrays.length[1:]).max() < 1e-12
+    assert np.abs(grid(position) - psi_e).max() < 1e-12
+
+    # the per vertex potential of the array and MTG solvers
+    arrays.set('psi_e', psi_e)
+    f = flux.ArrayFlux(g, 0.1, None, 0.1, True, arrays=arrays)
+    f.run()
+    g.properties()['psi_e'] = arrays.to_property(psi_e)
+    ref = flux.Flux(g, 0.1, None, 0.1, True)
+    ref.run()
+    j = arrays.as_array(g.property('j'))
+    assert np.abs(f.j - j).max() < 1e-12
+
+    # several scenarios with one stencil
+    stencil = profile.stencil(depth)
+    scenarios = profile.interpolate(stencil, np.column_stack((profile.psi, 0.5 * profile.psi)))
+    assert np.abs(scenarios[:, 1] - 0.5 * psi_e).max() < 1e-15
+    solver = flux.SparseFlux(arrays, f.K, f.k)
+    psi_in = solver.solve(scenarios, 0.1)
+    # the radial shunt solver without shortcut is exact for a per vertex potential
+    exact = flux.RadialShuntFlux(g=g, Jv=0.1, psi_e=None, psi_base=0.1, invert_model=True, arrays=arrays)
+    exact.run()
+    assert np.abs(psi_in[:, 0] - exact.psi_in).max() < 1e-12
+
+def test_solute_flux():
+    import numpy as np
+    from hydroroot import radius
+    from hydroroot.conductance import ArrayConductance
+    from hydroroot.generator import markov
+    from hydroroot.length import fit_law
+    from hydroroot.root_arrays import RootArrays
+    from hydroroot.init_parameter import Parameters
+    from hydroroot.solute import SoluteFlux
+
+    length, axial, radial = data()
+    g, surface, volume, Keq, Jv_global = hydro(primary_length=0.09,
+                                               order_decrease_factor=0.7,
+                                               length_data=length,
+                                               axial_conductivity_data=axial,
+                                               radial_conductivity_data=radial,
+                                               seed=2)
+    arrays = RootArrays.from_mtg(g)
+    K = g.property('K')
+    k = g.property('k')
+    water = flux.SparseFlux(arrays, K, k)
+
+    # without solutes: the water transport alone
+    solver = SoluteFlux.from_parameters(arrays, K, k, Parameters())
+    psi_in = solver.solve(0.4, 0.1)
+    assert solver.iterations <= 1
+    assert np.abs(psi_in - water.solve(0.4, 0.1)).max() < 1e-12
+    closed(solver.Jv - Jv_global, eps=1e-12)
+    assert not solver.C.any()
+
+    # non-permeating solutes outside: an osmotic shift of psi_e
+    solver = SoluteFlux(arrays, K, k, Ce=20.)
+    psi_in = solver.solve(0.4, 0.1)
+    assert np.abs(psi_in - water.solve(0.4 - 20. * solver.RT, 0.1)).max() < 1e-12
+
+    # coupled transport: quadratic convergence and conservation of water and solutes
+    solver = SoluteFlux(arrays, K, k, J_s=100., P_s=0.1, Cse=10., Ce=5., Sigma=0.7)
+    solver.solve(0.4, 0.1)
+    assert solver.iterations < 10
+    assert max(solver.residuals[-1]) < 1e-12
+    closed(solver.j.sum() - solver.Jv, eps=1e-9 * solver.Jv)
+    closed(solver.js.sum() - solver.Js_out[0], eps=1e-9 * solver.Js_out[0])
+    assert (solver.C > 0.).all()
+
+    # warm start from the previous solution
+    iterations = solver.iterations
+    solver.solve(0.399, 0.1)
+    assert solver.iterations < iterations
+    assert max(solver.residuals[-1]) < 1e-12
+
+    # no water flow without solutes, psi_e = psi_base and P_s = 0: only the pumped solutes draw the water
+    solver = SoluteFlux(arrays, K, k, J_s=100., P_s=0.)
+    solver.solve(0.1, 0.1)
+    assert solver.iterations < 10
+    assert max(solver.residuals[-1]) < 1e-12
+    assert solver.Jv > 0. and (solver.C > 0.).all()
+    closed(solver.js.sum() - solver.Js_out[0], eps=1e-9 * solver.Js_out[0])
+
+    # the factorization of the Jacobian has no fill-in: O(n) on larger architectures
+    for nb_vertices in (200, 400):
+        arrays = markov.markov_arrays(nb_vertices=nb_vertices, nude_tip_length=0, order_max=2, seed=2)
+        arrays.set('length', 1e-4)
+        radius.ordered_radius_arrays(arrays, ref_radius=1e-4, order_decrease_factor=0.7)
+        radius.relative_position(arrays)
+        K, k = ArrayConductance(arrays, fit_law(*axial), k0=300.).compute()
+        solver = SoluteFlux(arrays, K, k, J_s=100., P_s=0.1, Cse=10., Ce=5., Sigma=0.7)
+        solver.solve(0.4, 0.1)
+        lu = solver.factorize(solver.psi_in, solver.C, 0.1)
+        nnz = solver.jacobian(solver.psi_in, solver.C, 0.1).nnz
+        assert (lu.perm_r == np.arange(2 * len(arrays))).all()
+        assert lu.L.nnz + lu.U.nnz < 1.5 * nnz < 15 * len(arrays)
+
+def test_growth():
+    import numpy as np
+    from hydroroot import radius
+    from hydroroot.conductance import ArrayConductance
+    from hydroroot.growth import GrowingRoot
+    from hydroroot.length import fit_law
+
+    length, axial, radial = data()
+    law = fit_law(*axial)
+    root = GrowingRoot(law, k0=300., primary_length=0.05, growth_rate=[2e-3, 1e-3], branching_delay=1e-3,
+                       nude_length=5e-3, length_law=lambda x: 30, seed=2, capacity=16)
+    for day in range(45):
+        root.step()
+    assert root.history[-1]['nb_vertices'] == len(root) > 500
+    # the capacity is at least doubled at each reallocation
+    assert root.vertices.capacity >= len(root)
+    assert 0 < root.vertices.reallocations <= np.log2(len(root) / 16.) + 1
+    # the growth is over and the laterals close to the tips have emerged
+    assert (root.axes.size == root.axes.max_size).all()
+    assert not len(root._pending['axis'])
+    # the laterals have stopped growing, their subtrees are not updated any more
+    assert root.history[-1]['nb_updated'] < len(root)
+
+    # same positions, conductances and Keq as the architecture computed at once
+    arrays = root.to_arrays()
+    position = arrays.position.copy()
+    radius.relative_position(arrays)
+    assert np.abs(position - arrays.position).max() < 1e-15
+    K, k = ArrayConductance(arrays, law, k0=300.).compute()
+    assert np.abs(K - arrays.get('K')).max() < 1e-12 * K.max()
+    assert np.abs(k - arrays.get('k')).max() < 1e-12 * k.max()
+
+    f = flux.ArrayFlux(None, 0.1, 0.4, 0.101325, True, arrays=arrays)
+    f.run()
+    assert np.abs(f.Keq - arrays.get('Keq')).max() < 1e-12 * f.Keq[0]
+    closed(root.Jv - f.Jv_global)
+
+def test_compressed_flux():
+    import numpy as np
+    from hydroroot.compress import CompressedFlux
+    from hydroroot.root_arrays import RootArrays
+
+    length, axial, radial = data()
+    g, surface, volume, Keq, Jv_global = hydro(primary_length=0.09,
+                                               order_decrease_factor=0.7,
+                                               length_data=length,
+                                               axial_conductivity_data=axial,
+                                               radial_conductivity_data=radial,
+                                               seed=2)
+    arrays = RootArrays.from_mtg(g)
+    solver = CompressedFlux(arrays, g.property('K'), g.property('k'))
+    # one chain per branching point
+    assert len(solver.chains) == 1 + (np.diff(arrays.child_ptr)[arrays.parent[1:]] > 1).sum() < len(arrays) / 10
+
+    closed(solver.solve(0.4, 0.1) - Jv_global)
+
+    f = flux.ArrayFlux(g, 0.1, 0.4, 0.1, True, k=solver.k, K=solver.K, arrays=arrays)
+    f.run()
+    solver.expand()
+    for name in ('Keq', 'psi_in', 'psi_out', 'j', 'J_out'):
+        expected = getattr(f, name)
+        assert np.abs(getattr(solver, name) - expected).max() < 1e-12 * np.abs(expected).max(), name
+
+    # expansion of some chains only
+    chains = [0, len(solver.chains) - 1]
+    solver.expand(chains)
+    expanded = np.isin(solver.chain, chains)
+    assert np.isnan(solver.psi_in[~expanded]).all()
+    assert np.abs(solver.psi_in[expanded] - f.psi_in[expanded]).max() < 1e-12
@@ -83,3 +83,68 @@ def length_law():
     length_law = length.fit_law(X, Y, ext=2)
 
     return length_law, X, Y
+
+def test_markov_arrays(n=600):
+    """ The vectorized generator is reproducible and equivalent to markov_binary_tree without variability."""
+    law = test_law()
+
+    a1 = markov.markov_arrays(nb_vertices=n, branching_variability=0.298, length_law=law, seed=2)
+    a2 = markov.markov_arrays(nb_vertices=n, branching_variability=0.298, length_law=law, seed=2)
+    assert (a1.parent == a2.parent).all()
+    assert (a1.order == a2.order).all()
+
+    for length_law in (None, law):
+        g = markov.markov_binary_tree(nb_vertices=n, branching_variability=0., length_law=length_law, seed=2)
+        arrays = markov.markov_arrays(nb_vertices=n, branching_variability=0., length_law=length_law, seed=2)
+        assert len(arrays) == g.nb_vertices(scale=g.max_scale())
+        check_mtg(arrays.to_mtg(), get_orders(g))
+
+
+def test_intercept(n=600):
+    from hydroroot import analysis
+
+    g = markov.markov_binary_tree(nb_vertices=n, branching_variability=0.1, branching_delay=20, seed=2)
+    index = analysis.InterceptIndex.from_mtg(g)
+    dists = [0., 1e-4, 0.0015, 0.01, 0.02, 0.03, 0.045, 0.0599, 0.06, 0.1]
+    for max_order in (None, 1, 2):
+        counts = analysis.intercept(g, dists, max_order=max_order, index=index)
+        assert counts == [analysis.nb_roots(g, l, max_order=max_order) for l in dists]
+
+    for l in dists:
+        assert sorted(index.segments(l)) == sorted(flux.segments_at_length(g, l))
+
+
+def test_histo_law():
+    import numpy as np
+    from hydroroot import law
+
+    rng = np.random.default_rng(1)
+    x = rng.random(300)
+    y = 100 * x + 20 * rng.random(300)
+    positions = np.arange(0, 1200, 3)
+    for uniform in (False, True, 'expo'):
+        histo = law.histo_relative_law(x, y, size=0.005, scale_x=0.1, uniform=uniform)
+
+        # the bins found by binary search are the ones of the linear scan
+        for p in positions.tolist():
+            i = 0
+            for i, x_min in enumerate(histo.X):
+                if p * histo.scale <= x_min:
+                    break
+            assert histo.index(p) == max(i - 1, 0)
+
+        lengths = histo.sample(np.repeat(positions, 50), rng).reshape(len(positions), 50)
+        index = histo.index(positions)
+        assert (lengths >= 0).all()
+        assert (lengths <= histo.max[index, np.newaxis] / histo.scale + 1e-9).all()
+        if uniform is False:
+            assert all(set(np.round(l * histo.scale, 12)) <= set(np.round(histo.values[i], 12))
+                       for l, i in zip(lengths, index))
+
+        # one position
+        length = histo.sample(600, rng)
+        assert np.ndim(length) == 0
+        assert 0 <= length <= histo.max[histo.index(600)] / histo.scale + 1e-9
+
+    g = markov.markov_arrays(nb_vertices=600, branching_delay=20, length_law=histo, seed=2)
+    assert len(g) > 600
@@ -0,0 +1,258 @@
+# Tests of the array representation of the architecture
+
+import numpy as np
+from openalea.mtg import algo
+
+from hydroroot import radius
+from hydroroot.generator import markov
+from hydroroot.root_arrays import RootArrays
+
+
+def architecture(n=600, seed=2):
+    g = markov.markov_binary_tree(nb_vertices=n, branching_variability=0.1, seed=seed)
+    g = radius.ordered_radius(g, ref_radius=1e-4, order_decrease_factor=0.7)
+    g = radius.compute_length(g, 1e-4)
+    g = radius.compute_relative_position(g)
+    return g
+
+
+# the traversals of the MTG replaced by the array implementations, the reference of the radius functions
+def cont_radius_mtg(g, r_base, r_tip):
+    r_base, r_tip = float(r_base), float(r_tip)
+
+    base = next(g.component_roots_iter(g.root))
+    base = g.node(base)
+    base.radius = r_base
+
+    _tips = dict((vid, g.order(vid)) for vid in g.vertices_iter(scale = g.max_scale()) if g.is_leaf(vid))
+    tips = {}
+    for tip,order in _tips.items():
+        tips.setdefault(order, []).append(tip)
+
+    max_order = max(tips)
+    for order in range(max_order+1):
+        for tip in tips[order]:
+            l = [g.node(vid) for vid in algo.axis(g,tip)]
+            n = len(l)
+            if n==1:  # only one segment in the lateral root - very young lateral
+                l[0].radius = r_tip
+            else :    # more than one segment in the lateral root
+                parent = l[0].parent()
+                r0 = parent.radius if parent else r_base
+                dr = (r0-r_tip)/(n-1)
+                for node in l:
+                    if node.radius==r0:  # keep the value of the base/junction radius for the first segment  of the lateral
+                        continue
+                    node.radius = node.parent().radius - dr  # decrease the radius from base to tip
+
+    return g
+
+
+def discont_radius_mtg(g, r_base, r_tip):
+    r_base, r_tip = float(r_base), float(r_tip)
+
+    base = next(g.component_roots_iter(g.root))
+    base = g.node(base)
+    base.radius = r_base
+
+    _tips = dict((vid, g.order(vid)) for vid in g.vertices_iter(scale = g.max_scale()) if not algo.sons(g,vid,EdgeType='<'))
+    tips = {}
+    for tip,order in _tips.items():
+        tips.setdefault(order, []).append(tip)
+
+    max_order = max(tips)
+
+    max_len = 0
+    for order in range(max_order+1):   #find the longest axis length among all axis
+        for tip in tips[order]:
+            max_len = max(max_len, len(list(algo.axis(g,tip))))
+    growth_rate = (r_base-r_tip)/(max_len-1)    #define growth rate according to radius extremities of the longest axis
+
+    # radius are computed from tips to bases according to growth rate extrapolated from absolute longest axis of the MTG
+    for order in range(max_order+1):
+        for tip in tips[order]:
+            node = g.node(tip)
+            node.radius = r_tip
+            while node and node.parent() and node.edge_type() != '+':
+                node.parent().radius = node.radius + growth_rate
+                node = node.parent()
+
+    return g
+
+
+def ordered_radius_mtg(g, ref_radius=1e-4, order_decrease_factor=0.5):
+    max_scale = g.max_scale()
+    ref_r, d_factor = float(ref_radius), float(order_decrease_factor)
+
+    orders = algo.orders(g,scale=max_scale)
+    max_order = max(orders)
+
+    radius_order = {}
+    for order in range(max_order+1):
+        radius_order[order] = ref_r*(d_factor**order)
+
+    g_radius = g.properties()['radius'] = {}
+    for vid, order in orders.items():
+        g_radius[vid] = radius_order[order]
+
+    return g
+
+
+def test_from_mtg():
+    g = architecture()
+    arrays = RootArrays.from_mtg(g)
+
+    assert len(arrays) == g.nb_vertices(scale=g.max_scale())
+    assert arrays.parent[0] == -1
+    assert (arrays.parent[1:] < np.arange(1, len(arrays))).all()
+
+    index = arrays.index()
+    for i, v in enumerate(arrays.vids):
+        pid = g.parent(v)
+        if pid is not None:
+            assert arrays.parent[i] == index[pid]
+        assert list(arrays.vids[arrays.children(i)]) == g.children(v)
+        assert arrays.edge_type[i] == (g.edge_type(v) or '<')
+
+    radius_ = g.property('radius')
+    assert all(radius_[v] == r for v, r in zip(arrays.vids, arrays.radius))
+
+
+def test_from_parent():
+    g = architecture()
+    arrays = RootArrays.from_mtg(g)
+
+    # the vertices in the MTG order are renumbered in breadth first order
+    vids = list(g.vertices(scale=g.max_scale()))
+    index = dict((v, i) for i, v in enumerate(vids))
+    parent = [index[g.parent(v)] if g.parent(v) is not None else -1 for v in vids]
+    edge_type = [g.edge_type(v) or '<' for v in vids]
+    length = [g.property('length')[v] for v in vids]
+
+    arrays2 = RootArrays.from_parent(parent, edge_type=edge_type, vids=vids, length=length)
+
+    assert (arrays2.vids == arrays.vids).all()
+    assert (arrays2.parent == arrays.parent).all()
+    assert (arrays2.order == arrays.order).all()
+    assert (arrays2.length == arrays.length).all()
+
+
+def test_to_mtg():
+    g = architecture()
+    arrays = RootArrays.from_mtg(g)
+    g2 = arrays.to_mtg()
+    arrays2 = RootArrays.from_mtg(g2)
+
+    assert len(g2) == len(g)
+    assert (arrays2.parent == arrays.parent).all()
+    assert (arrays2.edge_type == arrays.edge_type).all()
+    assert (arrays2.order == arrays.order).all()
+    assert np.allclose(arrays2.position, arrays.position)
+
+
+def test_cache(tmpdir):
+    from hydroroot.cache import ArchitectureCache
+
+    cache = ArchitectureCache(str(tmpdir), max_entries=2)
+    keys = [cache.key(seed=seed, primary_length=0.06, length_data=[np.arange(5.)]) for seed in (1, 2, 3)]
+    assert len(set(keys)) == 3
+    assert keys[0] == cache.key(length_data=[np.arange(5.)], primary_length=0.06, seed=1)
+    assert keys[0] != cache.key(seed=1, primary_length=0.06, length_data=[np.arange(5.) + 1])
+
+    calls = []
+
+    def create(seed):
+        calls.append(seed)
+        arrays = RootArrays.from_mtg(architecture(seed=seed), properties=('length', 'radius', 'position',
+                                                                          'relative_position'))
+        return arrays
+
+    arrays = cache.get_or_create(keys[0], lambda: create(1))
+    arrays2 = cache.get_or_create(keys[0], lambda: create(1))
+    assert calls == [1]
+    assert (cache.hits, cache.misses) == (1, 1)
+    for name in ('parent', 'vids', 'edge_type', 'order', 'radius', 'position'):
+        assert (getattr(arrays2, name) == getattr(arrays, name)).all()
+    assert (arrays2.get('relative_position') == arrays.get('relative_position')).all()
+
+    # the least recently used entry is removed
+    cache.get_or_create(keys[1], lambda: create(2))
+    cache.get(keys[0])
+    cache.get_or_create(keys[2], lambda: create(3))
+    assert len(cache) == 2
+    assert keys[0] in cache and keys[1] not in cache
+
+
+def test_relative_position():
+    from openalea.mtg import algo
+
+    g = architecture()
+    arrays = RootArrays.from_mtg(g).compute_axes()
+    index = arrays.index()
+
+    position = g.property('position')
+    relative_position = g.property('relative_position')
+    length = g.property('length')
+    axes = [v for v in g.vertices(scale=g.max_scale()) if g.parent(v) is None or g.edge_type(v) == '+']
+    assert len(axes) == len(arrays.axis_ptr) - 1
+    for v in axes:
+        axis = list(algo.local_axis(g, v))
+        assert list(arrays.vids[arrays.axis_of(arrays.axis[index[v]])]) == axis
+        for i, vid in enumerate(axis):
+            assert position[vid] == (len(axis) - 1 - i) * length[vid]
+            assert relative_position[vid] == (len(axis) - 1 - i) / float(max(1, len(axis) - 1))
+
+
+def test_radius_arrays():
+    # main axis of 5 vertices, lateral of 3 vertices on the second one
+    arrays = RootArrays([-1, 0, 1, 1, 2, 3, 4, 5], edge_type=list('<<<+<<<<'))
+    main, lateral = [0, 1, 2, 4, 6], [3, 5, 7]
+
+    radius.ordered_radius_arrays(arrays, ref_radius=1e-4, order_decrease_factor=0.5)
+    assert (arrays.radius[main] == 1e-4).all() and (arrays.radius[lateral] == 5e-5).all()
+
+    radius.discont_radius_arrays(arrays, r_base=0.5, r_tip=0.1)
+    assert np.allclose(arrays.radius[main], [0.5, 0.4, 0.3, 0.2, 0.1])
+    assert np.allclose(arrays.radius[lateral], [0.3, 0.2, 0.1])
+
+    arrays.radius = None
+    radius.cont_radius_arrays(arrays, r_base=0.5, r_tip=0.1)
+    assert np.allclose(arrays.radius[main], [0.5, 0.4, 0.3, 0.2, 0.1])
+    # the lateral starts one step below the radius of the bearing vertex
+    assert np.allclose(arrays.radius[lateral[:2]], [0.25, 0.1])
+
+    # same radius as the traversal of the MTG, on successive calls sharing the previous radius
+    g, reference = architecture(), architecture()
+    arrays = RootArrays.from_mtg(g)
+    for f, args in (('ordered_radius', (1e-4, 0.7)), ('discont_radius', (1e-4, 3e-5)),
+                    ('cont_radius', (1e-4, 3e-5)), ('cont_radius', (2e-4, 1e-5))):
+        globals()[f + '_mtg'](reference, *args)
+        getattr(radius, f)(g, *args)
+        assert g.property('radius') == reference.property('radius')
+        getattr(radius, f + '_arrays')(arrays, *args)
+        assert arrays.to_property(arrays.radius) == reference.property('radius')
+
+
+def test_store(tmpdir):
+    import pickle
+    from hydroroot.store import ArchitectureStore, write_store
+
+    plants = [RootArrays.from_mtg(architecture(seed=seed), properties=('length', 'radius', 'position',
+                                                                       'relative_position'))
+              for seed in (1, 2, 3)]
+    filename = str(tmpdir.join('plants.hrs'))
+    write_store(filename, plants, metadata=[dict(seed=seed) for seed in (1, 2, 3)])
+
+    store = ArchitectureStore(filename)
+    assert len(store) == 3
+    for i, arrays in enumerate(plants):
+        arrays2 = store[i]
+        assert store.metadata(i) == dict(seed=i + 1)
+        assert isinstance(arrays2.parent.base, np.memmap) or isinstance(arrays2.parent, np.memmap)
+        for name in ('parent', 'vids', 'edge_type', 'order', 'child_ptr', 'level_ptr', 'length', 'radius',
+                     'position'):
+            assert (getattr(arrays2, name) == getattr(arrays, name)).all()
+        assert (arrays2.get('relative_position') == arrays.get('relative_position')).all()
+
+    store2 = pickle.loads(pickle.dumps(store))
+    assert (store2[2].radius == plants[2].radius).all()
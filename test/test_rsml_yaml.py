@@ -96,6 +96,60 @@ def test_rsml():
 
     closed(diff, txt = 'Exported rsml from discrete MTG does not give same length, surface and volume than the original imported rsml.')
 
+def test_rsml_to_arrays():
+    # each axis is made of int(arc length / segment_length) segments, at least one, and with legacy each interval
+    # of the polylines
+    import numpy as np
+    from hydroroot.hydro_io import rsml_to_arrays
+
+    segment_length = 1.0e-4
+    g_c = rsml.rsml2mtg('data/arabidopsis-simple.rsml')
+    resolution = g_c.graph_properties()['metadata']['resolution'] * 1.0e-2 # cm to m
+    geometry = g_c.property('geometry')
+    intervals = [np.sqrt(np.sum(np.diff(np.array(geometry[a]), axis = 0)**2, axis = 1)) * resolution for a in geometry]
+
+    for legacy, nb_segments in ((False, [max(1, int(l.sum() / segment_length + 1e-6)) for l in intervals]),
+                                (True, [sum(max(1, int(l / segment_length)) for l in length) for length in intervals])):
+        arrays = rsml_to_arrays(g_c, segment_length = segment_length, resolution = resolution, legacy = legacy)
+        axis_size = arrays.compute_axes().axis_size()
+        axis_size[0] -= 1 # the base vertex
+        assert sorted(axis_size) == sorted(nb_segments)
+
+        g = import_rsml_to_discrete_mtg(g_c, segment_length = segment_length, resolution = resolution, legacy = legacy)
+        assert g.nb_vertices(scale = 1) == len(arrays)
+        assert max(g.property('order').values()) == arrays.order.max()
+
+def test_rsml_curved_parent(tmpdir):
+    # the primary root curves back toward the 1st point of the lateral: the scan of the distances stops on the
+    # first points, the nearest vertex is at the end of the primary root
+    import numpy as np
+    from hydroroot.hydro_io import rsml_to_arrays
+
+    primary = [(0., 0.), (0., 10.), (5., 15.), (10., 10.), (10., 0.)]
+    lateral = [(10.5, 1.), (15.5, 1.)]
+    points = lambda polyline: ''.join('<point x="%s" y="%s"/>' % p for p in polyline)
+    filename = str(tmpdir.join('curved.rsml'))
+    with open(filename, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?><rsml><metadata><version>1</version><unit>m</unit>'
+                '<resolution>1e-4</resolution><last-modified>2021-06-11T00:00:00</last-modified>'
+                '<software>hydroroot</software></metadata><scene><plant id="1" label="curved">'
+                '<root id="1" label="primary"><geometry><polyline>%s</polyline></geometry>'
+                '<root id="2" label="lateral"><geometry><polyline>%s</polyline></geometry></root>'
+                '</root></plant></scene></rsml>' % (points(primary), points(lateral)))
+    g_c = rsml.rsml2mtg(filename)
+
+    # one vertex per polyline unit, 34 along the primary root after the base vertex, 5 on the lateral
+    arrays = rsml_to_arrays(g_c, segment_length = 1e-4, resolution = 1e-4).compute_axes()
+    assert list(arrays.axis_size()) == [35, 5]
+    branch = arrays.parent[arrays.axis_of(1)[0]]
+    # the vertex at 33 units from the base, 0.5 unit from the 1st point of the lateral
+    assert arrays.axis_rank[branch] == 33
+
+    legacy = rsml_to_arrays(g_c, segment_length = 1e-4, resolution = 1e-4, legacy = True).compute_axes()
+    branch = legacy.parent[legacy.axis_of(1)[0]]
+    # the vertex at the 2nd point of the polyline, 10 units from the base
+    assert legacy.axis_rank[branch] == 10
+
 def test_yaml():
     # F. Bauget 2021-06-11: test yaml file reading
 